@@ -1,11 +1,17 @@
 #agent_coding.py
 
 from fastapi import FastAPI, Request, HTTPException
-import subprocess
+from fastapi.responses import JSONResponse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import requests
 import logging
 import time
 import re
-from typing import Dict, Any
+import threading
+from typing import Any, Dict, Optional
+
+from ollama_stream import OllamaError, OllamaStreamer, StalledGeneration, run_while_connected
 
 # Configure logging
 logging.basicConfig(
@@ -19,6 +25,16 @@ app = FastAPI(title="Coding Specialist Agent")
 # Constants
 MODEL_NAME = "codellama"
 PROCESS_TIMEOUT = 15  # seconds
+OLLAMA_URL = "http://localhost:11434"
+OLLAMA_REPLICAS = []  # further Ollama servers to retry on when a generation stalls
+STALL_TIMEOUT = 10  # seconds without a new token (including the first) before a generation counts as wedged
+LOAD_TIMEOUT = 60  # seconds allowed for the first token when the model has to be loaded first
+# Keep the model (and the KV state of SYSTEM_PROMPT) resident between requests
+KEEP_ALIVE = "30m"
+# Generations run in threads of their own, so up to this many run in parallel: as many
+# as the orchestrator's bulkhead for this agent can admit (its ADAPTIVE_MAX_LIMITS entry)
+MAX_CONCURRENT_GENERATIONS = 6
+generation_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_GENERATIONS, thread_name_prefix="generation")
 
 SYSTEM_PROMPT = (
     "You are an expert software engineer and programmer. "
@@ -40,18 +56,31 @@ DISCLAIMER_PATTERNS = [
     r"I don't have the ability.*?\."
 ]
 
+ollama = OllamaStreamer(
+    MODEL_NAME,
+    [OLLAMA_URL] + OLLAMA_REPLICAS,
+    keep_alive=KEEP_ALIVE,
+    stall_timeout=STALL_TIMEOUT,
+    load_timeout=LOAD_TIMEOUT,
+    name="CodingAgent",
+)
+
 
 def remove_disclaimers(text: str) -> str:
     cleaned_text = text
     for pattern in DISCLAIMER_PATTERNS:
         cleaned_text = re.sub(pattern, "", cleaned_text, flags=re.IGNORECASE | re.DOTALL)
-    cleaned_text = re.sub(r"\s+", " ", cleaned_text).strip()
+    cleaned_text = re.sub(r"(?<=\S)[ \t]+", " ", cleaned_text)
+    cleaned_text = re.sub(r"[ \t]+\n", "\n", cleaned_text)
+    cleaned_text = re.sub(r"\n{3,}", "\n\n", cleaned_text).strip()
     return cleaned_text
 
 
-def call_ollama(prompt: str) -> str:
+def call_ollama(prompt: str, cancelled: Optional[threading.Event] = None) -> str:
     """
     Call the Ollama model with a coding system prompt plus the user's input.
+
+    Stops early, returning "", once `cancelled` is set.
     """
     final_prompt = SYSTEM_PROMPT + f"Coding question or problem:\n{prompt}"
     
@@ -59,26 +88,33 @@ def call_ollama(prompt: str) -> str:
     start_time = time.time()
 
     try:
-        result = subprocess.run(
-            ["ollama", "run", MODEL_NAME, final_prompt],
-            capture_output=True,
-            text=True,
-            timeout=PROCESS_TIMEOUT
-        )
+        # SYSTEM_PROMPT is a constant prefix, so Ollama reuses its cached KV state and
+        # only evaluates the question tokens on a warm model
+        deadline = start_time + PROCESS_TIMEOUT
+        result = ollama.generate(final_prompt, deadline, should_pause=cancelled.is_set if cancelled else None)
 
         elapsed = time.time() - start_time
-        
-        if result.returncode != 0:
-            logger.error(f"[CodingAgent] Ollama error: {result.stderr}")
-            return "Error processing the coding query. Please try again."
-
-        logger.info(f"[CodingAgent] Query processed in {elapsed:.2f}s")
+        if not result["done"]:
+            logger.info(f"[CodingAgent] Abandoned after {elapsed:.2f}s: the caller disconnected")
+            return ""
+
+        logger.info(
+            f"[CodingAgent] Query processed in {elapsed:.2f}s "
+            f"(prompt eval: {result.get('prompt_eval_count', 0)} tokens in "
+            f"{result.get('prompt_eval_duration', 0) / 1e9:.2f}s)"
+        )
 
-        output = result.stdout.strip()
+        output = result.get("response", "").strip()
         output = remove_disclaimers(output)
         return output
 
-    except subprocess.TimeoutExpired:
+    except StalledGeneration:
+        logger.error("[CodingAgent] Generation stalled on every replica")
+        return "Error processing the coding query. Please try again."
+    except OllamaError as e:
+        logger.error(f"[CodingAgent] Ollama error: {e}")
+        return "Error processing the coding query. Please try again."
+    except requests.Timeout:
         logger.error(f"[CodingAgent] Timeout after {PROCESS_TIMEOUT}s")
         return "The coding analysis took too long. Try breaking the query into smaller parts."
     except Exception as e:
@@ -86,6 +122,61 @@ def call_ollama(prompt: str) -> str:
         return f"An unexpected error occurred: {str(e)}"
 
 
+# Warm-up: /ready reports "not ready" until the model is loaded and primed
+WARMUP_PROMPT = "Reply with the single word OK."
+WARMUP_TIMEOUT = 300  # seconds; a cold load takes far longer than PROCESS_TIMEOUT
+WARMUP_RETRY_DELAY = 10  # seconds
+
+warmup_state = {"ready": False, "model": MODEL_NAME}
+
+
+def prime_model() -> float:
+    """
+    Load the model and run the priming prompt. Returns the elapsed seconds.
+    """
+    start_time = time.time()
+    response = requests.post(
+        f"{OLLAMA_URL}/api/generate",
+        json={"model": MODEL_NAME, "prompt": SYSTEM_PROMPT + WARMUP_PROMPT, "stream": False, "keep_alive": KEEP_ALIVE},
+        timeout=WARMUP_TIMEOUT
+    )
+    response.raise_for_status()
+    return time.time() - start_time
+
+
+async def warm_up() -> None:
+    """
+    Prime the model, retrying until it succeeds.
+    """
+    while True:
+        try:
+            elapsed = await asyncio.get_event_loop().run_in_executor(None, prime_model)
+            warmup_state.pop("error", None)
+            warmup_state.update(ready=True, warmup_seconds=round(elapsed, 2))
+            logger.info(f"[CodingAgent] Warmed up '{MODEL_NAME}' in {elapsed:.2f}s")
+            return
+        except Exception as e:
+            warmup_state["error"] = str(e)
+            logger.warning(f"[CodingAgent] Warm-up failed, retrying in {WARMUP_RETRY_DELAY}s: {e}")
+            await asyncio.sleep(WARMUP_RETRY_DELAY)
+
+
+@app.on_event("startup")
+async def start_warm_up():
+    """
+    Warm up in the background so the server answers health checks meanwhile.
+    """
+    asyncio.create_task(warm_up())
+
+
+@app.get("/ready")
+def ready() -> JSONResponse:
+    """
+    Readiness probe: 200 once the model is warmed up, 503 before that.
+    """
+    return JSONResponse(status_code=200 if warmup_state["ready"] else 503, content=warmup_state)
+
+
 @app.post("/process")
 async def process_coding(request: Request) -> Dict[str, Any]:
     """
@@ -98,7 +189,11 @@ async def process_coding(request: Request) -> Dict[str, Any]:
             raise HTTPException(status_code=400, detail="Missing 'question' in request body")
 
         logger.info(f"[CodingAgent] Received question: {question[:100]}...")
-        answer = call_ollama(question)
+        # In a thread, so /ready and / are answered while the generation runs; it is
+        # abandoned if the orchestrator gives up on the call
+        answer = await run_while_connected(
+            request, generation_executor, lambda cancelled: call_ollama(question, cancelled)
+        )
         return {"answer": answer}
 
     except Exception as e:
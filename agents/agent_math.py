@@ -1,11 +1,17 @@
 # agent_math.py
 
 from fastapi import FastAPI, Request, HTTPException
-import subprocess
+from fastapi.responses import JSONResponse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import requests
 import logging
+import threading
 import time
 import re
-from typing import Dict, Any
+from typing import Any, Dict, Optional, Tuple
+
+from ollama_stream import OllamaError, OllamaStreamer, StalledGeneration, run_while_connected
 
 # Configure logging
 logging.basicConfig(
@@ -19,6 +25,19 @@ app = FastAPI(title="Math Specialist Agent")
 # Constants
 MODEL_NAME = "deepseek-r1"
 PROCESS_TIMEOUT = 90  # seconds
+OLLAMA_URL = "http://localhost:11434"
+OLLAMA_REPLICAS = []  # further Ollama servers to retry on when a generation stalls
+STALL_TIMEOUT = 20  # seconds without a new token (including the first) before a generation counts as wedged
+LOAD_TIMEOUT = 120  # seconds allowed for the first token when the model has to be loaded first
+# Keep the model (and the KV state of SYSTEM_PROMPT) resident between requests
+KEEP_ALIVE = "30m"
+# Generations run in threads of their own, so up to this many run in parallel: as many
+# as the orchestrator's bulkhead for this agent can admit (its ADAPTIVE_MAX_LIMITS entry)
+MAX_CONCURRENT_GENERATIONS = 2
+generation_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_GENERATIONS, thread_name_prefix="generation")
+# deepseek-r1's chat template for a single user turn. Prompts are rendered with it and
+# sent raw, so a paused generation resumes from exactly the text it stopped at
+PROMPT_TEMPLATE = "<｜User｜>{prompt}<｜Assistant｜>"
 
 # System prompt for math expertise
 SYSTEM_PROMPT = (
@@ -41,6 +60,29 @@ DISCLAIMER_PATTERNS = [
     r"I don't have the ability.*?\."
 ]
 
+ollama = OllamaStreamer(
+    MODEL_NAME,
+    [OLLAMA_URL] + OLLAMA_REPLICAS,
+    keep_alive=KEEP_ALIVE,
+    stall_timeout=STALL_TIMEOUT,
+    load_timeout=LOAD_TIMEOUT,
+    name="MathAgent",
+    template=PROMPT_TEMPLATE,
+)
+
+# Preemption: the orchestrator asks (POST /pause) for a running generation to be paused
+# when another call is waiting for the model. The partial output stays here, keyed by
+# the call's preempt_id, until the orchestrator sends the same id again to resume it;
+# partials not resumed within PAUSED_TTL are dropped.
+PAUSED_TTL = 600  # seconds
+MAX_PAUSED = 100
+
+preemption_lock = threading.Lock()
+# preempt_id -> whether a pause was requested, for the generations running now
+running: Dict[str, bool] = {}
+# preempt_id -> (time.time() when paused, partial output)
+paused: Dict[str, Tuple[float, str]] = {}
+
 
 def remove_disclaimers(text: str) -> str:
     """
@@ -50,52 +92,179 @@ def remove_disclaimers(text: str) -> str:
     for pattern in DISCLAIMER_PATTERNS:
         cleaned_text = re.sub(pattern, "", cleaned_text, flags=re.IGNORECASE | re.DOTALL)
     
-    # Reduce extra whitespace
-    cleaned_text = re.sub(r"\s+", " ", cleaned_text).strip()
+    # Reduce extra whitespace, keeping line breaks and indentation for code blocks
+    cleaned_text = re.sub(r"(?<=\S)[ \t]+", " ", cleaned_text)
+    cleaned_text = re.sub(r"[ \t]+\n", "\n", cleaned_text)
+    cleaned_text = re.sub(r"\n{3,}", "\n\n", cleaned_text).strip()
     return cleaned_text
 
 
-def call_ollama(prompt: str) -> str:
+def take_paused(preempt_id: str) -> str:
+    """
+    Remove and return the partial output paused under this id, or "" if there is none.
+    """
+    with preemption_lock:
+        now = time.time()
+        for expired in [key for key, (paused_at, _) in paused.items() if now - paused_at > PAUSED_TTL]:
+            del paused[expired]
+        _, partial = paused.pop(preempt_id, (0.0, ""))
+    return partial
+
+
+def pause_requested(preempt_id: str) -> bool:
+    with preemption_lock:
+        return running.get(preempt_id, False) and len(paused) < MAX_PAUSED
+
+
+def call_ollama(
+    prompt: str,
+    preempt_id: Optional[str] = None,
+    cancelled: Optional[threading.Event] = None,
+) -> Dict[str, Any]:
     """
     Call the Ollama model with the math system prompt plus the user's question.
+
+    Args:
+        prompt: The user's question
+        preempt_id: Lets the orchestrator pause the generation through /pause; a
+            generation paused under this id is resumed instead of started over
+        cancelled: Once set, the generation stops and its output is discarded
+
+    Returns:
+        {"answer": ..., "done": ...}; a paused generation (done=False) has no answer
+        yet, only the number of characters generated so far
     """
     final_prompt = SYSTEM_PROMPT + f"Mathematical problem or question:\n{prompt}"
 
     logger.info(f"[MathAgent] Invoking '{MODEL_NAME}' with math prompt.")
     start_time = time.time()
+    partial = ""
+    if preempt_id:
+        partial = take_paused(preempt_id)
+        with preemption_lock:
+            running[preempt_id] = False
+
+    def should_pause() -> bool:
+        return (cancelled is not None and cancelled.is_set()) or (preempt_id is not None and pause_requested(preempt_id))
 
     try:
-        result = subprocess.run(
-            ["ollama", "run", MODEL_NAME, final_prompt],
-            capture_output=True,
-            text=True,
-            timeout=PROCESS_TIMEOUT
-        )
+        # SYSTEM_PROMPT is a constant prefix, so Ollama reuses its cached KV state and
+        # only evaluates the question tokens on a warm model
+        deadline = start_time + PROCESS_TIMEOUT
+        result = ollama.generate(final_prompt, deadline, partial, should_pause)
 
         elapsed = time.time() - start_time
 
-        if result.returncode != 0:
-            logger.error(f"[MathAgent] Ollama error: {result.stderr}")
-            return "Error processing the mathematical query. Please try again."
-        
-        logger.info(f"[MathAgent] Query processed in {elapsed:.2f}s")
+        if not result["done"] and cancelled is not None and cancelled.is_set():
+            logger.info(f"[MathAgent] Abandoned after {elapsed:.2f}s: the caller disconnected")
+            return {"answer": "", "done": True}
+        if not result["done"]:
+            with preemption_lock:
+                paused[preempt_id] = (time.time(), result["response"])
+            logger.info(f"[MathAgent] Paused after {elapsed:.2f}s with {len(result['response'])} chars")
+            return {
+                "done": False,
+                "generated_chars": len(result["response"]),
+                "first_token_seconds": result["first_token_seconds"],
+            }
+
+        logger.info(
+            f"[MathAgent] Query processed in {elapsed:.2f}s "
+            f"(prompt eval: {result.get('prompt_eval_count', 0)} tokens in "
+            f"{result.get('prompt_eval_duration', 0) / 1e9:.2f}s)"
+        )
 
-        output = result.stdout.strip()
+        output = result.get("response", "").strip()
         output = remove_disclaimers(output)
-        return output
+        return {"answer": output, "done": True, "first_token_seconds": result["first_token_seconds"]}
     
-    except subprocess.TimeoutExpired:
+    except StalledGeneration:
+        logger.error("[MathAgent] Generation stalled on every replica")
+        return {"answer": "Error processing the mathematical query. Please try again."}
+    except OllamaError as e:
+        logger.error(f"[MathAgent] Ollama error: {e}")
+        return {"answer": "Error processing the mathematical query. Please try again."}
+    except requests.Timeout:
         logger.error(f"[MathAgent] Timeout after {PROCESS_TIMEOUT}s")
-        return "The mathematical computation took too long. Try simplifying the query."
+        return {"answer": "The mathematical computation took too long. Try simplifying the query."}
     except Exception as e:
         logger.exception("[MathAgent] Unexpected error calling Ollama.")
-        return f"An unexpected error occurred: {str(e)}"
+        return {"answer": f"An unexpected error occurred: {str(e)}"}
+    finally:
+        if preempt_id:
+            with preemption_lock:
+                running.pop(preempt_id, None)
+
+
+# Warm-up: /ready reports "not ready" until the model is loaded and primed
+WARMUP_PROMPT = "Reply with the single word OK."
+WARMUP_TIMEOUT = 300  # seconds; a cold load takes far longer than PROCESS_TIMEOUT
+WARMUP_RETRY_DELAY = 10  # seconds
+
+warmup_state = {"ready": False, "model": MODEL_NAME}
+
+
+def prime_model() -> float:
+    """
+    Load the model and run the priming prompt. Returns the elapsed seconds.
+    """
+    start_time = time.time()
+    response = requests.post(
+        f"{OLLAMA_URL}/api/generate",
+        json={
+            "model": MODEL_NAME,
+            "prompt": PROMPT_TEMPLATE.format(prompt=SYSTEM_PROMPT + WARMUP_PROMPT),
+            "raw": True,
+            "stream": False,
+            "keep_alive": KEEP_ALIVE,
+        },
+        timeout=WARMUP_TIMEOUT
+    )
+    response.raise_for_status()
+    return time.time() - start_time
+
+
+async def warm_up() -> None:
+    """
+    Prime the model, retrying until it succeeds.
+    """
+    while True:
+        try:
+            elapsed = await asyncio.get_event_loop().run_in_executor(None, prime_model)
+            warmup_state.pop("error", None)
+            warmup_state.update(ready=True, warmup_seconds=round(elapsed, 2))
+            logger.info(f"[MathAgent] Warmed up '{MODEL_NAME}' in {elapsed:.2f}s")
+            return
+        except Exception as e:
+            warmup_state["error"] = str(e)
+            logger.warning(f"[MathAgent] Warm-up failed, retrying in {WARMUP_RETRY_DELAY}s: {e}")
+            await asyncio.sleep(WARMUP_RETRY_DELAY)
+
+
+@app.on_event("startup")
+async def start_warm_up():
+    """
+    Warm up in the background so the server answers health checks meanwhile.
+    """
+    asyncio.create_task(warm_up())
+
+
+@app.get("/ready")
+def ready() -> JSONResponse:
+    """
+    Readiness probe: 200 once the model is warmed up, 503 before that.
+    """
+    return JSONResponse(status_code=200 if warmup_state["ready"] else 503, content=warmup_state)
 
 
 @app.post("/process")
 async def process_math(request: Request) -> Dict[str, Any]:
     """
     Process a math question from the orchestrator.
+
+    The orchestrator may send a "preempt_id" so it can pause the generation through
+    /pause; the paused call returns done=False and is resumed by sending the same
+    question and preempt_id again.
     """
     try:
         data = await request.json()
@@ -104,14 +273,31 @@ async def process_math(request: Request) -> Dict[str, Any]:
             raise HTTPException(status_code=400, detail="Missing 'question' in request body")
 
         logger.info(f"[MathAgent] Received question: {question[:100]}...")
-        answer = call_ollama(question)
-        return {"answer": answer}
+        # In a thread, so /pause requests are served while the generation runs; it is
+        # abandoned if the orchestrator gives up on the call
+        return await run_while_connected(
+            request, generation_executor, lambda cancelled: call_ollama(question, data.get("preempt_id"), cancelled)
+        )
 
     except Exception as e:
         logger.exception("[MathAgent] Error processing request.")
         return {"answer": f"Error processing the math request: {str(e)}"}
 
 
+@app.post("/pause")
+async def pause(request: Request) -> Dict[str, Any]:
+    """
+    Ask a running generation, by its preempt_id, to pause at its next token.
+    """
+    data = await request.json()
+    preempt_id = data.get("id")
+    with preemption_lock:
+        found = preempt_id in running
+        if found:
+            running[preempt_id] = True
+    return {"pausing": found}
+
+
 @app.get("/")
 def index() -> Dict[str, str]:
     """
@@ -0,0 +1,202 @@
+# ollama_stream.py
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+logger = logging.getLogger("ollama_stream")
+
+# Seconds between checks for a caller that has gone away during a generation
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+class OllamaError(Exception):
+    """
+    Raised when Ollama rejects or fails a generation.
+    """
+
+
+class StalledGeneration(OllamaError):
+    """
+    Raised when a generation stops producing tokens for longer than allowed.
+    """
+
+
+class OllamaStreamer:
+    """
+    Streams generations for one agent's model, failing over between Ollama servers.
+
+    The read timeout bounds the wait for each chunk, so a wedged model process is
+    noticed after `stall_timeout` seconds instead of at the agent's full timeout, and
+    the generation is retried on the next server in `replicas`.
+
+    Loading a model from disk can take far longer than a stall: before each call the
+    server's /api/ps is checked, and if the model is not resident the wait for each
+    chunk is `load_timeout` instead, and the load time does not count against the
+    call's deadline.
+
+    With a `template`, prompts are rendered here and sent raw. A paused generation can
+    then be resumed by sending exactly the same text followed by its partial output,
+    which the model continues as if it had never stopped, reusing the cached KV state.
+    The template must reproduce the model's own chat template, with a {prompt} field.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        replicas: List[str],
+        keep_alive: str,
+        stall_timeout: float,
+        load_timeout: float,
+        name: str,
+        template: Optional[str] = None,
+    ):
+        self.model = model
+        self.replicas = replicas
+        self.keep_alive = keep_alive
+        self.stall_timeout = stall_timeout
+        self.load_timeout = load_timeout
+        # Used in log lines, e.g. "MathAgent"
+        self.name = name
+        self.template = template
+
+    def is_resident(self, base_url: str) -> bool:
+        """
+        True if the server has the model loaded; assumed True if it cannot tell.
+        """
+        try:
+            response = requests.get(f"{base_url}/api/ps", timeout=2)
+            response.raise_for_status()
+            loaded = [entry.get("name", "") for entry in response.json().get("models", [])]
+        except (requests.RequestException, ValueError):
+            return True
+        return any(name == self.model or name.startswith(self.model + ":") for name in loaded)
+
+    def generate(
+        self,
+        prompt: str,
+        deadline: float,
+        partial: str = "",
+        should_pause: Optional[Callable[[], bool]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Run a generation on the first server that does not stall.
+
+        Args:
+            prompt: The full prompt, including the agent's system prompt
+            deadline: time.time() after which the call raises requests.Timeout
+            partial: Output of an earlier, paused run of this generation to resume from
+            should_pause: Checked after every token; True stops the generation there
+
+        Returns:
+            Ollama's final chunk with the full response, or once paused
+            {"response", "done": False} with the output so far
+
+        Raises:
+            StalledGeneration: every server stalled
+            OllamaError: Ollama rejected the generation
+            requests.Timeout: the deadline passed
+        """
+        for base_url in self.replicas:
+            try:
+                return self.stream(base_url, prompt, deadline, partial, should_pause)
+            except StalledGeneration as e:
+                logger.warning(f"[{self.name}] Generation stalled ({e}); trying the next replica")
+        raise StalledGeneration("stalled on every replica")
+
+    def stream(
+        self,
+        base_url: str,
+        prompt: str,
+        deadline: float,
+        partial: str = "",
+        should_pause: Optional[Callable[[], bool]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Stream a generation from one Ollama server and return its final chunk with the full response.
+
+        With `partial`, the generation resumes from that output instead of starting over.
+        Once `should_pause` returns True it stops at that token and returns done=False
+        with the output so far. The result's first_token_seconds includes re-evaluating
+        the prompt.
+        """
+        payload = {"model": self.model, "prompt": prompt, "stream": True, "keep_alive": self.keep_alive}
+        if self.template is not None:
+            # The partial output, <think> section included, follows the same rendered
+            # prompt as the first run, so the prompt and most of the output are still
+            # in the KV cache
+            payload.update(prompt=self.template.format(prompt=prompt) + partial, raw=True)
+        elif partial:
+            raise ValueError("Resuming a generation needs a template")
+
+        # requests applies one read timeout to every chunk, so a cold model gets the load
+        # allowance for the whole call; that only happens after the model was evicted
+        cold = not self.is_resident(base_url)
+        read_timeout = self.load_timeout if cold else self.stall_timeout
+        parts = [partial]
+        started = time.time()
+        first_token_seconds = None
+        try:
+            with requests.post(f"{base_url}/api/generate", json=payload, stream=True, timeout=(5, read_timeout)) as response:
+                if response.status_code != 200:
+                    raise OllamaError(response.text)
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise OllamaError(chunk["error"])
+                    if first_token_seconds is None:
+                        first_token_seconds = time.time() - started
+                        if cold:
+                            deadline += first_token_seconds
+                    parts.append(chunk.get("response", ""))
+                    if chunk.get("done"):
+                        chunk.update(response="".join(parts), first_token_seconds=first_token_seconds)
+                        return chunk
+                    if time.time() > deadline:
+                        raise requests.Timeout()
+                    if should_pause is not None and should_pause():
+                        # Leaving the block closes the stream, which stops the generation
+                        return {"response": "".join(parts), "done": False, "first_token_seconds": first_token_seconds}
+        except (requests.ConnectionError, requests.exceptions.ReadTimeout) as e:
+            raise StalledGeneration(f"{base_url}: {e}")
+        raise StalledGeneration(f"{base_url}: stream ended before the generation finished")
+
+
+async def run_while_connected(request: Any, executor: Executor, generate: Callable[[threading.Event], Any]) -> Any:
+    """
+    Run a blocking generation in `executor` for as long as the HTTP caller is connected.
+
+    The orchestrator closes the connection when it gives up on a call (a losing hedge,
+    a deadline, a client that left). `generate` is passed an event that is then set,
+    and should stop at its next token, e.g. by passing `cancelled.is_set` to
+    OllamaStreamer.generate as should_pause, so the model is freed for live calls.
+
+    Args:
+        request: The Starlette request being answered
+        executor: Where to run the generation
+        generate: Called with the cancellation event; returns the response
+
+    Returns:
+        What `generate` returned
+    """
+    cancelled = threading.Event()
+    future = asyncio.get_event_loop().run_in_executor(executor, generate, cancelled)
+    try:
+        while True:
+            done, _ = await asyncio.wait({future}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return future.result()
+            if await request.is_disconnected():
+                cancelled.set()
+                return await future
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
@@ -111,6 +111,35 @@ function formatMessageText(text) {
   return text;
 }
 
+// Add thumbs-up/down buttons that report the answer's quality to the orchestrator
+function appendFeedbackButtons(messageDiv, requestId) {
+  if (!requestId) return;
+  
+  const feedbackDiv = document.createElement('div');
+  feedbackDiv.classList.add('message-feedback');
+  
+  [['up', '👍'], ['down', '👎']].forEach(([rating, icon]) => {
+    const button = document.createElement('button');
+    button.classList.add('feedback-button');
+    button.textContent = icon;
+    button.setAttribute('title', rating === 'up' ? 'Good answer' : 'Bad answer');
+    button.addEventListener('click', () => {
+      fetch('http://localhost:8000/feedback', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ request_id: requestId, rating: rating })
+      }).catch(err => console.error('Feedback error:', err));
+      
+      // One vote per answer
+      feedbackDiv.querySelectorAll('button').forEach(b => b.disabled = true);
+      button.classList.add('selected');
+    });
+    feedbackDiv.appendChild(button);
+  });
+  
+  messageDiv.querySelector('.message-content').appendChild(feedbackDiv);
+}
+
 // Add a system message (like "thinking...")
 function appendSystemMessage(text, isDebug = false) {
   // Remove any typing bubbles when showing a system message
@@ -178,6 +207,8 @@ sendButton.addEventListener('click', function() {
   // Keep track of active agents/experts
   const activeAgents = new Set(['orchestrator']);
   let currentThinkingAgent = 'orchestrator';
+  let requestId = null;
+  let queueMessage = null;
   
   eventSource.onmessage = function(event) {
     let data = event.data;
@@ -193,7 +224,27 @@ sendButton.addEventListener('click', function() {
       
       // Check for routing/thinking information
       if (jsonData.status) {
-        if (jsonData.status === 'routing' && jsonData.target) {
+        if (jsonData.status === 'request' && jsonData.request_id) {
+          // Remember the request ID so the answer can be rated
+          requestId = jsonData.request_id;
+          return;
+        }
+        else if (jsonData.status === 'queued') {
+          // The expert is busy; show (and keep updating) the place in its queue
+          const text = `Waiting for ${jsonData.pool}: position ${jsonData.position}, about ${Math.ceil(jsonData.eta)}s`;
+          if (queueMessage) {
+            queueMessage.textContent = text;
+          } else {
+            queueMessage = appendSystemMessage(text);
+            showTypingBubble(currentThinkingAgent);
+          }
+          return;
+        }
+        else if (jsonData.status === 'degraded') {
+          // The server skipped a step to save capacity; nothing to show
+          return;
+        }
+        else if (jsonData.status === 'routing' && jsonData.target) {
           // Orchestrator is routing to a specific expert
           currentThinkingAgent = jsonData.target;
           activeAgents.add(currentThinkingAgent);
@@ -229,7 +280,8 @@ sendButton.addEventListener('click', function() {
         if (cleanContent.startsWith('data:')) {
           cleanContent = cleanContent.substring(5).trim();
         }
-        appendMessage('assistant', cleanContent);
+        const messageDiv = appendMessage('assistant', cleanContent);
+        appendFeedbackButtons(messageDiv, requestId);
       } 
       else if (jsonData.role && jsonData.content) {
         // Handle messages with role and content structure
@@ -332,7 +384,10 @@ sendButton.addEventListener('click', function() {
           if (parts.length > 1) {
             const content = parts.slice(1).join(prefix).trim();
             const role = prefix.replace(':', '');
-            appendMessage(role, content);
+            const messageDiv = appendMessage(role, content);
+            if (role.startsWith('agent_')) {
+              appendFeedbackButtons(messageDiv, requestId);
+            }
             break;
           }
         }
@@ -0,0 +1,147 @@
+# adaptive_timeout.py
+
+import math
+import threading
+from typing import Dict, Optional
+
+
+class QuantileSketch:
+    """
+    Streaming quantile estimate in bounded memory (a DDSketch-style log histogram).
+
+    Values fall into buckets whose bounds grow geometrically, so any quantile is
+    returned within `relative_accuracy` of the true value. With 2% accuracy, 500
+    buckets cover latencies from a millisecond to beyond a day; past `max_buckets`
+    the lowest buckets are merged, which only costs accuracy at the fast end.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.02, max_buckets: int = 500, min_value: float = 1e-3):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.min_value = min_value
+        self.buckets: Dict[int, float] = {}
+        self.count = 0.0
+
+    def add(self, value: float, weight: float = 1.0) -> None:
+        key = math.ceil(math.log(max(value, self.min_value)) / self.log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0.0) + weight
+        self.count += weight
+
+        if len(self.buckets) > self.max_buckets:
+            lowest, second = sorted(self.buckets)[:2]
+            self.buckets[second] += self.buckets.pop(lowest)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count <= 0:
+            return None
+        rank = q * self.count
+        seen = 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen >= rank:
+                # Midpoint of the bucket (gamma^(key-1), gamma^key]
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def decay(self, factor: float) -> None:
+        """
+        Down-weight all samples so the sketch follows changes in the workload.
+        """
+        for key in list(self.buckets):
+            self.buckets[key] *= factor
+        self.count *= factor
+
+
+class AdaptiveTimeout:
+    """
+    Timeouts for one agent or model, learned from its latency distribution.
+
+    Latencies are recorded per unit of input size, `latency / (1 + chars / length_scale)`,
+    so a long question gets a proportionally longer timeout. The timeout is the chosen
+    quantile of that distribution times `multiplier`, scaled back up by the input size,
+    and clamped to [floor, hard_cap]. Until `min_samples` calls have been seen, the
+    hard cap (the old fixed timeout) is used as is.
+
+    A call that timed out is recorded at the timeout it hit. Its real latency was at
+    least that, so leaving it out would make the learned timeout shrink exactly when
+    calls start running long. Each retry of a call gets `retry_growth` times the
+    previous timeout, up to the hard cap, so a slow-but-healthy agent is not timed out
+    on every attempt.
+    """
+
+    def __init__(
+        self,
+        hard_cap: float,
+        quantile: float = 0.99,
+        multiplier: float = 1.5,
+        floor: float = 2.0,
+        min_samples: int = 20,
+        length_scale: int = 500,
+        decay_every: int = 1000,
+        retry_growth: float = 2.0,
+    ):
+        self.hard_cap = hard_cap
+        self.quantile = quantile
+        self.multiplier = multiplier
+        self.floor = floor
+        self.min_samples = min_samples
+        self.length_scale = length_scale
+        self.decay_every = decay_every
+        self.retry_growth = retry_growth
+        self.sketch = QuantileSketch()
+        self.samples = 0
+        self.timed_out = 0
+        self._lock = threading.Lock()
+
+    def _length_factor(self, input_chars: int) -> float:
+        return 1 + input_chars / self.length_scale
+
+    def observe(self, latency: float, input_chars: int) -> None:
+        """
+        Record the latency of a successful call.
+        """
+        with self._lock:
+            self._add(latency, input_chars)
+
+    def observe_timeout(self, timeout: float, input_chars: int) -> None:
+        """
+        Record a call that was cut off after `timeout` seconds.
+        """
+        with self._lock:
+            self._add(timeout, input_chars)
+            self.timed_out += 1
+
+    def _add(self, latency: float, input_chars: int) -> None:
+        self.sketch.add(latency / self._length_factor(input_chars))
+        self.samples += 1
+        if self.samples % self.decay_every == 0:
+            self.sketch.decay(0.5)
+
+    def percentile(self, q: float, input_chars: int = 0) -> Optional[float]:
+        """
+        Predicted q-quantile latency for an input of this size, or None before any samples.
+        """
+        with self._lock:
+            value = self.sketch.quantile(q)
+        return None if value is None else value * self._length_factor(input_chars)
+
+    def timeout(self, input_chars: int, attempt: int = 0) -> float:
+        """
+        Timeout for a call with this input size; `attempt` counts earlier tries of it.
+        """
+        if self.samples < self.min_samples:
+            return self.hard_cap
+        predicted = self.percentile(self.quantile, input_chars) * self.multiplier
+        return min(self.hard_cap, max(self.floor, predicted) * self.retry_growth ** attempt)
+
+    def snapshot(self) -> Dict:
+        p50, p99 = self.percentile(0.5), self.percentile(0.99)
+        return {
+            "samples": self.samples,
+            "timed_out": self.timed_out,
+            "p50": None if p50 is None else round(p50, 3),
+            "p99": None if p99 is None else round(p99, 3),
+            "timeout": round(self.timeout(0), 3),
+            "hard_cap": self.hard_cap,
+        }
@@ -1,13 +1,31 @@
 # ai_clients.py
 
 import asyncio
+import json
 import requests
 import logging
 import re
-from typing import Optional
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from metrics import metrics
 
 logger = logging.getLogger("ai_clients")
 
+
+class OllamaError(Exception):
+    """
+    Raised when the Ollama server rejects or fails a generation.
+    """
+
+
+class GenerationStalled(OllamaError):
+    """
+    Raised when a streamed generation stops producing tokens.
+    """
+
 class LocalLlamaClient:
     """
     Handles calls to a local Llama-based model via Ollama subprocess.
@@ -85,3 +103,194 @@ class RemoteAgentClient:
         except Exception as e:
             logger.exception(f"Error calling remote agent {self.agent_name}: {e}")
             return f"An error occurred: {str(e)}"
+
+
+class OllamaClient:
+    """
+    Streams generations from the Ollama HTTP API.
+
+    Unlike `ollama run`, the HTTP API sets keep_alive on every request, so the model and
+    its KV cache stay resident between calls. Ollama reuses cached KV state for the
+    longest token prefix shared with an earlier request, so a fixed prefix placed first
+    in every prompt is evaluated once and later calls only evaluate the variable suffix.
+
+    A watchdog aborts a generation whose first token takes longer than
+    `first_token_timeout` or whose tokens stop for `stall_timeout`, and retries it on
+    the next replica, so a wedged model process costs seconds rather than the full timeout.
+    When the first token is late, the server's /api/ps is checked first: if the model
+    is not resident it is still being loaded, and the wait is extended to `load_timeout`,
+    as is the call's overall timeout, which is otherwise sized for a resident model.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        base_url: str,
+        timeout: float = 15,
+        keep_alive=-1,
+        replicas: Optional[List[str]] = None,
+        first_token_timeout: Optional[float] = None,
+        stall_timeout: Optional[float] = None,
+        load_timeout: Optional[float] = None,
+    ):
+        self.model_name = model_name
+        self.base_url = base_url
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        # base_url first, then the other servers to fail over to
+        self.replicas = [base_url] + [url for url in (replicas or []) if url != base_url]
+        self.first_token_timeout = first_token_timeout
+        self.stall_timeout = stall_timeout
+        self.load_timeout = load_timeout
+        # Replica -> time.monotonic() of its last stall, so recently wedged ones are tried last
+        self._stalled_at: Dict[str, float] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def stream(self, prompt: str, prefix: str = "", base_url: Optional[str] = None) -> AsyncIterator[Dict]:
+        """
+        Yield the JSON chunks of a streamed generation. The last chunk has done=True
+        and carries Ollama's timing statistics.
+
+        Cancelling the consumer closes the connection, which stops the generation.
+        """
+        base_url = base_url or self.base_url
+        payload = {
+            "model": self.model_name,
+            "prompt": prefix + prompt,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+        }
+        async with self._get_session().post(f"{base_url}/api/generate", json=payload) as response:
+            if response.status != 200:
+                raise OllamaError(f"status {response.status}: {await response.text()}")
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise OllamaError(chunk["error"])
+                yield chunk
+
+    async def generate(self, prompt: str, prefix: str = "", timeout: Optional[float] = None) -> str:
+        """
+        Generate a complete response, returning an error message instead of raising.
+
+        Args:
+            prompt: The variable part of the prompt
+            prefix: Fixed text sent ahead of the prompt, e.g. a system prompt
+            timeout: Seconds to allow for this call; defaults to the client's timeout
+        """
+        logger.debug(f"OllamaClient calling model '{self.model_name}' with prompt (truncated): {prompt[:100]}...")
+
+        try:
+            return await self._collect(prompt, prefix, time.monotonic() + (timeout or self.timeout))
+        except asyncio.TimeoutError:
+            logger.error(f"Ollama generation with {self.model_name} timed out")
+            return "Processing took too long. Please try a simpler query."
+        except (OllamaError, aiohttp.ClientError) as e:
+            logger.error(f"Ollama error: {e}")
+            return "Error in LLM processing. Please try again."
+        except Exception as e:
+            logger.exception(f"Unexpected error in OllamaClient: {e}")
+            return f"Unexpected error in LLM processing: {str(e)}"
+
+    async def _collect(self, prompt: str, prefix: str, deadline: float) -> str:
+        replicas = sorted(self.replicas, key=lambda url: self._stalled_at.get(url, 0.0))
+        for attempt, base_url in enumerate(replicas):
+            try:
+                return await self._collect_from(base_url, prompt, prefix, deadline)
+            except GenerationStalled as e:
+                self._stalled_at[base_url] = time.monotonic()
+                if attempt == len(replicas) - 1:
+                    raise
+                logger.warning(f"{self.model_name} on {base_url} stalled ({e}); retrying on {replicas[attempt + 1]}")
+                metrics.incr("inference.stall_retries", model=self.model_name)
+
+    async def is_resident(self, base_url: str) -> bool:
+        """
+        True if the server has the model loaded; assumed True if it cannot tell.
+        """
+        try:
+            async with self._get_session().get(f"{base_url}/api/ps", timeout=aiohttp.ClientTimeout(total=2)) as response:
+                response.raise_for_status()
+                loaded = [entry.get("name", "") for entry in (await response.json()).get("models", [])]
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return True
+        return any(name == self.model_name or name.startswith(self.model_name + ":") for name in loaded)
+
+    async def _collect_from(self, base_url: str, prompt: str, prefix: str, deadline: float) -> str:
+        """
+        Collect one generation from one server, raising asyncio.TimeoutError at `deadline`
+        (time.monotonic()), or GenerationStalled when the watchdog fires first.
+        """
+        parts = []
+        chunks = self.stream(prompt, prefix, base_url).__aiter__()
+        started = time.monotonic()
+        next_chunk = None
+        try:
+            while True:
+                # Before the first token the wait covers prompt evaluation of a resident model
+                limit = self.stall_timeout if parts else self.first_token_timeout
+                next_chunk = asyncio.ensure_future(chunks.__anext__())
+                done, expired = await self._wait(next_chunk, limit, deadline)
+                if not done and not parts and self.load_timeout and not await self.is_resident(base_url):
+                    # Still loading the model, which is slow but not wedged; the call's
+                    # timeout assumed a resident model, so it gets the load time on top
+                    metrics.incr("inference.cold_loads", model=self.model_name)
+                    limit = self.load_timeout
+                    deadline += self.load_timeout
+                    done, expired = await self._wait(next_chunk, limit - (time.monotonic() - started), deadline)
+                if expired:
+                    raise asyncio.TimeoutError()
+                if not done:
+                    phase = "inter_token" if parts else "first_token"
+                    metrics.incr("inference.stalls", model=self.model_name, phase=phase)
+                    raise GenerationStalled(f"no {phase.replace('_', '-')} progress for {limit}s")
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    break
+
+                if not parts:
+                    metrics.observe("inference.first_token_seconds", time.monotonic() - started, model=self.model_name)
+                parts.append(chunk.get("response", ""))
+                if chunk.get("done"):
+                    self._record_stats(chunk)
+        finally:
+            if next_chunk is not None and not next_chunk.done():
+                next_chunk.cancel()
+                await asyncio.wait({next_chunk})
+            # Closes the connection if we stopped early, which stops the generation
+            await chunks.aclose()
+        return "".join(parts).strip()
+
+    @staticmethod
+    async def _wait(future: asyncio.Future, limit: Optional[float], deadline: float) -> Tuple[bool, bool]:
+        """
+        Wait up to `limit` seconds, but not past `deadline`.
+
+        Returns:
+            Tuple of (future is done, gave up because the deadline came first)
+        """
+        remaining = deadline - time.monotonic()
+        by_deadline = limit is None or remaining <= limit
+        done, _ = await asyncio.wait({future}, timeout=max(remaining if by_deadline else limit, 0))
+        return bool(done), not done and by_deadline
+
+    def _record_stats(self, chunk: Dict) -> None:
+        # Ollama reports durations in nanoseconds; prompt_eval_count excludes reused prefix tokens
+        model = self.model_name
+        metrics.observe("inference.prompt_eval_tokens", chunk.get("prompt_eval_count", 0), model=model)
+        metrics.observe("inference.prompt_eval_seconds", chunk.get("prompt_eval_duration", 0) / 1e9, model=model)
+        metrics.observe("inference.eval_tokens", chunk.get("eval_count", 0), model=model)
+        metrics.observe("inference.eval_seconds", chunk.get("eval_duration", 0) / 1e9, model=model)
+        metrics.observe("inference.load_seconds", chunk.get("load_duration", 0) / 1e9, model=model)
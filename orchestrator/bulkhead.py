@@ -0,0 +1,350 @@
+# bulkhead.py
+
+import asyncio
+import contextvars
+import ipaddress
+import logging
+import math
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from concurrency_limit import AimdLimit
+from metrics import metrics
+
+logger = logging.getLogger("bulkhead")
+
+# Priority lanes: answer-critical calls (routing, agent answers, evaluation) are admitted
+# before cosmetic ones (intro, follow-up, retry messages), and both before background
+# work (jobs, batches), which has no one waiting on it interactively
+CRITICAL = 0
+COSMETIC = 1
+BACKGROUND = 2
+LANE_NAMES = {CRITICAL: "critical", COSMETIC: "cosmetic", BACKGROUND: "background"}
+
+# Tickets waiting on behalf of the current request, so the SSE stream can report
+# queue position without threading a callback through every call
+queue_watch: contextvars.ContextVar[Optional[List["Ticket"]]] = contextvars.ContextVar("queue_watch", default=None)
+# (client id, weight) of the request the current task works for, used for fair queuing
+current_client: contextvars.ContextVar[Optional[Tuple[str, float]]] = contextvars.ContextVar(
+    "current_client", default=None
+)
+ANONYMOUS_CLIENT = ("anonymous", 1.0)
+
+
+def client_label(client_id: str) -> str:
+    """
+    Metric label for a client: hashed API keys and in-process names as they are, but any
+    client known only by its IP address as "anonymous", so the number of series stays
+    bounded however many addresses connect.
+    """
+    if client_id == "unknown":
+        return ANONYMOUS_CLIENT[0]
+    try:
+        ipaddress.ip_address(client_id)
+    except ValueError:
+        return client_id
+    return ANONYMOUS_CLIENT[0]
+
+# Lane that the current task's critical calls queue in; background work sets BACKGROUND
+current_lane: contextvars.ContextVar[int] = contextvars.ContextVar("current_lane", default=CRITICAL)
+
+
+class BulkheadFull(Exception):
+    """
+    Raised when a pool cannot admit a call before its wait limit.
+    """
+
+    def __init__(self, pool: str, reason: str, retry_after: float):
+        super().__init__(f"{pool} is at capacity ({reason})")
+        self.pool = pool
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """
+    A caller's place in a bulkhead. Use as an async context manager to hold a slot.
+    """
+
+    def __init__(self, bulkhead: "Bulkhead", deadline: float, cost: float, priority: int, client: Tuple[str, float]):
+        self.bulkhead = bulkhead
+        self.deadline = deadline
+        # Predicted seconds the call will hold its slot, used for shortest-job-first
+        self.cost = cost
+        self.priority = priority
+        self.client, self.weight = client
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.inflight = 0
+        # Set by the caller when the call failed without raising, e.g. an error string
+        self.dropped = False
+        # Set by the caller once the output is known: the seconds such a call normally
+        # takes, so the limiter can judge latency independently of answer length
+        self.expected: Optional[float] = None
+        self._admitted = asyncio.get_event_loop().create_future()
+
+    @property
+    def waiting(self) -> bool:
+        return self.admitted_at is None
+
+    @property
+    def position(self) -> int:
+        """
+        1-based place in the queue, or 0 once admitted.
+        """
+        if not self.waiting:
+            return 0
+        return self.bulkhead.ordered_queue().index(self) + 1
+
+    @property
+    def eta(self) -> float:
+        return self.bulkhead.estimate_wait(self.position)
+
+    async def __aenter__(self) -> "Ticket":
+        await self.bulkhead.acquire(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        failed = exc_type is not None and not issubclass(exc_type, (asyncio.CancelledError, BulkheadFull))
+        self.bulkhead.release(self, dropped=self.dropped or failed)
+
+
+class Bulkhead:
+    """
+    Concurrency pool for one model or agent, with a bounded wait queue.
+
+    Each pool admits at most `limit` calls at a time, so a slow model can only tie up
+    its own slots. Callers over the limit wait in order; a caller is rejected up front
+    when the queue is full or when the estimated wait already exceeds `max_wait`,
+    rather than discovering that after waiting.
+
+    With a limiter, the limit follows measured latency instead of staying fixed.
+
+    The "sjf" policy admits the waiting call with the smallest predicted cost first.
+    To keep long calls from starving, a call's cost is reduced by `aging_rate` seconds
+    for every second it has waited, so it eventually reaches the front.
+
+    Within either policy, critical calls always go ahead of cosmetic ones, and those
+    ahead of background ones. Cosmetic and background calls may not take the last
+    `reserved_slots` slots, so a critical call arriving at a pool busy with other work
+    still finds a slot, and only calls in its own lane or ahead of it count towards
+    `max_queue`. Background calls may wait up to `background_max_wait`.
+
+    Within a lane, waiting calls are shared fairly between clients (weighted fair
+    queuing): the client that has received the least slot time, as predicted cost
+    divided by its weight, goes next, and each client's own calls follow the policy.
+    A client that was idle starts level with the others instead of with saved credit.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        max_queue: int,
+        max_wait: float,
+        service_time: float,
+        limiter: Optional[AimdLimit] = None,
+        policy: str = "fifo",
+        aging_rate: float = 1.0,
+        reserved_slots: int = 0,
+        on_wait: Optional[Callable[[float, int], None]] = None,
+        background_max_wait: Optional[float] = None,
+    ):
+        if policy not in ("fifo", "sjf"):
+            raise ValueError(f"Unknown scheduling policy: {policy}")
+        self.name = name
+        self.policy = policy
+        self.aging_rate = aging_rate
+        self.reserved_slots = reserved_slots
+        # Called with (seconds waited, priority) for every admitted call
+        self.on_wait = on_wait
+        self.limiter = limiter
+        self.limit = limiter.limit if limiter is not None else limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.background_max_wait = max_wait if background_max_wait is None else background_max_wait
+        # Moving average of how long a call holds its slot, used for wait estimates
+        self.service_time = service_time
+        self.active = 0
+        self.queue: List[Ticket] = []
+        # Weighted slot time given to each client, and the level an idle client rejoins at
+        self._served: Dict[str, float] = {}
+        self._virtual_time = 0.0
+
+    def estimate_wait(self, position: int) -> float:
+        """
+        Estimated seconds until the caller at this queue position is admitted.
+        """
+        if position <= 0:
+            return 0.0
+        return math.ceil(position / max(self.limit, 1)) * self.service_time
+
+    def ticket(self, max_wait: Optional[float] = None, cost: Optional[float] = None, priority: int = CRITICAL) -> Ticket:
+        """
+        Take a place in the pool, or raise BulkheadFull if the wait would be too long.
+
+        Args:
+            max_wait: Longest acceptable wait for a slot; defaults to the pool's
+            cost: Predicted seconds the call will take; defaults to the pool's average
+            priority: CRITICAL or COSMETIC; critical calls go in the task's current_lane
+        """
+        if priority == CRITICAL:
+            priority = current_lane.get()
+        if max_wait is None:
+            max_wait = self.background_max_wait if priority == BACKGROUND else self.max_wait
+        cost = self.service_time if cost is None else cost
+        ticket = Ticket(self, time.monotonic() + max_wait, cost, priority, current_client.get() or ANONYMOUS_CLIENT)
+        if not self._can_start_now(priority):
+            if sum(1 for t in self.queue if t.priority <= priority) >= self.max_queue:
+                self._reject("queue_full", priority)
+            position = self._order(self.queue + [ticket], time.monotonic()).index(ticket) + 1
+            if self.estimate_wait(position) > max_wait:
+                self._reject("wait_too_long", priority)
+        return ticket
+
+    def ordered_queue(self) -> List[Ticket]:
+        """
+        Waiting tickets in the order they would be admitted.
+        """
+        return self._order(self.queue, time.monotonic())
+
+    def _order(self, tickets: List[Ticket], now: float) -> List[Ticket]:
+        ordered = []
+        for lane in sorted({ticket.priority for ticket in tickets}):
+            # Each client's calls in policy order
+            per_client: Dict[str, List[Ticket]] = {}
+            for ticket in sorted((t for t in tickets if t.priority == lane), key=lambda t: self._rank(t, now)):
+                per_client.setdefault(ticket.client, []).append(ticket)
+            served = {client: self._start_tag(client) for client in per_client}
+            # Repeatedly take the next call of the least-served client
+            while per_client:
+                client = min(per_client, key=lambda c: (served[c], self._rank(per_client[c][0], now)))
+                ticket = per_client[client].pop(0)
+                ordered.append(ticket)
+                served[client] += ticket.cost / ticket.weight
+                if not per_client[client]:
+                    del per_client[client]
+        return ordered
+
+    def should_preempt(self, ticket: Ticket) -> bool:
+        """
+        True if pausing `ticket`, which holds a slot here, would let a waiting call run
+        that is in the same lane or a more urgent one, and predicted to finish before the
+        rest of `ticket` would. A call past its predicted cost is left to finish.
+        """
+        if ticket.admitted_at is None:
+            return False
+        remaining = ticket.cost - (time.monotonic() - ticket.admitted_at)
+        return any(t.priority <= ticket.priority and t.cost < remaining for t in self.queue)
+
+    def oldest_wait(self, priority: int = CRITICAL) -> float:
+        """
+        Seconds the longest-waiting call of this lane has been queued, or 0.
+        """
+        now = time.monotonic()
+        return max((now - t.enqueued_at for t in self.queue if t.priority == priority), default=0.0)
+
+    def _start_tag(self, client: str) -> float:
+        return max(self._served.get(client, self._virtual_time), self._virtual_time)
+
+    def _rank(self, ticket: Ticket, now: float) -> float:
+        if self.policy == "fifo":
+            return ticket.enqueued_at - now
+        return ticket.cost - self.aging_rate * (now - ticket.enqueued_at)
+
+    def _has_slot(self, priority: int) -> bool:
+        if priority != CRITICAL:
+            # Never reserve the only slot, or other calls could not run at all
+            return self.active < max(self.limit - self.reserved_slots, 1)
+        return self.active < self.limit
+
+    def _can_start_now(self, priority: int) -> bool:
+        return self._has_slot(priority) and not any(ticket.priority <= priority for ticket in self.queue)
+
+    async def acquire(self, ticket: Ticket) -> None:
+        if self._can_start_now(ticket.priority):
+            self._admit(ticket)
+            return
+
+        self.queue.append(ticket)
+        watching = queue_watch.get()
+        if watching is not None:
+            watching.append(ticket)
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket._admitted), ticket.deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            if ticket.waiting:
+                self._remove(ticket)
+                self._reject("deadline", ticket.priority)
+        except asyncio.CancelledError:
+            if ticket.waiting:
+                self._remove(ticket)
+            else:
+                # Admitted just as the caller gave up; hand the slot on
+                self.release(ticket)
+            raise
+        finally:
+            if watching is not None and ticket in watching:
+                watching.remove(ticket)
+
+    def release(self, ticket: Ticket, dropped: bool = False) -> None:
+        if ticket.admitted_at is None:
+            return
+        held = time.monotonic() - ticket.admitted_at
+        ticket.admitted_at = None
+        self.service_time = 0.8 * self.service_time + 0.2 * held
+        self.active -= 1
+        metrics.incr("clients.slot_seconds", held, client=client_label(ticket.client), pool=self.name)
+        if self.limiter is not None:
+            self.limit = self.limiter.update(held, ticket.inflight, dropped, ticket.expected)
+            metrics.set_gauge("concurrency.limit", self.limit, pool=self.name)
+        self._dispatch()
+
+    def snapshot(self) -> Dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": len(self.queue),
+            "service_time": round(self.service_time, 3),
+        }
+
+    def _admit(self, ticket: Ticket) -> None:
+        ticket.admitted_at = time.monotonic()
+        self.active += 1
+        ticket.inflight = self.active
+        start = self._start_tag(ticket.client)
+        self._virtual_time = start
+        self._served[ticket.client] = start + ticket.cost / ticket.weight
+        if len(self._served) > 1000:
+            # Clients at or below the virtual time would rejoin there anyway
+            self._served = {c: v for c, v in self._served.items() if v > self._virtual_time}
+        waited = ticket.admitted_at - ticket.enqueued_at
+        metrics.observe("bulkhead.queue_seconds", waited, pool=self.name, lane=LANE_NAMES[ticket.priority])
+        if self.on_wait is not None:
+            self.on_wait(waited, ticket.priority)
+        if not ticket._admitted.done():
+            ticket._admitted.set_result(None)
+        self._update_gauges()
+
+    def _dispatch(self) -> None:
+        while True:
+            ticket = next((t for t in self.ordered_queue() if self._has_slot(t.priority)), None)
+            if ticket is None:
+                break
+            self.queue.remove(ticket)
+            self._admit(ticket)
+        self._update_gauges()
+
+    def _remove(self, ticket: Ticket) -> None:
+        self.queue.remove(ticket)
+        self._update_gauges()
+
+    def _reject(self, reason: str, priority: int) -> None:
+        metrics.incr("bulkhead.rejected", pool=self.name, reason=reason, lane=LANE_NAMES[priority])
+        logger.warning(f"Rejecting call to {self.name}: {reason} ({len(self.queue)} queued, {self.active} active)")
+        raise BulkheadFull(self.name, reason, retry_after=self.estimate_wait(len(self.queue) + 1))
+
+    def _update_gauges(self) -> None:
+        metrics.set_gauge("bulkhead.active", self.active, pool=self.name)
+        metrics.set_gauge("bulkhead.queued", len(self.queue), pool=self.name)
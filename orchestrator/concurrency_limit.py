@@ -0,0 +1,71 @@
+# concurrency_limit.py
+
+import logging
+from typing import Optional
+
+logger = logging.getLogger("concurrency_limit")
+
+
+class AimdLimit:
+    """
+    Additive-increase / multiplicative-decrease concurrency limit driven by latency.
+
+    Each finished call is a sample. Generation time depends mostly on how much was
+    generated, so a call's latency is first divided by the latency expected for its
+    actual prompt and output length; a long answer at normal speed scores the same as
+    a short one. The baseline is a slow moving average of that ratio, so it tracks what
+    "normal" looks like for the pool; a sample slower than `tolerance` times the
+    baseline (or a timeout or error) means the host is overloaded, e.g. swapping with
+    several models loaded, and the limit is cut by `backoff`. Otherwise, if the pool was
+    actually using its slots, the limit grows by one. Calls without an expected latency
+    (the predictor is still cold, or the call was split by preemption) can only grow
+    the limit. This is the AIMD variant of Netflix's concurrency-limits with a
+    gradient-style latency check.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int = 1,
+        max_limit: int = 8,
+        backoff: float = 0.9,
+        tolerance: float = 2.0,
+        baseline_smoothing: float = 0.05,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.baseline_smoothing = baseline_smoothing
+        self._limit = float(min(max(initial, min_limit), max_limit))
+        self.baseline = None
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def update(self, latency: float, inflight: int, dropped: bool = False, expected: Optional[float] = None) -> int:
+        """
+        Record one finished call and return the new limit.
+
+        Args:
+            latency: Seconds the call held its slot
+            inflight: Calls in flight when it started, including itself
+            dropped: True if the call timed out or failed
+            expected: Seconds a call with this prompt and output normally takes, if known
+        """
+        ratio = latency / expected if expected and not dropped else None
+        if ratio is not None and self.baseline is None:
+            self.baseline = ratio
+
+        if dropped or (ratio is not None and ratio > self.tolerance * self.baseline):
+            self._limit = max(self.min_limit, self._limit * self.backoff)
+        elif inflight * 2 >= self.limit:
+            # Only grow when the limit was actually being used, not while the pool idles
+            self._limit = min(self.max_limit, self._limit + 1.0 / max(self.limit, 1))
+
+        if ratio is not None:
+            # Slow samples still move the baseline, but only a little, so a sustained
+            # change in the workload is eventually accepted as the new normal
+            self.baseline += self.baseline_smoothing * (ratio - self.baseline)
+        return self.limit
@@ -0,0 +1,179 @@
+# fast_router.py
+
+import asyncio
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from feedback import FeedbackStore
+from semantic_cache import embed_text
+
+logger = logging.getLogger("fast_router")
+
+
+class FastRouter:
+    """
+    Online softmax classifier that routes a question from hashed text features.
+
+    It costs a few microseconds per query, so the orchestrator only falls back to the
+    LLM router when this model is untrained or unsure.
+    """
+
+    def __init__(self, labels: List[str], dim: int = 512, learning_rate: float = 0.5):
+        self.labels = labels
+        self.dim = dim
+        self.learning_rate = learning_rate
+        self.weights = np.zeros((len(labels), dim), dtype=np.float32)
+        self.bias = np.zeros(len(labels), dtype=np.float32)
+        self.examples = 0
+        self._lock = threading.Lock()
+
+    def predict_proba(self, question: str) -> Dict[str, float]:
+        """
+        Return the probability of each label for the question.
+        """
+        features = embed_text(question, self.dim)
+        with self._lock:
+            probs = self._softmax(features)
+        return {label: float(p) for label, p in zip(self.labels, probs)}
+
+    def predict(self, question: str) -> Tuple[str, float]:
+        """
+        Return the most likely label and its probability.
+        """
+        probs = self.predict_proba(question)
+        label = max(probs, key=probs.get)
+        return label, probs[label]
+
+    def update(self, question: str, label: str, reward: float = 1.0) -> None:
+        """
+        Take one gradient step towards (positive reward) or away from (negative reward) a label.
+        """
+        if label not in self.labels:
+            return
+
+        features = embed_text(question, self.dim)
+        index = self.labels.index(label)
+        if reward >= 0:
+            target = np.zeros(len(self.labels), dtype=np.float32)
+            target[index] = 1.0
+        else:
+            # A bad outcome only says the route was wrong, so spread the mass over the others
+            target = np.full(len(self.labels), 1.0 / (len(self.labels) - 1), dtype=np.float32)
+            target[index] = 0.0
+
+        step = self.learning_rate * abs(reward)
+        with self._lock:
+            error = target - self._softmax(features)
+            self.weights += step * np.outer(error, features)
+            self.bias += step * error
+            self.examples += 1
+
+    def _softmax(self, features: np.ndarray) -> np.ndarray:
+        logits = self.weights @ features + self.bias
+        logits -= logits.max()
+        exp = np.exp(logits)
+        return exp / exp.sum()
+
+    def save(self, path: str, offset: int) -> None:
+        with self._lock:
+            np.savez(path, weights=self.weights, bias=self.bias, examples=self.examples, offset=offset)
+
+    def load(self, path: str) -> int:
+        """
+        Load saved weights and return the feedback log offset they were trained up to.
+        """
+        with np.load(path) as state:
+            if state["weights"].shape != self.weights.shape:
+                logger.warning(f"Ignoring router state in {path}: shape mismatch")
+                return 0
+            with self._lock:
+                self.weights = np.array(state["weights"], dtype=np.float32)
+                self.bias = np.array(state["bias"], dtype=np.float32)
+                self.examples = int(state["examples"])
+            return int(state["offset"])
+
+
+class RoutingLearner:
+    """
+    Background task that tails the feedback log and trains the fast router.
+
+    Training signal, in decreasing order of trust:
+    - "user_feedback" records: thumbs up/down on the routed answer
+    - "llm_label" records: the LLM router's choice for a question (distillation)
+    - "evaluation" records: evaluate_response verdicts, down-weighted since a poor
+      answer can be the agent's fault rather than the route's
+    """
+
+    def __init__(
+        self,
+        router: FastRouter,
+        store: FeedbackStore,
+        state_path: str,
+        interval: float = 5.0,
+        evaluation_weight: float = 0.5,
+        max_pending: int = 10000,
+    ):
+        self.router = router
+        self.store = store
+        self.state_path = state_path
+        self.interval = interval
+        self.evaluation_weight = evaluation_weight
+        self.max_pending = max_pending
+        self.offset = 0
+        # request_id -> (question, route), kept to join outcomes onto their route
+        self._routes: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+
+        if os.path.exists(state_path):
+            self.offset = router.load(state_path)
+            logger.info(f"Loaded fast router state ({router.examples} examples, offset {self.offset})")
+
+    def step(self) -> int:
+        """
+        Apply all new feedback records. Returns the number of router updates made.
+        """
+        records, offset = self.store.read_from(self.offset)
+        updates = 0
+
+        for record in records:
+            record_type = record.get("type")
+            request_id = record.get("request_id")
+
+            if record_type == "route":
+                self._routes[request_id] = (record["question"], record["route"])
+                if len(self._routes) > self.max_pending:
+                    self._routes.popitem(last=False)
+            elif record_type == "llm_label":
+                self.router.update(record["question"], record["llm_route"])
+                updates += 1
+            elif record_type in ("evaluation", "user_feedback") and request_id in self._routes:
+                question, route = self._routes[request_id]
+                if record_type == "evaluation":
+                    reward = self.evaluation_weight if record.get("satisfactory") else -self.evaluation_weight
+                else:
+                    reward = 1.0 if record.get("rating") == "up" else -1.0
+                self.router.update(question, route, reward)
+                updates += 1
+
+        self.offset = offset
+        if updates:
+            self.router.save(self.state_path, self.offset)
+        return updates
+
+    async def run(self) -> None:
+        """
+        Poll the feedback log forever.
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                updates = await loop.run_in_executor(None, self.step)
+                if updates:
+                    logger.info(f"Fast router trained on {updates} new records ({self.router.examples} total)")
+            except Exception as e:
+                logger.exception(f"Error in routing learner: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,95 @@
+# feedback.py
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from utils import rotate_file
+
+logger = logging.getLogger("feedback")
+
+
+class FeedbackStore:
+    """
+    Append-only JSONL log of routing decisions and their outcomes.
+
+    Every record carries a "type" ("route", "evaluation", "outcome", "user_feedback" or
+    "latency"), the request_id it belongs to and a timestamp. Records are never rewritten,
+    so the router can always be retrained from scratch by replaying the file.
+
+    With `max_bytes`, the file is rotated to path.1, path.2, ... keeping `backups` old
+    files once it passes that size. Only for logs that are read with `read_recent`;
+    offsets from `read_from` do not survive a rotation.
+    """
+
+    def __init__(self, path: str, max_bytes: Optional[int] = None, backups: int = 1):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def append(self, record_type: str, request_id: Optional[str], **fields) -> None:
+        """
+        Append one record. Blocking; call it from an executor inside async code.
+        """
+        record = {"type": record_type, "request_id": request_id, "ts": time.time()}
+        record.update(fields)
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            if self.max_bytes is not None and os.path.getsize(self.path) >= self.max_bytes:
+                rotate_file(self.path, self.backups)
+                logger.info(f"Rotated feedback log {self.path}")
+
+    def read_recent(self, since: float) -> List[Dict]:
+        """
+        Read the records written at or after `since` (a time.time() value), oldest
+        first, from the rotated files and the current one.
+        """
+        records = []
+        paths = [f"{self.path}.{index}" for index in range(self.backups, 0, -1)] + [self.path]
+        for path in paths:
+            if os.path.exists(path):
+                records += [r for r in self._read_file(path) if r.get("ts", 0.0) >= since]
+        return records
+
+    def _read_file(self, path: str) -> List[Dict]:
+        records = []
+        with open(path, "rb") as f:
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(raw))
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping malformed feedback record in {path}")
+        return records
+
+    def read_from(self, offset: int) -> Tuple[List[Dict], int]:
+        """
+        Read the complete records written after a byte offset.
+
+        Returns:
+            Tuple of (records, new_offset). A partially written last line is left
+            for the next call.
+        """
+        if not os.path.exists(self.path):
+            return [], offset
+
+        records = []
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                offset += len(raw)
+                try:
+                    records.append(json.loads(raw))
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping malformed feedback record at offset {offset}")
+        return records, offset
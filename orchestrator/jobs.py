@@ -0,0 +1,172 @@
+# jobs.py
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("jobs")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    user_input TEXT NOT NULL,
+    client TEXT NOT NULL,
+    weight REAL NOT NULL,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    finished REAL,
+    route TEXT,
+    answer TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+class JobStore:
+    """
+    SQLite-backed queue of asynchronous query jobs and the events they produced.
+
+    Jobs move queued -> running -> done/failed. Each message the pipeline sends is kept
+    as a numbered event, so a client can poll the job or follow its event stream and
+    pick up where it left off. Methods are blocking; call them from an executor inside
+    async code.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def create(self, job_id: str, user_input: str, client: Tuple[str, float]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, user_input, client, weight, status, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, user_input, client[0], client[1], QUEUED, time.time()),
+            )
+
+    def set_status(self, job_id: str, status: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET status = ? WHERE id = ?", (status, job_id))
+
+    def finish(self, job_id: str, status: str, route: Optional[str], answer: Optional[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, route = ?, answer = ? WHERE id = ?",
+                (status, time.time(), route, answer, job_id),
+            )
+
+    def add_event(self, job_id: str, data: str) -> int:
+        """
+        Append an event to a job. Returns its sequence number, starting at 1.
+        """
+        with self._lock, self._conn:
+            (last,) = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM job_events WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT INTO job_events (job_id, seq, data) VALUES (?, ?, ?)", (job_id, last + 1, data)
+            )
+        return last + 1
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def events_since(self, job_id: str, seq: int) -> List[Tuple[int, str]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, seq)
+            ).fetchall()
+        return [(row["seq"], row["data"]) for row in rows]
+
+    def requeue_unfinished(self) -> List[Dict]:
+        """
+        Return jobs that were queued or running when the process stopped, all marked queued.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING))
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created", (QUEUED,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self, status: str) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()
+        return count
+
+    def purge(self, ttl: float) -> int:
+        """
+        Delete finished jobs older than `ttl` seconds, with their events. Returns the number deleted.
+        """
+        cutoff = time.time() - ttl
+        with self._lock, self._conn:
+            expired = [
+                row["id"] for row in self._conn.execute(
+                    "SELECT id FROM jobs WHERE finished IS NOT NULL AND finished < ?", (cutoff,)
+                )
+            ]
+            self._conn.executemany("DELETE FROM job_events WHERE job_id = ?", [(job_id,) for job_id in expired])
+            self._conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in expired])
+        if expired:
+            logger.info(f"Purged {len(expired)} expired jobs")
+        return len(expired)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def event_payload(sse_data: str) -> str:
+    """
+    Strip the SSE framing from a pipeline message: "data: {...}\\n\\n" -> "{...}".
+    """
+    if sse_data.startswith("data: "):
+        sse_data = sse_data[len("data: "):]
+    return sse_data.rstrip("\n")
+
+
+def decode_event(data: str):
+    """
+    Parse an event payload: status events are JSON, orchestrator messages plain text.
+    """
+    try:
+        return json.loads(data) if data.startswith("{") else data
+    except json.JSONDecodeError:
+        return data
+
+
+def job_view(job: Dict, events: List[Tuple[int, str]]) -> Dict:
+    """
+    Public representation of a job for GET /jobs/{id}.
+    """
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "created": job["created"],
+        "finished": job["finished"],
+        "route": job["route"],
+        "answer": job["answer"],
+        "events": [decode_event(data) for _, data in events],
+    }
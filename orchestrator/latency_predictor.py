@@ -0,0 +1,106 @@
+# latency_predictor.py
+
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from feedback import FeedbackStore
+
+logger = logging.getLogger("latency_predictor")
+
+
+class OnlineLinearModel:
+    """
+    Ridge regression fitted incrementally from accumulated normal equations.
+
+    `forgetting` (< 1) exponentially down-weights old samples so the fit follows
+    changes such as a model being swapped for a slower one.
+    """
+
+    def __init__(self, n_features: int, forgetting: float = 0.995, ridge: float = 1e-3):
+        self.forgetting = forgetting
+        self.ridge = ridge
+        self.xtx = np.zeros((n_features, n_features))
+        self.xty = np.zeros(n_features)
+        self.samples = 0
+        self._weights: Optional[np.ndarray] = None
+
+    def update(self, x: List[float], y: float) -> None:
+        x = np.asarray(x, dtype=np.float64)
+        self.xtx = self.forgetting * self.xtx + np.outer(x, x)
+        self.xty = self.forgetting * self.xty + x * y
+        self.samples += 1
+        self._weights = None
+
+    def predict(self, x: List[float]) -> float:
+        if self._weights is None:
+            regularized = self.xtx + self.ridge * np.eye(len(self.xty))
+            self._weights = np.linalg.solve(regularized, self.xty)
+        return float(np.dot(self._weights, x))
+
+
+class LatencyPredictor:
+    """
+    Predict how long a generation will take, per agent or model.
+
+    Two small linear models per key: output length from prompt length (so past output
+    lengths inform the estimate), then latency from prompt length and the predicted
+    output length. Lengths are in thousands of characters to keep the fit well scaled.
+    """
+
+    def __init__(self, min_samples: int = 10):
+        self.min_samples = min_samples
+        self._output_models: Dict[str, OnlineLinearModel] = {}
+        self._latency_models: Dict[str, OnlineLinearModel] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: str, prompt_chars: int, output_chars: int, latency: float) -> None:
+        prompt_k, output_k = prompt_chars / 1000, output_chars / 1000
+        with self._lock:
+            if key not in self._latency_models:
+                self._output_models[key] = OnlineLinearModel(2)
+                self._latency_models[key] = OnlineLinearModel(3)
+            self._output_models[key].update([1.0, prompt_k], output_k)
+            self._latency_models[key].update([1.0, prompt_k, output_k], latency)
+
+    def predict(self, key: str, prompt_chars: int) -> Optional[float]:
+        """
+        Predicted seconds for a generation, or None until the key has enough samples.
+        """
+        prompt_k = prompt_chars / 1000
+        with self._lock:
+            latency_model = self._latency_models.get(key)
+            if latency_model is None or latency_model.samples < self.min_samples:
+                return None
+            output_k = max(0.0, self._output_models[key].predict([1.0, prompt_k]))
+            return max(0.0, latency_model.predict([1.0, prompt_k, output_k]))
+
+    def expected(self, key: str, prompt_chars: int, output_chars: int) -> Optional[float]:
+        """
+        Seconds a generation of this output length normally takes, or None until the
+        key has enough samples. Used to tell a slow host from a long answer.
+        """
+        with self._lock:
+            latency_model = self._latency_models.get(key)
+            if latency_model is None or latency_model.samples < self.min_samples:
+                return None
+            expected = latency_model.predict([1.0, prompt_chars / 1000, output_chars / 1000])
+        return expected if expected > 0 else None
+
+    def replay(self, store: FeedbackStore, window: float) -> int:
+        """
+        Train from the "latency" records logged in the last `window` seconds. Older
+        calls describe the host as it was, and replaying them would only slow startup.
+        Returns the number used.
+        """
+        records = store.read_recent(time.time() - window)
+        used = 0
+        for record in records:
+            if record.get("type") == "latency":
+                self.observe(record["pool"], record["prompt_chars"], record["output_chars"], record["latency"])
+                used += 1
+        logger.info(f"Latency predictor trained on {used} logged calls")
+        return used
@@ -0,0 +1,69 @@
+# metrics.py
+
+import threading
+from typing import Dict
+
+
+def _key(name: str, labels: Dict[str, object]) -> str:
+    if not labels:
+        return name
+    label_str = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{label_str}}}"
+
+
+class Metrics:
+    """
+    Minimal in-process metrics registry: counters, gauges and summaries.
+
+    Metric names may carry labels, e.g. metrics.incr("router.decisions", source="llm")
+    is reported as "router.decisions{source=llm}".
+    """
+
+    def __init__(self):
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.summaries: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, value: float = 1, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            summary = self.summaries.setdefault(key, {"count": 0, "sum": 0.0, "max": 0.0})
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["max"] = max(summary["max"], value)
+
+    def counter(self, name: str, **labels) -> float:
+        return self.counters.get(_key(name, labels), 0)
+
+    def ratio(self, numerator: str, denominator: str) -> float:
+        """
+        Return counter(numerator) / counter(denominator), or 0.0 if nothing was counted.
+        """
+        total = self.counter(denominator)
+        return self.counter(numerator) / total if total else 0.0
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            summaries = {
+                key: dict(s, mean=s["sum"] / s["count"] if s["count"] else 0.0)
+                for key, s in self.summaries.items()
+            }
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "summaries": summaries,
+            }
+
+
+# Shared registry for the orchestrator process
+metrics = Metrics()
@@ -1,16 +1,41 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from sse_starlette.sse import EventSourceResponse
+import aiohttp
 import requests
-import subprocess
 import re
 import logging
 import asyncio
 from enum import Enum
-from typing import Tuple, List, Dict, Optional, Generator
+from typing import AsyncIterator, Tuple, List, Dict, Optional, Generator, Set
 import json
 import uuid
 import atexit
+import hashlib
+import random
+import time
+
+from adaptive_timeout import AdaptiveTimeout
+from ai_clients import OllamaClient
+from bulkhead import (
+    ANONYMOUS_CLIENT, BACKGROUND, COSMETIC, CRITICAL, Bulkhead, BulkheadFull, Ticket, client_label, current_client,
+    current_lane, queue_watch,
+)
+from concurrency_limit import AimdLimit
+from fast_router import FastRouter, RoutingLearner
+from jobs import DONE, FAILED, QUEUED, RUNNING, JobStore, event_payload, job_view
+from feedback import FeedbackStore
+from latency_predictor import LatencyPredictor
+from metrics import metrics
+from overload import FAST_ROUTING, LEVEL_NAMES, REJECT, SKIP_FOLLOWUP, SKIP_INTRO, OverloadController
+from quality_gate import FAIL, PASS, check_answer
+from rate_limit import ClientRateLimiter
+from refinement import RefinementController
+from request_log import RequestLog, current_trace
+from residency import ModelResidencyManager
+from semantic_cache import SemanticCache
+from utils import is_error_response
 
 # Configure logging
 logging.basicConfig(
@@ -68,46 +93,385 @@ REQUEST_TIMEOUT = 60  # seconds
 MAX_RETRIES = 3
 RETRY_DELAY = 30  # seconds
 
+# Ollama server shared by the orchestrator and agents. Orchestrator prompts go through
+# its HTTP API so keep_alive and KV prefix reuse apply to every call.
+OLLAMA_URL = "http://localhost:11434"
+OLLAMA_REPLICAS = []  # further Ollama servers to retry on when a generation stalls
+LLAMA_TIMEOUT = 15  # seconds
+# Stalled-generation watchdog: abort and retry elsewhere when no token arrives in time
+LLAMA_FIRST_TOKEN_TIMEOUT = 8  # seconds; covers prompt evaluation of a pinned, warm model
+LLAMA_LOAD_TIMEOUT = 60  # seconds for the first token when /api/ps shows the model is not loaded
+LLAMA_STALL_TIMEOUT = 4  # seconds between tokens
+
+llama_client = OllamaClient(
+    AGENT_CONFIG[AgentType.SELF]["model"],
+    OLLAMA_URL,
+    timeout=LLAMA_TIMEOUT,
+    keep_alive=-1,
+    replicas=OLLAMA_REPLICAS,
+    first_token_timeout=LLAMA_FIRST_TOKEN_TIMEOUT,
+    stall_timeout=LLAMA_STALL_TIMEOUT,
+    load_timeout=LLAMA_LOAD_TIMEOUT,
+)
+
+# Bulkheads: separate concurrency pools per agent and per model, so a slow deepseek-r1
+# generation can only hold its own slots. An agent call holds a slot in its agent's pool
+# and one in its model's pool for as long as the HTTP call runs.
+#   limit: calls admitted at once; with adaptive concurrency only the starting value,
+#     which then moves between ADAPTIVE_MIN_LIMIT and ADAPTIVE_MAX_LIMITS
+#   max_queue: calls that may wait behind them, counting the caller's lane and those ahead
+#   max_wait: seconds a call may wait for a slot (BACKGROUND_MAX_WAIT for jobs and batches)
+#   service_time: starting guess of seconds per call, then a moving average of held time
+# Admission fails fast: a call is rejected before it queues when the queue is full, or
+# when its estimated wait, ceil(queue position / limit) * service_time, exceeds max_wait;
+# one still waiting at max_wait is dropped from the queue. A rejected call is not retried
+# and the user gets a "busy, try again in about N seconds" message instead.
+# The orchestrator keeps no thread pools for agent calls (they are aiohttp requests);
+# each agent service runs its generations in a pool of MAX_CONCURRENT_GENERATIONS
+# threads, sized to its ADAPTIVE_MAX_LIMITS entry, so it can serve every admitted call.
+BULKHEAD_AGENT_CONFIG = {
+    AgentType.MATH: {"limit": 2, "max_queue": 8, "max_wait": 60, "service_time": 45},
+    AgentType.CODING: {"limit": 4, "max_queue": 16, "max_wait": 30, "service_time": 10},
+    AgentType.CREATIVE: {"limit": 4, "max_queue": 16, "max_wait": 30, "service_time": 10},
+}
+BULKHEAD_MODEL_CONFIG = {
+    "llama3.2": {"limit": 4, "max_queue": 32, "max_wait": 15, "service_time": 3},
+    "deepseek-r1": {"limit": 2, "max_queue": 8, "max_wait": 60, "service_time": 45},
+    "codellama": {"limit": 4, "max_queue": 16, "max_wait": 30, "service_time": 10},
+    "vicuna": {"limit": 4, "max_queue": 16, "max_wait": 30, "service_time": 10},
+}
+QUEUE_STATUS_INTERVAL = 2.0  # seconds between queue position updates on the SSE stream
+# Queue order within each pool: "fifo", or "sjf" (shortest predicted call first, with
+# aging so long calls still get their turn); see tools/bench_scheduling.py
+SCHEDULING_POLICY = "sjf"
+SJF_AGING_RATE = 1.0  # seconds of predicted cost forgiven per second spent waiting
+# Priority lanes: answer-critical calls go ahead of cosmetic ones (intro, follow-up,
+# retry message), which only wait briefly and never take the model's last free slots
+COSMETIC_MAX_WAIT = 2  # seconds
+COSMETIC_RESERVED_SLOTS = 1
+# Jobs and batches queue in a background lane behind all live calls, and may wait
+# this long for a slot since nobody is watching them interactively
+BACKGROUND_MAX_WAIT = 600  # seconds
+# Preemption: a call to these agents that has run for PREEMPTION_SLICE seconds is paused
+# as soon as a call waiting for its agent's or model's slots is in the same lane or a
+# more urgent one and is predicted to take less than the running call's remaining time.
+# It gives up its slots, queues again for its predicted remaining time and, once
+# readmitted, resumes where it stopped; the agent keeps the partial output meanwhile.
+# Calls with no such call waiting behind them stream to the end without interruption.
+PREEMPTIBLE_AGENTS = {AgentType.MATH}
+PREEMPTION_SLICE = 10  # seconds a call runs before it may be paused
+PREEMPTION_POLL_INTERVAL = 0.5  # seconds between checks for waiting calls
+
+# Adaptive concurrency: each pool's limit starts at its configured value and then follows
+# measured latency (AIMD), so the host is neither left idle nor pushed into swapping
+ADAPTIVE_CONCURRENCY_ENABLED = True
+ADAPTIVE_MIN_LIMIT = 1
+# Most concurrent calls each pool may grow to (also each agent's MAX_CONCURRENT_GENERATIONS).
+# deepseek-r1 needs most of the host's memory per generation, so it never goes past its
+# configured limit; the smaller models may grow into the remaining headroom.
+ADAPTIVE_MAX_LIMITS = {
+    AgentType.MATH.value: 2,
+    AgentType.CODING.value: 6,
+    AgentType.CREATIVE.value: 6,
+    "llama3.2": 8,
+    "deepseek-r1": 2,
+    "codellama": 6,
+    "vicuna": 6,
+}
+ADAPTIVE_BACKOFF = 0.9  # multiply the limit by this on a slow or failed call
+ADAPTIVE_TOLERANCE = 2.0  # a call this many times slower than expected for its output length counts as slow
+
+def make_limiter(pool: str, config: Dict) -> Optional[AimdLimit]:
+    if not ADAPTIVE_CONCURRENCY_ENABLED:
+        return None
+    return AimdLimit(
+        config["limit"],
+        min_limit=ADAPTIVE_MIN_LIMIT,
+        max_limit=ADAPTIVE_MAX_LIMITS.get(pool, config["limit"]),
+        backoff=ADAPTIVE_BACKOFF,
+        tolerance=ADAPTIVE_TOLERANCE,
+    )
+
+def observe_queue_wait(seconds: float, priority: int) -> None:
+    # Cosmetic calls are the first thing shed, so only answer-critical waits measure load
+    if priority == CRITICAL:
+        overload_controller.observe_wait(seconds)
+
+agent_bulkheads = {
+    agent: Bulkhead(
+        agent.value, **config, limiter=make_limiter(agent.value, config), policy=SCHEDULING_POLICY,
+        aging_rate=SJF_AGING_RATE, on_wait=observe_queue_wait, background_max_wait=BACKGROUND_MAX_WAIT,
+    )
+    for agent, config in BULKHEAD_AGENT_CONFIG.items()
+}
+model_bulkheads = {
+    model: Bulkhead(
+        model, **config, limiter=make_limiter(model, config), policy=SCHEDULING_POLICY, aging_rate=SJF_AGING_RATE,
+        reserved_slots=COSMETIC_RESERVED_SLOTS, on_wait=observe_queue_wait, background_max_wait=BACKGROUND_MAX_WAIT,
+    )
+    for model, config in BULKHEAD_MODEL_CONFIG.items()
+}
+# Agent HTTP calls share one connection pool, without a limit of its own: the bulkheads
+# bound them. A cancelled call (a losing hedge, a client that left, a deadline) closes
+# its connection, and the agent stops generating when it sees the disconnect, so a
+# bulkhead slot is only ever free once the agent is too.
+agent_session: Optional[aiohttp.ClientSession] = None
+
+def get_agent_session() -> aiohttp.ClientSession:
+    global agent_session
+    if agent_session is None or agent_session.closed:
+        agent_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+    return agent_session
+
+# Overload control: a query sheds optional work in steps as load rises.
+#   load = max(queued calls / OVERLOAD_QUEUE_CAPACITY, queueing delay / OVERLOAD_DELAY_TARGET)
+# Queued calls counts every pool and every lane. The queueing delay is the larger of the
+# mean time answer-critical calls admitted in the last 30 s waited for a slot, and the
+# wait of the oldest critical call still queued. Each threshold that load reaches
+# switches on one more step:
+#   0.5  (12 queued or 7.5 s):   skip the follow-up and the speculative self-answer
+#   0.75 (18 queued or 11.25 s): also skip the intro
+#   1.0  (24 queued or 15 s):    also route with the fast router only, without the LLM
+#   1.5  (36 queued or 22.5 s):  /query and /batch answer 503 with Retry-After (/jobs
+#                                still accepts work, which waits in the background lane)
+# 15 s is the llama3.2 pool's own max_wait, so LLM routing stops just as its calls would
+# start failing fast there anyway.
+OVERLOAD_ENABLED = True
+OVERLOAD_THRESHOLDS = [0.5, 0.75, 1.0, 1.5]  # load at which each of the four steps starts
+OVERLOAD_QUEUE_CAPACITY = 24
+OVERLOAD_DELAY_TARGET = 15  # seconds of queueing delay
+OVERLOAD_RETRY_AFTER = 15  # seconds, sent with 503 responses
+
+def all_bulkheads() -> List[Bulkhead]:
+    return list(agent_bulkheads.values()) + list(model_bulkheads.values())
+
+def total_queued() -> int:
+    return sum(len(b.queue) for b in all_bulkheads())
+
+overload_controller = OverloadController(
+    total_queued,
+    OVERLOAD_THRESHOLDS,
+    queue_capacity=OVERLOAD_QUEUE_CAPACITY,
+    delay_target=OVERLOAD_DELAY_TARGET,
+    oldest_wait=lambda: max(b.oldest_wait() for b in all_bulkheads()),
+)
+
+def overload_level() -> int:
+    return overload_controller.level() if OVERLOAD_ENABLED else 0
+
+# Per-client rate limits: each client (a known API key, otherwise the IP address) gets a
+# token bucket of RATE_LIMIT_PER_MINUTE queries with bursts of RATE_LIMIT_BURST; over
+# that, /query answers 429 with Retry-After. CLIENT_WEIGHTS (keyed by API key or IP)
+# scales a client's rate limit and its share of each bulkhead's queue. Only keys in
+# API_KEYS or CLIENT_WEIGHTS are recognised; any other key is ignored, so a caller
+# cannot get a fresh bucket (and metric series) by sending random keys.
+RATE_LIMIT_ENABLED = True
+RATE_LIMIT_PER_MINUTE = 20
+RATE_LIMIT_BURST = 5
+API_KEY_HEADER = "X-API-Key"
+API_KEYS: Set[str] = set()
+CLIENT_WEIGHTS: Dict[str, float] = {}
+
+rate_limiter = ClientRateLimiter(RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST)
+
+# Adaptive timeouts: each agent and the orchestrator model learn their latency
+# distribution, and a call's timeout is TIMEOUT_QUANTILE of it times TIMEOUT_MULTIPLIER,
+# scaled by input length. The fixed timeouts above stay as hard caps. Calls that time out
+# are learned at their timeout, and each retry gets TIMEOUT_RETRY_GROWTH times longer.
+ADAPTIVE_TIMEOUTS_ENABLED = True
+TIMEOUT_QUANTILE = 0.99
+TIMEOUT_MULTIPLIER = 1.5
+TIMEOUT_MIN_SAMPLES = 20  # use the hard cap until this many calls have finished
+TIMEOUT_RETRY_GROWTH = 2.0
+
+def make_timeout(hard_cap: float) -> AdaptiveTimeout:
+    return AdaptiveTimeout(
+        hard_cap,
+        quantile=TIMEOUT_QUANTILE,
+        multiplier=TIMEOUT_MULTIPLIER,
+        min_samples=TIMEOUT_MIN_SAMPLES if ADAPTIVE_TIMEOUTS_ENABLED else float("inf"),
+        retry_growth=TIMEOUT_RETRY_GROWTH,
+    )
+
+llama_timeouts = make_timeout(LLAMA_TIMEOUT)
+agent_timeouts = {agent: make_timeout(REQUEST_TIMEOUT) for agent in BULKHEAD_AGENT_CONFIG}
+
+# Semantic response cache
+SEMANTIC_CACHE_ENABLED = True
+SEMANTIC_CACHE_THRESHOLD = 0.9  # minimum cosine similarity for a cache hit
+SEMANTIC_CACHE_CAPACITY = 10000  # entries per agent
+SEMANTIC_CACHE_EVICTION = "lru"  # "lru" or "lfu"
+SEMANTIC_CACHE_DIR = "cache"
+
+semantic_cache = SemanticCache(
+    SEMANTIC_CACHE_DIR,
+    capacity=SEMANTIC_CACHE_CAPACITY,
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    eviction=SEMANTIC_CACHE_EVICTION,
+)
+
+# Routing feedback loop
+FEEDBACK_LOG_PATH = "feedback/feedback.jsonl"
+FAST_ROUTER_STATE_PATH = "feedback/router_state.npz"
+FAST_ROUTER_CONFIDENCE = 0.8  # use the fast router's choice at or above this probability
+FAST_ROUTER_MIN_EXAMPLES = 200  # updates needed before the fast router is trusted
+ROUTER_SHADOW_RATE = 0.1  # share of fast-routed queries also sent to the LLM router to measure accuracy
+EVALUATION_SAMPLE_RATE = 0.2  # share of answers scored with evaluate_response in the background
+LEARNER_INTERVAL = 5.0  # seconds between feedback log polls
+
+# Not rotated: the routing learner tails it by byte offset, and the fast router can be
+# retrained from scratch by replaying it. Latency records, which are frequent, go to
+# their own rotating log below.
+feedback_store = FeedbackStore(FEEDBACK_LOG_PATH)
+# Predicts call latency for SJF scheduling. Every finished call is logged to its own
+# rotating file, and on startup the predictor is retrained from the last
+# LATENCY_REPLAY_WINDOW of it.
+LATENCY_LOG_PATH = "feedback/latency.jsonl"
+LATENCY_LOG_MAX_BYTES = 20 * 1024 * 1024  # rotate to .1 past this size
+LATENCY_REPLAY_WINDOW = 24 * 3600  # seconds
+latency_store = FeedbackStore(LATENCY_LOG_PATH, max_bytes=LATENCY_LOG_MAX_BYTES, backups=1)
+latency_predictor = LatencyPredictor()
+fast_router = FastRouter([agent.value for agent in AgentType])
+routing_learner = RoutingLearner(fast_router, feedback_store, FAST_ROUTER_STATE_PATH, interval=LEARNER_INTERVAL)
+
+# Speculative self-answer: start the llama3.2 answer while routing is still running.
+# Opt-in, since a specialist route throws the speculative generation away.
+SPECULATIVE_SELF_ENABLED = False
+
+# Hedged requests: when the fast router's top scores are close, ask several specialists
+# at once and keep the first satisfactory answer
+HEDGING_ENABLED = False
+HEDGE_MARGIN = 0.15  # candidates within this probability of the top choice are hedged
+HEDGE_MAX_AGENTS = 2  # per-request cap on agents queried in parallel
+HEDGE_MAX_INFLIGHT = 4  # cluster-wide cap on extra agent calls started by hedging
+
+hedge_inflight = 0
+
+# Answer refinement: evaluate specialist answers and ask for revisions within a latency budget
+REFINEMENT_ENABLED = False
+REFINEMENT_MAX_ROUNDS = 2
+REQUEST_LATENCY_BUDGET = 120  # seconds from request start; no refinement round starts if it can't finish in time
+
+# Model residency on the shared Ollama host
+RESIDENCY_ENABLED = True
+RESIDENCY_KEEP_ALIVE = "30m"  # lease for preloaded agent models
+RESIDENCY_MIN_FREE_FRACTION = 0.15  # evict when MemAvailable/MemTotal would drop below this
+RESIDENCY_DEMAND_HALF_LIFE = 300  # seconds; how quickly past traffic stops predicting demand
+RESIDENCY_INTERVAL = 30  # seconds between maintenance passes
+
+residency_manager = ModelResidencyManager(
+    OLLAMA_URL,
+    pinned=[AGENT_CONFIG[AgentType.SELF]["model"]],
+    keep_alive=RESIDENCY_KEEP_ALIVE,
+    min_free_fraction=RESIDENCY_MIN_FREE_FRACTION,
+    demand_half_life=RESIDENCY_DEMAND_HALF_LIFE,
+)
+
+# Startup warm-up: /ready reports "not ready" until the model is loaded and primed
+WARMUP_PROMPT = "Reply with the single word OK."
+WARMUP_RETRY_DELAY = 10  # seconds between failed warm-up attempts
+
+warmup_state = {"ready": False, "models": {}}
+
+# Async jobs: POST /jobs queues a query in a local SQLite database and returns at once;
+# the result is polled from GET /jobs/{id} or followed on GET /jobs/{id}/events.
+# Unfinished jobs are run again after a restart; finished ones are kept for JOB_RESULT_TTL.
+JOBS_DB_PATH = "jobs/jobs.sqlite3"
+JOB_WORKERS = 4  # jobs run at the same time
+JOB_MAX_QUEUED = 1000  # POST /jobs answers 503 beyond this
+JOB_RESULT_TTL = 24 * 3600  # seconds
+JOB_PURGE_INTERVAL = 600  # seconds between deletions of expired jobs
+JOB_POLL_INTERVAL = 5  # seconds an event stream waits for news before checking the store
+
+job_store = JobStore(JOBS_DB_PATH)
+# Job ID -> event set when the job has new events, for /jobs/{id}/events
+job_updates: Dict[str, asyncio.Event] = {}
+
+# Request log: every request's input, route, stage timings, answer length and cache
+# status, for replay with tools/replay_requests.py. Written off the event loop.
+REQUEST_LOG_ENABLED = True
+REQUEST_LOG_PATH = "logs/requests.jsonl"
+REQUEST_LOG_MAX_BYTES = 50 * 1024 * 1024  # rotate to .1, .2, ... past this size
+REQUEST_LOG_BACKUPS = 5
+
+request_log = RequestLog(REQUEST_LOG_PATH, max_bytes=REQUEST_LOG_MAX_BYTES, backups=REQUEST_LOG_BACKUPS)
+
+# Batch queries: POST /batch routes a list of questions and streams answers as NDJSON.
+# Per-agent limits, shared by all batches running at once, keep batches to a share of
+# each pool; their calls also queue in the background lane, behind live traffic.
+BATCH_MAX_QUESTIONS = 5000
+BATCH_ROUTING_CONCURRENCY = 4  # questions routed at the same time (LLM router calls)
+BATCH_AGENT_CONCURRENCY = {
+    AgentType.MATH: 1,
+    AgentType.CODING: 2,
+    AgentType.CREATIVE: 2,
+    AgentType.SELF: 2,
+}
+# Agent -> semaphore of BATCH_AGENT_CONCURRENCY for all batches, created on first use
+# so it belongs to the server's event loop
+batch_agent_limits: Dict[AgentType, asyncio.Semaphore] = {}
+
 # --------------------------------------------------------------------
 #                          HELPER FUNCTIONS
 # --------------------------------------------------------------------
 
-async def call_llama_async(prompt: str) -> str:
+async def call_llama_async(prompt: str, prefix: str = "", priority: int = CRITICAL) -> str:
     """
-    Asynchronously call Llama 2 via Ollama subprocess.
+    Asynchronously call Llama via the Ollama HTTP API.
     
     Args:
         prompt: The input prompt to send to the model
+        prefix: Fixed instructions sent ahead of the prompt. Keeping them identical
+            across calls lets Ollama reuse their cached KV state and evaluate only
+            the prompt.
+        priority: CRITICAL for calls the answer depends on, COSMETIC for filler
+            messages that can be dropped
         
     Returns:
         The model's text response
     """
     logger.debug(f"Calling Llama with prompt: {prompt[:100]}...")
     
+    model = llama_client.model_name
+    input_chars = len(prefix) + len(prompt)
+    timeout = llama_timeouts.timeout(input_chars)
+    
+    # Cancelling this call (e.g. a discarded speculation) closes the connection,
+    # which stops the generation on the Ollama server
+    max_wait = COSMETIC_MAX_WAIT if priority == COSMETIC else None
+    cost = latency_predictor.predict(model, input_chars)
     try:
-        # Create subprocess asynchronously
-        process = await asyncio.create_subprocess_exec(
-            "ollama", "run", "llama3.2", prompt,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        # Wait for it to complete with timeout
-        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=15)
-        
-        if process.returncode != 0:
-            error_msg = stderr.decode('utf-8', errors='replace')
-            logger.error(f"Ollama subprocess error: {error_msg}")
-            return f"Error in LLM processing. Please try again."
-            
-        return stdout.decode('utf-8', errors='replace').strip().replace('"', '')
-        
-    except asyncio.TimeoutError:
-        logger.error("Ollama subprocess timed out")
-        return "Processing took too long. Please try a simpler query."
-    except Exception as e:
-        logger.exception(f"Error in call_llama_async: {e}")
-        return f"Unexpected error in LLM processing: {str(e)}"
+        async with model_bulkheads[model].ticket(max_wait, cost, priority) as ticket:
+            started = time.monotonic()
+            response = await llama_client.generate(prompt, prefix, timeout)
+            ticket.dropped = is_error_response(response)
+            elapsed = time.monotonic() - started
+            if ticket.dropped:
+                if elapsed >= timeout:
+                    llama_timeouts.observe_timeout(timeout, input_chars)
+            elif elapsed < timeout:
+                # An answer past the timeout waited for a model load, which says nothing
+                # about generation speed
+                ticket.expected = latency_predictor.expected(model, input_chars, len(response))
+                record_latency(model, input_chars, len(response), elapsed)
+                llama_timeouts.observe(elapsed, input_chars)
+    except BulkheadFull as e:
+        return f"Sorry, the orchestrator model is busy right now. Please try again in about {e.retry_after:.0f} seconds."
+    return response.replace('"', '')
+
+def record_latency(pool: str, prompt_chars: int, output_chars: int, latency: float) -> None:
+    """
+    Train the latency predictor on a finished call and log it for the next restart.
+    """
+    latency_predictor.observe(pool, prompt_chars, output_chars, latency)
+    asyncio.create_task(log_feedback(
+        "latency", None,
+        store=latency_store,
+        pool=pool,
+        prompt_chars=prompt_chars,
+        output_chars=output_chars,
+        latency=latency,
+    ))
 
 def sanitize_text(text: str) -> str:
     """
@@ -133,36 +497,90 @@ def sanitize_text(text: str) -> str:
     for disclaimer in disclaimers:
         text = re.sub(disclaimer + r".*?\.", "", text, flags=re.IGNORECASE)
     
-    # Normalize whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
+    # Normalize whitespace, keeping line breaks and indentation so code blocks survive
+    text = re.sub(r'(?<=\S)[ \t]+', ' ', text)
+    text = re.sub(r'[ \t]+\n', '\n', text)
+    text = re.sub(r'\n{3,}', '\n\n', text).strip()
     
     return text
 
 # -------------------- DECISION: ORCHESTRATOR vs. AGENT --------------------
 
-async def decide_agent(user_input: str) -> AgentType:
+# Fixed prompt prefixes come first so Ollama can reuse their KV state across calls;
+# only the per-request text after them needs evaluating.
+ROUTING_PROMPT_PREFIX = f"""Select the most appropriate specialist agent to handle the user query below.
+
+Available specialists:
+- Math Agent ({AGENT_CONFIG[AgentType.MATH]["specialty"]})
+- Coding Agent ({AGENT_CONFIG[AgentType.CODING]["specialty"]})
+- Creative Agent ({AGENT_CONFIG[AgentType.CREATIVE]["specialty"]})
+- Self (handle directly for {AGENT_CONFIG[AgentType.SELF]["specialty"]})
+
+"""
+
+async def decide_agent(user_input: str, request_id: Optional[str] = None, fast_only: bool = False) -> AgentType:
     """
     Decide which agent should handle the user query.
     
+    The fast router answers when it is trained and confident; otherwise the decision
+    escalates to the LLM router, whose choice is logged as a training label.
+    
     Args:
         user_input: The user's query
+        request_id: ID used to join this decision with its outcome in the feedback log
+        fast_only: Never call the LLM router (used under overload). Unsure queries take
+            the fast router's best guess, or go to self while it is untrained.
         
     Returns:
         AgentType enum value indicating which agent to use
     """
-    prompt = f"""Based on this user query, select the most appropriate specialist agent to handle it:
+    request_id = request_id or str(uuid.uuid4())
+    fast_route, confidence = fast_router.predict(user_input)
+    fast_ready = fast_router.examples >= FAST_ROUTER_MIN_EXAMPLES
+    
+    if fast_ready and confidence >= FAST_ROUTER_CONFIDENCE:
+        agent_type = AgentType(fast_route)
+        source = "fast"
+        if random.random() < ROUTER_SHADOW_RATE and not fast_only:
+            asyncio.create_task(shadow_route(request_id, user_input, agent_type))
+    elif fast_only:
+        agent_type = AgentType(fast_route) if fast_ready else AgentType.SELF
+        source = "degraded"
+    else:
+        agent_type = await llm_decide_agent(user_input)
+        source = "llm"
+        await log_feedback("llm_label", request_id, question=user_input, llm_route=agent_type.value)
+        if fast_ready:
+            record_router_agreement(AgentType(fast_route), agent_type)
     
-Current user query: "{user_input}"
+    metrics.incr("router.decisions", source=source)
+    update_router_gauges()
+    await log_feedback(
+        "route", request_id,
+        question=user_input,
+        route=agent_type.value,
+        source=source,
+        fast_route=fast_route,
+        fast_confidence=confidence,
+    )
+    logger.info(f"Routed '{user_input[:50]}...' to {agent_type.value} via {source} router (confidence {confidence:.2f})")
+    return agent_type
 
-Available specialists:
-- Math Agent ({AGENT_CONFIG[AgentType.MATH]["specialty"]})
-- Coding Agent ({AGENT_CONFIG[AgentType.CODING]["specialty"]})
-- Creative Agent ({AGENT_CONFIG[AgentType.CREATIVE]["specialty"]})
-- Self (handle directly for {AGENT_CONFIG[AgentType.SELF]["specialty"]})
+async def llm_decide_agent(user_input: str) -> AgentType:
+    """
+    Ask the orchestrator LLM which agent should handle the user query.
+    
+    Args:
+        user_input: The user's query
+        
+    Returns:
+        AgentType enum value indicating which agent to use
+    """
+    prompt = f"""Current user query: "{user_input}"
 
 Your selection (respond with ONLY "agent_math", "agent_coding", "agent_creative", or "self"):"""
 
-    response = await call_llama_async(prompt)
+    response = await call_llama_async(prompt, prefix=ROUTING_PROMPT_PREFIX)
     response = response.strip().lower()
     
     logger.info(f"Agent decision for '{user_input[:50]}...': {response}")
@@ -179,7 +597,43 @@ Your selection (respond with ONLY "agent_math", "agent_coding", "agent_creative"
 
 async def query_agent(agent_type: AgentType, question: str) -> str:
     """
-    Query a specialized agent with the user's question.
+    Query a specialized agent, serving near-duplicate questions from the semantic cache.
+    
+    Answers are not cached here: the caller stores the final answer with
+    remember_answer once refinement has accepted it.
+    
+    Args:
+        agent_type: The type of agent to query
+        question: The user's question
+        
+    Returns:
+        The agent's response
+    """
+    loop = asyncio.get_event_loop()
+    
+    if SEMANTIC_CACHE_ENABLED:
+        cached = await loop.run_in_executor(None, semantic_cache.get, agent_type.value, question)
+        trace = current_trace.get()
+        if trace is not None:
+            trace["cache"] = "miss" if cached is None else "hit"
+        if cached is not None:
+            logger.info(f"Semantic cache hit for {agent_type} ({len(cached)} chars)")
+            return cached
+    
+    return await call_agent(agent_type, question)
+
+async def remember_answer(agent_type: AgentType, question: str, answer: str) -> None:
+    """
+    Store a final answer in the semantic cache, unless it is an error.
+    """
+    if SEMANTIC_CACHE_ENABLED and not is_error_response(answer):
+        await asyncio.get_event_loop().run_in_executor(
+            None, semantic_cache.put, agent_type.value, question, answer
+        )
+
+async def call_agent(agent_type: AgentType, question: str) -> str:
+    """
+    Send the user's question to an agent, retrying on failure.
     
     Args:
         agent_type: The type of agent to query
@@ -194,6 +648,7 @@ async def query_agent(agent_type: AgentType, question: str) -> str:
     config = AGENT_CONFIG[agent_type]
     agent_port = config.get("port")
     agent_name = agent_type.value
+    timeouts = agent_timeouts[agent_type]
     
     try:
         for attempt in range(MAX_RETRIES + 1):
@@ -203,28 +658,37 @@ async def query_agent(agent_type: AgentType, question: str) -> str:
                 agent_endpoint = f"http://localhost:{agent_port}/process"
                 
                 logger.info(f"Querying {agent_type} (attempt {attempt+1}/{MAX_RETRIES+1})")
-                response = await asyncio.get_event_loop().run_in_executor(
-                    None,
-                    lambda: requests.post(agent_endpoint, json=payload, timeout=REQUEST_TIMEOUT)
-                )
+                timeout = timeouts.timeout(len(question), attempt)
+                cost = latency_predictor.predict(agent_name, len(question))
+                status, data, busy = await post_to_agent(agent_type, agent_endpoint, payload, timeout, cost)
                 
-                if response.status_code == 200:
-                    result = response.json().get("answer", "")
+                if status == 200:
+                    result = data.get("answer", "")
                     logger.info(f"Got response from {agent_type} ({len(result)} chars)")
+                    if not is_error_response(result):
+                        record_latency(agent_name, len(question), len(result), busy)
+                        timeouts.observe(busy, len(question))
                     return result
                 else:
-                    logger.warning(f"{agent_type} returned status {response.status_code}")
+                    logger.warning(f"{agent_type} returned status {status}")
                     
-            except requests.exceptions.Timeout:
-                logger.warning(f"Timeout querying {agent_type}")
-            except requests.exceptions.ConnectionError:
+            except BulkheadFull as e:
+                # Waiting for a retry would only add to the queue; fail fast
+                return f"Sorry, the {agent_name} expert is busy right now. Please try again in about {e.retry_after:.0f} seconds."
+            except asyncio.TimeoutError:
+                logger.warning(f"Timeout querying {agent_type} after {timeout:.1f}s")
+                metrics.incr("timeouts.fired", pool=agent_name)
+                timeouts.observe_timeout(timeout, len(question))
+            except aiohttp.ClientConnectionError:
                 logger.warning(f"Connection error querying {agent_type}")
             except Exception as e:
                 logger.exception(f"Error querying {agent_type}: {e}")
                 
-            # Don't sleep on the last attempt
+            # Don't sleep on the last attempt. Back off for about one typical call,
+            # capped by RETRY_DELAY, rather than a fixed delay.
             if attempt < MAX_RETRIES:
-                await asyncio.sleep(RETRY_DELAY)
+                typical = timeouts.percentile(0.5, len(question))
+                await asyncio.sleep(RETRY_DELAY if typical is None else min(RETRY_DELAY, typical))
         
         # If we get here, all attempts failed
         return f"Sorry, I couldn't get a response from the {agent_type} expert at this time."
@@ -233,8 +697,125 @@ async def query_agent(agent_type: AgentType, question: str) -> str:
         logger.exception(f"Error querying agent: {e}")
         return f"Error querying agent: {str(e)}"
 
+async def post_to_agent(
+    agent_type: AgentType,
+    endpoint: str,
+    payload: Dict,
+    timeout: float,
+    cost: Optional[float],
+) -> Tuple[int, Dict, float]:
+    """
+    POST one attempt to an agent while holding slots in its pool and its model's pool.
+    
+    Slots are held for the attempt only, so the retry delay doesn't keep other callers
+    waiting. Calls to PREEMPTIBLE_AGENTS are paused when either pool has a shorter call
+    waiting in the same or a more urgent lane; while paused they hold no slot and use
+    none of `timeout`. Cancelling the
+    call closes its connection, which makes the agent abandon the generation.
+    
+    Args:
+        agent_type: The agent to call
+        endpoint: The agent's /process URL
+        payload: The request body
+        timeout: Seconds of generation allowed for the attempt
+        cost: Predicted seconds for the whole call, for the bulkhead queues
+        
+    Returns:
+        Tuple of (final HTTP status, response body for a 200, seconds spent generating)
+    
+    Raises:
+        asyncio.TimeoutError: the attempt ran out of `timeout`
+    """
+    agent_pool = agent_bulkheads[agent_type]
+    model_pool = model_bulkheads[AGENT_CONFIG[agent_type]["model"]]
+    pool = agent_type.value
+    payload = dict(payload)
+    preemptible = agent_type in PREEMPTIBLE_AGENTS
+    if preemptible:
+        payload["preempt_id"] = uuid.uuid4().hex
+    busy = 0.0
+    
+    while True:
+        remaining = None if cost is None else max(cost - busy, 0.0)
+        # Only a call that ran start to finish under one ticket says anything about speed
+        whole_call = busy == 0.0
+        async with agent_pool.ticket(cost=remaining) as agent_ticket, \
+                model_pool.ticket(cost=remaining) as model_ticket:
+            if busy >= timeout:
+                raise asyncio.TimeoutError()
+            started = time.monotonic()
+            watcher = None
+            if preemptible:
+                watcher = asyncio.ensure_future(
+                    request_pause(endpoint, payload["preempt_id"], [agent_ticket, model_ticket])
+                )
+            try:
+                async with get_agent_session().post(
+                    endpoint, json=payload, timeout=aiohttp.ClientTimeout(total=timeout - busy)
+                ) as response:
+                    status = response.status
+                    data = await response.json(content_type=None) if status == 200 else {}
+            finally:
+                if watcher is not None:
+                    watcher.cancel()
+            busy += time.monotonic() - started
+            # Failed calls, including a 200 carrying an agent's error text, count
+            # against the adaptive concurrency limits
+            agent_ticket.dropped = model_ticket.dropped = status != 200
+            if status != 200:
+                return status, data, busy
+            
+            if not whole_call:
+                # Re-evaluating the prompt and partial output is the cost of resuming
+                metrics.observe("preemption.overhead_seconds", data.get("first_token_seconds") or 0.0, pool=pool)
+            if data.get("done", True):
+                answer = data.get("answer", "")
+                agent_ticket.dropped = model_ticket.dropped = is_error_response(answer)
+                if whole_call and not agent_ticket.dropped:
+                    agent_ticket.expected = model_ticket.expected = latency_predictor.expected(
+                        pool, len(payload["question"]), len(answer)
+                    )
+                return status, data, busy
+        
+        metrics.incr("preemption.count", pool=pool)
+        logger.info(f"Preempted {pool} after {busy:.1f}s ({data.get('generated_chars', 0)} chars so far)")
+
+async def request_pause(endpoint: str, preempt_id: str, tickets: List[Ticket]) -> None:
+    """
+    Ask the agent to pause a call once it has run PREEMPTION_SLICE seconds and one of
+    the pools it holds `tickets` in has a call waiting that should run first (see
+    Bulkhead.should_preempt). Cancelled when the call returns first.
+    """
+    await asyncio.sleep(PREEMPTION_SLICE)
+    while not any(ticket.bulkhead.should_preempt(ticket) for ticket in tickets):
+        await asyncio.sleep(PREEMPTION_POLL_INTERVAL)
+    pause_url = endpoint.rsplit("/", 1)[0] + "/pause"
+    try:
+        async with get_agent_session().post(
+            pause_url, json={"id": preempt_id}, timeout=aiohttp.ClientTimeout(total=5)
+        ) as response:
+            await response.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f"Could not pause call {preempt_id}: {e}")
+
 # -------------------- ORCHESTRATOR DIALOGUE FUNCTIONS --------------------
 
+INTRO_PROMPT_PREFIX = """You are the AI-Chat Manager.
+
+Write a short, friendly message explaining that you're forwarding the user's request to the specialist named below.
+Be conversational and brief. Do NOT repeat or rephrase their question back to them - they already know what they asked for.
+For example: "I'll connect you with our math expert for this" or "Let me get our programming specialist on this right away."
+
+"""
+
+FOLLOWUP_PROMPT_PREFIX = """You are the AI-Chat Project Manager leading a team of specialized AI agents.
+Your specialist has just answered the user's question below with valuable information.
+
+Write a brief, friendly closing remark or follow-up question. Be concise and natural.
+For example: "I hope that helps with your question! Let me know if you need further clarification."
+
+"""
+
 async def generate_intro(agent_type: AgentType, user_input: str) -> str:
     """
     Generate an introduction message when delegating to an agent.
@@ -249,16 +830,12 @@ async def generate_intro(agent_type: AgentType, user_input: str) -> str:
     config = AGENT_CONFIG[agent_type]
     specialty = config["specialty"]
     
-    prompt = f"""You are the AI-Chat Manager. The user said: "{user_input}"
+    prompt = f"""The user said: "{user_input}"
 
 You've decided to consult your specialist for {specialty}.
-
-Write a short, friendly message explaining that you're forwarding their request to the specialist. 
-Be conversational and brief. Do NOT repeat or rephrase their question back to them - they already know what they asked for.
-For example: "I'll connect you with our math expert for this" or "Let me get our programming specialist on this right away."
 """
     
-    intro = await call_llama_async(prompt)
+    intro = await call_llama_async(prompt, prefix=INTRO_PROMPT_PREFIX, priority=COSMETIC)
     return sanitize_text(intro)
 
 async def generate_followup(agent_type: AgentType, user_input: str, agent_response: str) -> str:
@@ -274,19 +851,28 @@ async def generate_followup(agent_type: AgentType, user_input: str, agent_respon
         A natural follow-up message
     """
     # Keep the prompt simple to avoid prompt injection risks
-    prompt = f"""You are the AI-Chat Project Manager leading a team of specialized AI agents. 
-The user asked: "{user_input}"
-Your specialist responded with valuable information.
-
-Write a brief, friendly closing remark or follow-up question. Be concise and natural.
-For example: "I hope that helps with your question! Let me know if you need further clarification."
+    prompt = f"""The user asked: "{user_input}"
 """
     
-    followup = await call_llama_async(prompt)
+    followup = await call_llama_async(prompt, prefix=FOLLOWUP_PROMPT_PREFIX, priority=COSMETIC)
     return sanitize_text(followup)
 
 # -------------------- EVALUATION AND GUIDANCE --------------------
 
+EVALUATION_PROMPT_PREFIX = """As the AI-Chat Project Manager, you're evaluating a specialized AI's response.
+
+Evaluate ONLY if the response is:
+1) Relevant to the user's question
+2) Technically accurate
+3) Complete enough to be helpful
+
+Output format:
+SATISFACTORY
+or
+NEEDS_IMPROVEMENT: <specific guidance on what's missing or incorrect>
+
+"""
+
 async def evaluate_response(user_input: str, agent_type: AgentType, agent_reply: str) -> Tuple[bool, str]:
     """
     Evaluate if the agent's response is satisfactory.
@@ -305,23 +891,14 @@ async def evaluate_response(user_input: str, agent_type: AgentType, agent_reply:
     # Truncate very long responses for the evaluator
     truncated_reply = agent_reply[:1500] + "..." if len(agent_reply) > 1500 else agent_reply
     
-    prompt = f"""As the AI-Chat Project Manager, you're evaluating a specialized AI's response for {specialty}.
+    prompt = f"""The specialist's area: {specialty}
 
 User question: "{user_input}"
 Specialist response: "{truncated_reply}"
 
-Evaluate ONLY if the response is:
-1) Relevant to the user's question
-2) Technically accurate
-3) Complete enough to be helpful
-
-Output format:
-SATISFACTORY
-or
-NEEDS_IMPROVEMENT: <specific guidance on what's missing or incorrect>
-"""
+Evaluation:"""
     
-    evaluation = await call_llama_async(prompt)
+    evaluation = await call_llama_async(prompt, prefix=EVALUATION_PROMPT_PREFIX)
     evaluation = evaluation.strip()
     
     logger.info(f"Evaluation result: {evaluation[:50]}...")
@@ -338,6 +915,32 @@ NEEDS_IMPROVEMENT: <specific guidance on what's missing or incorrect>
         # If format isn't followed, assume it needs improvement
         return False, "Please provide a more helpful response to the user's question."
 
+async def assess_response(user_input: str, agent_type: AgentType, agent_reply: str) -> Tuple[bool, str]:
+    """
+    Judge an agent's response, calling the LLM evaluator only when cheap checks can't decide.
+    
+    Args:
+        user_input: The user's original query
+        agent_type: Which agent provided the response
+        agent_reply: The agent's response
+        
+    Returns:
+        Tuple of (is_satisfactory, guidance)
+    """
+    verdict, guidance = check_answer(agent_type.value, user_input, agent_reply)
+    metrics.incr("quality_gate.verdicts", agent=agent_type.value, verdict=verdict)
+    
+    if verdict == PASS:
+        metrics.incr("evaluator.calls_avoided")
+        return True, ""
+    if verdict == FAIL:
+        metrics.incr("evaluator.calls_avoided")
+        logger.info(f"Quality gate rejected {agent_type.value} answer: {guidance}")
+        return False, guidance
+    
+    metrics.incr("evaluator.calls")
+    return await evaluate_response(user_input, agent_type, agent_reply)
+
 async def generate_retry_message(agent_type: AgentType) -> str:
     """
     Generate a message indicating the orchestrator is refining the response.
@@ -361,9 +964,843 @@ Write a short, natural transition message to the user. For example:
 Keep it brief and conversational.
 """
     
-    retry_msg = await call_llama_async(prompt)
+    retry_msg = await call_llama_async(prompt, priority=COSMETIC)
     return sanitize_text(retry_msg)
 
+# -------------------- SPECULATIVE SELF-ANSWER --------------------
+
+def start_speculation(user_input: str, level: int) -> Optional[Tuple[asyncio.Task, float]]:
+    """
+    Start answering the query as AgentType.SELF before the route is known.
+    
+    Args:
+        user_input: The user's query
+        level: Current overload level; speculation is the first work shed
+        
+    Returns:
+        Tuple of (running task, start time), or None if speculation is disabled or shed
+    """
+    if not SPECULATIVE_SELF_ENABLED:
+        return None
+    if level >= SKIP_FOLLOWUP:
+        # A miss throws the generation away, so never spend llama3.2 slots on it under load
+        metrics.incr("overload.degraded", stage="speculation")
+        return None
+    return asyncio.create_task(query_agent(AgentType.SELF, user_input)), time.monotonic()
+
+async def resolve_speculation(speculation: Optional[Tuple[asyncio.Task, float]], agent_type: AgentType) -> Optional[str]:
+    """
+    Use the speculative answer if the query was routed to SELF, otherwise cancel it.
+    
+    Args:
+        speculation: Value returned by start_speculation
+        agent_type: The routing decision
+        
+    Returns:
+        The speculative answer on a hit, None on a miss or when not speculating
+    """
+    if speculation is None:
+        return None
+    
+    task, started_at = speculation
+    elapsed = time.monotonic() - started_at
+    if agent_type == AgentType.SELF:
+        # Everything generated while routing ran is latency taken off the critical path
+        metrics.incr("speculation.hits")
+        metrics.observe("speculation.saved_seconds", elapsed)
+        result = await task
+    else:
+        metrics.incr("speculation.misses")
+        metrics.observe("speculation.wasted_seconds", elapsed)
+        task.cancel()
+        result = None
+    
+    hits = metrics.counter("speculation.hits")
+    metrics.set_gauge("speculation.hit_rate", hits / (hits + metrics.counter("speculation.misses")))
+    return result
+
+# -------------------- HEDGED REQUESTS --------------------
+
+def hedge_candidates(user_input: str, agent_type: AgentType) -> List[AgentType]:
+    """
+    Pick the specialists to query in parallel for an ambiguous route.
+    
+    Args:
+        user_input: The user's query
+        agent_type: The routing decision, always queried first
+        
+    Returns:
+        The chosen agent followed by any close runners-up, within the hedging caps
+    """
+    if not HEDGING_ENABLED or agent_type == AgentType.SELF:
+        return [agent_type]
+    if fast_router.examples < FAST_ROUTER_MIN_EXAMPLES:
+        return [agent_type]
+    
+    probs = fast_router.predict_proba(user_input)
+    top = max(probs.values())
+    runners_up = sorted(
+        (AgentType(label) for label, p in probs.items()
+         if top - p <= HEDGE_MARGIN and label not in (agent_type.value, AgentType.SELF.value)),
+        key=lambda agent: probs[agent.value],
+        reverse=True,
+    )
+    
+    extra = min(len(runners_up), HEDGE_MAX_AGENTS - 1, HEDGE_MAX_INFLIGHT - hedge_inflight)
+    if runners_up and extra <= 0:
+        metrics.incr("hedge.skipped", reason="cap")
+    return [agent_type] + runners_up[:max(extra, 0)]
+
+async def hedged_query(candidates: List[AgentType], user_input: str) -> Tuple[AgentType, str]:
+    """
+    Query several agents in parallel and keep the first satisfactory answer.
+    
+    "Satisfactory" here means the answer passes the cheap quality-gate checks; the LLM
+    evaluator is too slow to sit on the hedging critical path.
+    
+    The remaining calls are cancelled, which also stops their retry loops and closes
+    their connections, so the agents stop generating the losing answers. If no answer
+    is satisfactory, the first candidate's answer is returned.
+    
+    Args:
+        candidates: Agents to query, the routing decision first
+        user_input: The user's query
+        
+    Returns:
+        Tuple of (agent that answered, answer)
+    """
+    global hedge_inflight
+    extra = len(candidates) - 1
+    hedge_inflight += extra
+    metrics.incr("hedge.requests")
+    metrics.incr("hedge.extra_calls", extra)
+    
+    tasks = {asyncio.create_task(query_agent(agent, user_input)): agent for agent in candidates}
+    answers: Dict[AgentType, str] = {}
+    winner = None
+    try:
+        pending = set(tasks)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                agent = tasks[task]
+                answers[agent] = task.result()
+                verdict, _ = check_answer(agent.value, user_input, answers[agent])
+                if winner is None and verdict != FAIL:
+                    winner = agent
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+                metrics.incr("hedge.cancelled")
+        hedge_inflight -= extra
+    
+    if winner is None:
+        winner = candidates[0]
+    metrics.incr("hedge.wins", agent=winner.value, primary=winner == candidates[0])
+    logger.info(f"Hedged across {[agent.value for agent in candidates]}, {winner.value} answered first")
+    return winner, answers.get(winner, "")
+
+# -------------------- QUEUE STATUS --------------------
+
+async def with_queue_status(awaitable, companion: Optional[asyncio.Task] = None):
+    """
+    Await a call, streaming its queue position while it waits for a bulkhead slot.
+    
+    Args:
+        awaitable: The call to run, e.g. query_agent(...)
+        companion: Optional task producing an SSE message to show while the call runs,
+            e.g. the intro. It is shown only if it finishes first; otherwise it is cancelled.
+        
+    Yields:
+        (sse_data, None) for each queue update, then (None, result) once the call returns
+    """
+    watching = []
+    token = queue_watch.set(watching)
+    try:
+        # The task copies the current context, so its bulkhead tickets land in `watching`
+        task = asyncio.ensure_future(awaitable)
+    finally:
+        queue_watch.reset(token)
+    
+    try:
+        timeout = 0.1  # report promptly the first time, then every QUEUE_STATUS_INTERVAL
+        while True:
+            waiting_on = {task} if companion is None else {task, companion}
+            done, _ = await asyncio.wait(waiting_on, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if task in done:
+                break
+            if companion in done:
+                if companion.result() is not None:
+                    yield companion.result(), None
+                companion = None
+                continue
+            timeout = QUEUE_STATUS_INTERVAL
+            for ticket in list(watching):
+                if ticket.waiting:
+                    status = {
+                        "status": "queued",
+                        "pool": ticket.bulkhead.name,
+                        "position": ticket.position,
+                        "eta": round(ticket.eta, 1),
+                    }
+                    yield f"data: {json.dumps(status)}\n\n", None
+    finally:
+        if not task.done():
+            task.cancel()
+        if companion is not None and not companion.done():
+            companion.cancel()
+    
+    yield None, task.result()
+
+# -------------------- ANSWER REFINEMENT --------------------
+
+async def refine_answer(
+    request_id: str,
+    user_input: str,
+    agent_type: AgentType,
+    answer: str,
+    answer_latency: float,
+    deadline: float,
+    verdict: Optional[Dict] = None,
+):
+    """
+    Run the refinement controller on an agent's answer and stream its progress.
+    
+    The retry message is generated alongside the agent's revision and only shown if
+    it is ready when the revised answer arrives, so it never adds latency.
+    
+    Args:
+        request_id: The request being refined
+        user_input: The user's query
+        agent_type: The agent that answered
+        answer: The sanitized answer to evaluate
+        answer_latency: Seconds the answer took to generate
+        deadline: time.monotonic() value the request must finish by
+        verdict: Optional dict whose "satisfactory" is set when an evaluation accepts
+            the latest answer
+        
+    Yields:
+        Tuple of (SSE data string, latest answer)
+    """
+    controller = RefinementController(assess_response, call_agent, REFINEMENT_MAX_ROUNDS)
+    retry_task = None
+    
+    async for step in controller.run(user_input, agent_type, answer, answer_latency, deadline):
+        event = step["event"]
+        if event == "evaluation":
+            if step["round"] == 0:
+                await log_evaluation(request_id, agent_type, step["satisfactory"], step["guidance"])
+            if step["satisfactory"]:
+                metrics.incr("refinement.satisfactory", round=step["round"])
+                if verdict is not None:
+                    verdict["satisfactory"] = True
+            status = {"status": "refinement", "round": step["round"], "satisfactory": step["satisfactory"]}
+            yield f"data: {json.dumps(status)}\n\n", answer
+        elif event == "refining":
+            retry_task = asyncio.create_task(generate_retry_message(agent_type))
+        elif event == "refined":
+            answer = sanitize_text(step["answer"])
+            metrics.incr("refinement.rounds")
+            metrics.observe("refinement.round_latency", step["latency"])
+            logger.info(f"Refinement round {step['round']} for {agent_type.value} added {step['latency']:.2f}s")
+            
+            if retry_task is not None and retry_task.done() and not retry_task.cancelled():
+                if is_error_response(retry_task.result()):
+                    metrics.incr("priority.dropped", call="retry_message")
+                else:
+                    yield f"data: {retry_task.result()}\n\n", answer
+            elif retry_task is not None:
+                retry_task.cancel()
+                metrics.incr("priority.dropped", call="retry_message")
+            
+            status = {"status": "refinement", "round": step["round"], "latency": round(step["latency"], 2)}
+            yield f"data: {json.dumps(status)}\n\n", answer
+            yield f"data: {agent_type.value}: {answer}\n\n", answer
+        elif event == "stopped":
+            metrics.incr("refinement.stopped", reason=step["reason"])
+            if retry_task is not None and not retry_task.done():
+                retry_task.cancel()
+
+# -------------------- STARTUP WARM-UP --------------------
+
+async def warm_up() -> None:
+    """
+    Load the orchestrator model and run a priming prompt, retrying until it succeeds.
+    
+    The first real query then skips the cold model load. Load and priming times are
+    recorded in warmup_state and reported by /ready.
+    """
+    loop = asyncio.get_event_loop()
+    model = AGENT_CONFIG[AgentType.SELF]["model"]
+    
+    while True:
+        try:
+            started = time.monotonic()
+            await loop.run_in_executor(None, residency_manager.set_keep_alive, model, -1)
+            load_seconds = time.monotonic() - started
+            
+            started = time.monotonic()
+            reply = await call_llama_async(WARMUP_PROMPT)
+            prime_seconds = time.monotonic() - started
+            if is_error_response(reply):
+                raise RuntimeError(reply)
+            
+            warmup_state["models"][model] = {
+                "status": "ready",
+                "load_seconds": round(load_seconds, 2),
+                "prime_seconds": round(prime_seconds, 2),
+            }
+            logger.info(f"Warmed up {model}: load {load_seconds:.2f}s, priming prompt {prime_seconds:.2f}s")
+            break
+        except Exception as e:
+            warmup_state["models"][model] = {"status": "error", "error": str(e)}
+            logger.warning(f"Warm-up of {model} failed, retrying in {WARMUP_RETRY_DELAY}s: {e}")
+            await asyncio.sleep(WARMUP_RETRY_DELAY)
+    
+    warmup_state["ready"] = True
+
+# -------------------- ROUTING FEEDBACK --------------------
+
+async def log_feedback(
+    record_type: str, request_id: Optional[str], store: Optional[FeedbackStore] = None, **fields
+) -> None:
+    """
+    Append a record to the feedback log without blocking the event loop.
+    
+    Args:
+        record_type: "route", "llm_label", "evaluation", "outcome", "user_feedback" or "latency"
+        request_id: The request the record belongs to, if any
+        store: Log to append to; defaults to the routing feedback log
+        fields: Record payload
+    """
+    store = store or feedback_store
+    try:
+        await asyncio.get_event_loop().run_in_executor(
+            None,
+            lambda: store.append(record_type, request_id, **fields)
+        )
+    except Exception as e:
+        logger.exception(f"Error writing feedback record: {e}")
+
+def update_router_gauges() -> None:
+    """
+    Refresh the derived router metrics from their counters.
+    """
+    decisions = metrics.counter("router.decisions", source="fast") + metrics.counter("router.decisions", source="llm")
+    if decisions:
+        metrics.set_gauge("router.fallback_rate", metrics.counter("router.decisions", source="llm") / decisions)
+    
+    comparisons = metrics.counter("router.comparisons")
+    if comparisons:
+        metrics.set_gauge("router.accuracy", metrics.counter("router.agreements") / comparisons)
+    
+    good = metrics.counter("router.outcomes", result="good")
+    bad = metrics.counter("router.outcomes", result="bad")
+    if good + bad:
+        metrics.set_gauge("router.outcome_accuracy", good / (good + bad))
+    
+    metrics.set_gauge("router.fast_examples", fast_router.examples)
+
+def record_router_agreement(fast_route: AgentType, llm_route: AgentType) -> None:
+    """
+    Score the fast router's prediction against the LLM router's choice.
+    """
+    metrics.incr("router.comparisons")
+    if fast_route == llm_route:
+        metrics.incr("router.agreements")
+    update_router_gauges()
+
+async def shadow_route(request_id: str, user_input: str, fast_route: AgentType) -> None:
+    """
+    Ask the LLM router about a fast-routed query in the background to measure accuracy.
+    """
+    llm_route = await llm_decide_agent(user_input)
+    record_router_agreement(fast_route, llm_route)
+    await log_feedback("llm_label", request_id, question=user_input, llm_route=llm_route.value, shadow=True)
+
+async def record_evaluation(request_id: str, user_input: str, agent_type: AgentType, agent_reply: str) -> None:
+    """
+    Assess a delivered answer and log the verdict.
+    """
+    satisfactory, guidance = await assess_response(user_input, agent_type, agent_reply)
+    await log_evaluation(request_id, agent_type, satisfactory, guidance)
+
+async def log_evaluation(request_id: str, agent_type: AgentType, satisfactory: bool, guidance: str) -> None:
+    """
+    Log an evaluate_response verdict as routing feedback.
+    """
+    metrics.incr("router.outcomes", result="good" if satisfactory else "bad")
+    metrics.incr("evaluations", verdict="satisfactory" if satisfactory else "needs_improvement")
+    update_router_gauges()
+    await log_feedback(
+        "evaluation", request_id,
+        route=agent_type.value,
+        satisfactory=satisfactory,
+        guidance=guidance,
+    )
+
+# -------------------- QUERY PIPELINE --------------------
+
+def start_trace(source: str, request_id: str, client: Tuple[str, float], user_input: str) -> Dict:
+    """
+    Begin the request log entry for a request.
+    
+    Stages add their timings under "stages"; while the entry is set as current_trace,
+    query_agent sets "cache" to "hit" or "miss". "ts" is the arrival time, so replays
+    reproduce the recorded inter-arrival times rather than the completion times.
+    """
+    return {
+        "ts": time.time(),
+        "source": source,
+        "request_id": request_id,
+        "client": client[0],
+        "input": user_input,
+        "route": None,
+        "stages": {},
+        "cache": None,
+    }
+
+def finish_trace(trace: Dict, started: float) -> None:
+    trace["latency"] = round(time.monotonic() - started, 3)
+    if REQUEST_LOG_ENABLED:
+        request_log.record(trace)
+
+def degraded_event(stage: str, level: int) -> str:
+    """
+    Count a pipeline step skipped under overload and return its SSE status event.
+    """
+    metrics.incr("overload.degraded", stage=stage)
+    return f"data: {json.dumps({'status': 'degraded', 'level': LEVEL_NAMES[level], 'skipped': stage})}\n\n"
+
+async def intro_message(agent_type: AgentType, user_input: str) -> Optional[str]:
+    """
+    Generate the intro as an SSE event, or None if it failed or the model was busy.
+    """
+    try:
+        intro = await generate_intro(agent_type, user_input)
+    except asyncio.CancelledError:
+        # The answer arrived first
+        metrics.incr("priority.dropped", call="intro")
+        raise
+    if is_error_response(intro):
+        metrics.incr("priority.dropped", call="intro")
+        return None
+    return f"data: {intro}\n\n"
+
+async def query_events(
+    user_input: str,
+    request_id: str,
+    client: Tuple[str, float],
+    outcome: Optional[Dict] = None,
+    source: str = "query",
+) -> AsyncIterator[str]:
+    """
+    Run the query pipeline, yielding the orchestrator's messages as SSE data strings.
+    
+    Args:
+        user_input: The user's query
+        request_id: ID reported to the client for feedback
+        client: (client id, weight) from identify_client
+        outcome: Optional dict that receives "route" and "answer" once the query succeeds
+        source: What started the query ("query", "job" or "sdk"), for the request log
+        
+    Yields:
+        SSE "data: ..." strings
+    """
+    # Bulkhead tickets taken for this request queue fairly against other clients
+    current_client.set(client)
+    trace = start_trace(source, request_id, client, user_input)
+    current_trace.set(trace)
+    stages = trace["stages"]
+    start_time = time.monotonic()
+    speculation = None
+    evaluated = False
+    try:
+        # Tell the client which request this is so it can send feedback on the answer
+        yield f"data: {json.dumps({'status': 'request', 'request_id': request_id})}\n\n"
+        
+        level = overload_level()
+        speculation = start_speculation(user_input, level)
+        if level >= FAST_ROUTING:
+            yield degraded_event("llm_routing", level)
+        agent_type = await decide_agent(user_input, request_id, fast_only=level >= FAST_ROUTING)
+        speculative_response = await resolve_speculation(speculation, agent_type)
+        trace["route"] = agent_type.value
+        stages["routing"] = round(time.monotonic() - start_time, 3)
+        
+        if RESIDENCY_ENABLED and agent_type != AgentType.SELF:
+            # Load the agent's model while the intro is being written
+            asyncio.create_task(residency_manager.preload_async(AGENT_CONFIG[agent_type]["model"]))
+        
+        if (agent_type == AgentType.SELF):
+            agent_started = time.monotonic()
+            if speculative_response is not None:
+                direct_response = speculative_response
+            else:
+                direct_response = await query_agent(agent_type, user_input)
+            direct_response_sanitized = sanitize_text(direct_response)
+            answer = direct_response_sanitized
+            stages["answer"] = round(time.monotonic() - agent_started, 3)
+            await remember_answer(agent_type, user_input, answer)
+            # Send response as regular message
+            response_data = {
+                "message_type": "content",
+                "content": direct_response_sanitized
+            }
+            yield f"data: {json.dumps(response_data)}\n\n"
+        else:
+            # The intro is written while the agent works and dropped if the answer
+            # arrives first, so it never delays the answer
+            level = overload_level()
+            intro_task = None
+            if level >= SKIP_INTRO:
+                yield degraded_event("intro", level)
+            else:
+                intro_task = asyncio.create_task(intro_message(agent_type, user_input))
+            
+            agent_started = time.monotonic()
+            candidates = hedge_candidates(user_input, agent_type)
+            if len(candidates) > 1:
+                agent_call = hedged_query(candidates, user_input)
+            else:
+                agent_call = query_agent(agent_type, user_input)
+            async for data, result in with_queue_status(agent_call, intro_task):
+                if data is not None:
+                    yield data
+            if len(candidates) > 1:
+                agent_type, agent_response = result
+            else:
+                agent_response = result
+            agent_response_sanitized = sanitize_text(agent_response)
+            answer = agent_response_sanitized
+            trace["route"] = agent_type.value
+            stages["answer"] = round(time.monotonic() - agent_started, 3)
+            yield f"data: {agent_type.value}: {agent_response_sanitized}\n\n"
+            
+            if REFINEMENT_ENABLED and not is_error_response(answer):
+                evaluated = True
+                refinement_started = time.monotonic()
+                verdict = {"satisfactory": False}
+                async for data, answer in refine_answer(
+                    request_id, user_input, agent_type, answer,
+                    time.monotonic() - agent_started,
+                    start_time + REQUEST_LATENCY_BUDGET,
+                    verdict,
+                ):
+                    yield data
+                agent_response_sanitized = answer
+                stages["refinement"] = round(time.monotonic() - refinement_started, 3)
+                # Only an answer the evaluator accepted is worth serving again
+                if verdict["satisfactory"]:
+                    await remember_answer(agent_type, user_input, answer)
+            else:
+                await remember_answer(agent_type, user_input, answer)
+            
+            level = overload_level()
+            if level >= SKIP_FOLLOWUP:
+                yield degraded_event("followup", level)
+            else:
+                followup_started = time.monotonic()
+                followup = await generate_followup(agent_type, user_input, agent_response_sanitized)
+                stages["followup"] = round(time.monotonic() - followup_started, 3)
+                followup_sanitized = sanitize_text(followup)
+                if is_error_response(followup_sanitized):
+                    metrics.incr("priority.dropped", call="followup")
+                else:
+                    yield f"data: {followup_sanitized}\n\n"
+        
+        latency = time.monotonic() - start_time
+        metrics.observe("query.latency", latency, agent=agent_type.value)
+        await log_feedback(
+            "outcome", request_id,
+            route=agent_type.value,
+            latency=latency,
+            answer_chars=len(answer),
+            error=is_error_response(answer),
+        )
+        if not evaluated and not is_error_response(answer) and random.random() < EVALUATION_SAMPLE_RATE:
+            asyncio.create_task(record_evaluation(request_id, user_input, agent_type, answer))
+        if outcome is not None:
+            outcome.update(route=agent_type.value, answer=answer)
+        trace.update(answer_chars=len(answer), error=is_error_response(answer))
+    except Exception as e:
+        logger.exception(f"Error processing query: {e}")
+        trace["error"] = True
+        error_message = "I'm sorry, there was an error processing your request. Please try again."
+        yield f"data: {error_message}\n\n"
+    finally:
+        # Don't leave a speculative generation running if routing failed or the client left
+        if speculation is not None and not speculation[0].done():
+            speculation[0].cancel()
+        if "error" not in trace:
+            # The client went away before the answer
+            trace["aborted"] = True
+        finish_trace(trace, start_time)
+
+# -------------------- ASYNC JOBS --------------------
+
+def notify_job(job_id: str) -> None:
+    update = job_updates.pop(job_id, None)
+    if update is not None:
+        update.set()
+
+def watch_job(job_id: str) -> asyncio.Event:
+    """
+    Return an event that is set when the job next has news. Call it before reading
+    the store, so news arriving between the read and the wait is not missed.
+    """
+    return job_updates.setdefault(job_id, asyncio.Event())
+
+async def wait_for_job(update: asyncio.Event, timeout: float) -> None:
+    """
+    Wait until the event from watch_job is set, or for at most `timeout` seconds.
+    """
+    try:
+        await asyncio.wait_for(update.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+async def run_job(job: Dict) -> None:
+    """
+    Run a queued job through the query pipeline, storing each message as an event.
+    """
+    loop = asyncio.get_event_loop()
+    job_id = job["id"]
+    await loop.run_in_executor(None, job_store.set_status, job_id, RUNNING)
+    
+    outcome = {}
+    async for data in query_events(job["user_input"], job_id, (job["client"], job["weight"]), outcome, source="job"):
+        await loop.run_in_executor(None, job_store.add_event, job_id, event_payload(data))
+        notify_job(job_id)
+    
+    status = DONE if outcome and not is_error_response(outcome["answer"]) else FAILED
+    await loop.run_in_executor(None, job_store.finish, job_id, status, outcome.get("route"), outcome.get("answer"))
+    metrics.incr("jobs.finished", status=status)
+    notify_job(job_id)
+
+async def job_worker(queue: asyncio.Queue) -> None:
+    """
+    Run jobs from the queue one at a time. A job interrupted by shutdown stays
+    "running" in the store and is queued again on the next start.
+    
+    Jobs queue for slots in the background lane, behind live queries.
+    """
+    current_lane.set(BACKGROUND)
+    loop = asyncio.get_event_loop()
+    while True:
+        job_id = await queue.get()
+        metrics.set_gauge("jobs.queued", queue.qsize())
+        job = await loop.run_in_executor(None, job_store.get, job_id)
+        if job is None or job["status"] != QUEUED:
+            continue
+        try:
+            await run_job(job)
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed: {e}")
+            await loop.run_in_executor(None, job_store.finish, job_id, FAILED, None, None)
+            metrics.incr("jobs.finished", status=FAILED)
+            notify_job(job_id)
+
+async def purge_jobs() -> None:
+    """
+    Periodically delete finished jobs older than JOB_RESULT_TTL.
+    """
+    while True:
+        await asyncio.sleep(JOB_PURGE_INTERVAL)
+        await asyncio.get_event_loop().run_in_executor(None, job_store.purge, JOB_RESULT_TTL)
+
+# -------------------- BATCH QUERIES --------------------
+
+async def answer_batch_question(
+    index: int,
+    item: Dict,
+    route: Optional[AgentType],
+    routing_limit: asyncio.Semaphore,
+    agent_limits: Dict[AgentType, asyncio.Semaphore],
+    with_intro: bool,
+    with_followup: bool,
+) -> Dict:
+    """
+    Route and answer one question of a batch.
+    
+    Returns:
+        The NDJSON record for the question, with the time its agent call started
+        under "_agent_started" for the throughput summary
+    """
+    started = time.monotonic()
+    request_id = str(uuid.uuid4())
+    user_input = item["user_input"]
+    trace = start_trace("batch", request_id, current_client.get() or ANONYMOUS_CLIENT, user_input)
+    current_trace.set(trace)
+    
+    try:
+        if route is None:
+            async with routing_limit:
+                route = await decide_agent(user_input, request_id)
+        trace["stages"]["routing"] = round(time.monotonic() - started, 3)
+        
+        if route not in batch_agent_limits:
+            batch_agent_limits[route] = asyncio.Semaphore(BATCH_AGENT_CONCURRENCY[route])
+        async with agent_limits[route], batch_agent_limits[route]:
+            agent_started = time.monotonic()
+            answer = sanitize_text(await query_agent(route, user_input))
+        trace["stages"]["answer"] = round(time.monotonic() - agent_started, 3)
+        if not REFINEMENT_ENABLED or route == AgentType.SELF:
+            # With refinement on, /query only caches answers the evaluator accepted
+            await remember_answer(route, user_input, answer)
+    except Exception as e:
+        # One failed question must not end the batch
+        logger.exception(f"Error answering batch question {index}: {e}")
+        route = route or AgentType.SELF
+        agent_started = started
+        answer = f"An error occurred: {str(e)}"
+    error = is_error_response(answer)
+    latency = time.monotonic() - started
+    
+    record = {
+        "index": index,
+        "id": item.get("id", index),
+        "request_id": request_id,
+        "route": route.value,
+        "answer": answer,
+        "error": error,
+        "latency": round(latency, 3),
+        "_agent_started": agent_started,
+    }
+    if route != AgentType.SELF and not error:
+        if with_intro:
+            record["intro"] = await generate_intro(route, user_input)
+        if with_followup:
+            record["followup"] = await generate_followup(route, user_input, answer)
+    
+    trace.update(route=route.value, answer_chars=len(answer), error=error)
+    finish_trace(trace, started)
+    metrics.incr("batch.questions", agent=route.value, error=error)
+    metrics.observe("batch.latency", latency, agent=route.value)
+    await log_feedback(
+        "outcome", request_id,
+        route=route.value,
+        latency=latency,
+        answer_chars=len(answer),
+        error=error,
+    )
+    return record
+
+def batch_concurrency(requested: Dict[AgentType, int]) -> Dict[AgentType, int]:
+    """
+    Per-agent batch limits: BATCH_AGENT_CONCURRENCY, lowered where the caller asked for less.
+    """
+    return {
+        agent: max(1, min(requested.get(agent, limit), limit))
+        for agent, limit in BATCH_AGENT_CONCURRENCY.items()
+    }
+
+async def run_batch(
+    items: List[Dict],
+    route: Optional[AgentType],
+    concurrency: Dict[AgentType, int],
+    with_intro: bool,
+    with_followup: bool,
+) -> AsyncIterator[Dict]:
+    """
+    Answer a batch of questions, yielding each record as soon as it is ready and
+    finally a {"summary": ...} record with per-agent throughput.
+    
+    Args:
+        items: Questions as {"user_input": ..., optional "id": ...}
+        route: Send every question to this agent instead of routing
+        concurrency: Questions each agent works on at the same time for this batch;
+            all batches together stay within BATCH_AGENT_CONCURRENCY
+        with_intro: Add an intro to each specialist answer
+        with_followup: Add a follow-up to each specialist answer
+    """
+    started = time.monotonic()
+    routing_limit = asyncio.Semaphore(BATCH_ROUTING_CONCURRENCY)
+    agent_limits = {agent: asyncio.Semaphore(limit) for agent, limit in concurrency.items()}
+    tasks = [
+        asyncio.ensure_future(answer_batch_question(
+            index, item, route, routing_limit, agent_limits, with_intro, with_followup
+        ))
+        for index, item in enumerate(items)
+    ]
+    # Agent -> questions, errors, first call start, last finish
+    agents: Dict[str, Dict] = {}
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            record = await next_done
+            agent_started = record.pop("_agent_started")
+            stats = agents.setdefault(record["route"], {"questions": 0, "errors": 0, "first": agent_started, "last": 0.0})
+            stats["questions"] += 1
+            stats["errors"] += int(record["error"])
+            stats["first"] = min(stats["first"], agent_started)
+            stats["last"] = time.monotonic()
+            yield record
+    finally:
+        # The client went away; don't keep answering for nobody
+        for task in tasks:
+            task.cancel()
+    
+    elapsed = time.monotonic() - started
+    summary = {
+        "questions": len(items),
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(items) / elapsed, 3),
+        "agents": {},
+    }
+    for agent, stats in agents.items():
+        busy = max(stats["last"] - stats["first"], 1e-6)
+        throughput = stats["questions"] / busy
+        metrics.observe("batch.throughput", throughput, agent=agent)
+        summary["agents"][agent] = {
+            "questions": stats["questions"],
+            "errors": stats["errors"],
+            "seconds": round(busy, 3),
+            "throughput": round(throughput, 3),
+        }
+    logger.info(f"Batch of {len(items)} questions finished in {elapsed:.1f}s")
+    yield {"summary": summary}
+
+# -------------------- CLIENTS --------------------
+
+def identify_client(request: Request) -> Tuple[str, float]:
+    """
+    Return (client id, weight) for a request.
+    
+    API keys are hashed so they never appear in logs or metrics. A key that is not
+    configured counts for nothing: the request is identified by its IP address.
+    """
+    api_key = request.headers.get(API_KEY_HEADER)
+    if api_key and (api_key in API_KEYS or api_key in CLIENT_WEIGHTS):
+        client = "key-" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+        return client, CLIENT_WEIGHTS.get(api_key, 1.0)
+    if api_key:
+        metrics.incr("clients.unknown_key")
+    host = request.client.host if request.client else "unknown"
+    return host, CLIENT_WEIGHTS.get(host, 1.0)
+
+def check_rate_limit(client: Tuple[str, float]) -> Optional[JSONResponse]:
+    """
+    Count a request against the client's rate limit.
+    
+    Returns:
+        None if the request may proceed, otherwise a 429 response with Retry-After
+    """
+    client_id, weight = client
+    metrics.incr("clients.requests", client=client_label(client_id))
+    if not RATE_LIMIT_ENABLED:
+        return None
+    retry_after = rate_limiter.check(client_id, weight)
+    if retry_after is None:
+        return None
+    metrics.incr("clients.rate_limited", client=client_label(client_id))
+    logger.warning(f"Rate limiting {client_id} for {retry_after:.1f}s")
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many requests. Please slow down."},
+        headers={"Retry-After": str(max(1, round(retry_after)))},
+    )
+
 # --------------------------------------------------------------------
 #                          FASTAPI ENDPOINTS
 # --------------------------------------------------------------------
@@ -377,45 +1814,295 @@ async def handle_query(request: Request):
         request: The incoming HTTP request with user_input parameter
         
     Returns:
-        Streamed SSE response with the orchestrator's messages
+        Streamed SSE response with the orchestrator's messages, a 429 with Retry-After
+        when the client is over its rate limit, or a 503 with Retry-After when the
+        cluster is overloaded
     """
     user_input = request.query_params.get("user_input", "").strip()
     
     if not user_input:
         raise HTTPException(status_code=400, detail="Missing or empty user_input parameter")
     
+    request_id = str(uuid.uuid4())
+    client = identify_client(request)
+    
+    limited = check_rate_limit(client)
+    if limited is not None:
+        return limited
+    
+    if overload_level() >= REJECT:
+        metrics.incr("overload.rejected")
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "The cluster is overloaded. Please try again later."},
+            headers={"Retry-After": str(OVERLOAD_RETRY_AFTER)},
+        )
+    
+    return EventSourceResponse(query_events(user_input, request_id, client))
+
+@app.post("/jobs")
+async def submit_job(request: Request):
+    """
+    Queue a query to run in the background.
+    
+    Args:
+        request: JSON body with user_input
+        
+    Returns:
+        202 with the job ID and where to fetch its result, a 429 with Retry-After when
+        the client is over its rate limit, or a 503 when the job queue is full
+    """
+    data = await request.json()
+    user_input = str(data.get("user_input", "")).strip()
+    if not user_input:
+        raise HTTPException(status_code=400, detail="Missing or empty user_input")
+    
+    client = identify_client(request)
+    limited = check_rate_limit(client)
+    if limited is not None:
+        return limited
+    
+    queue = app.state.job_queue
+    if queue.qsize() >= JOB_MAX_QUEUED:
+        metrics.incr("jobs.rejected")
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Too many queued jobs. Please try again later."},
+            headers={"Retry-After": str(OVERLOAD_RETRY_AFTER)},
+        )
+    
+    job_id = str(uuid.uuid4())
+    await asyncio.get_event_loop().run_in_executor(None, job_store.create, job_id, user_input, client)
+    queue.put_nowait(job_id)
+    metrics.incr("jobs.submitted")
+    metrics.set_gauge("jobs.queued", queue.qsize())
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job_id, "status": QUEUED, "result": f"/jobs/{job_id}", "events": f"/jobs/{job_id}/events"},
+    )
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Return a job's status, its messages so far and, once finished, its answer.
+    """
+    loop = asyncio.get_event_loop()
+    job = await loop.run_in_executor(None, job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    events = await loop.run_in_executor(None, job_store.events_since, job_id, 0)
+    return job_view(job, events)
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job(job_id: str, request: Request):
+    """
+    Stream a job's messages as SSE, from the start or after the Last-Event-ID header.
+    
+    Each event's SSE id is its sequence number, so a reconnecting EventSource picks up
+    where it left off. The stream ends with {"status": "job", "state": "done"|"failed"}.
+    """
+    loop = asyncio.get_event_loop()
+    if await loop.run_in_executor(None, job_store.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    last_seen = request.headers.get("Last-Event-ID", "0")
+    seq = int(last_seen) if last_seen.isdigit() else 0
+    
     async def event_generator():
-        try:
-            agent_type = await decide_agent(user_input)
-            
-            if (agent_type == AgentType.SELF):
-                direct_response = await query_agent(agent_type, user_input)
-                direct_response_sanitized = sanitize_text(direct_response)
-                # Send response as regular message
-                response_data = {
-                    "message_type": "content",
-                    "content": direct_response_sanitized
-                }
-                yield f"data: {json.dumps(response_data)}\n\n"
-            else:
-                intro = await generate_intro(agent_type, user_input)
-                intro_sanitized = sanitize_text(intro)
-                yield f"data: {intro_sanitized}\n\n"
-                
-                agent_response = await query_agent(agent_type, user_input)
-                agent_response_sanitized = sanitize_text(agent_response)
-                yield f"data: {agent_type.value}: {agent_response_sanitized}\n\n"
-                
-                followup = await generate_followup(agent_type, user_input, agent_response_sanitized)
-                followup_sanitized = sanitize_text(followup)
-                yield f"data: {followup_sanitized}\n\n"
-        except Exception as e:
-            logger.exception(f"Error processing query: {e}")
-            error_message = "I'm sorry, there was an error processing your request. Please try again."
-            yield f"data: {error_message}\n\n"
+        nonlocal seq
+        while True:
+            update = watch_job(job_id)
+            # Check the status first, so events added just before it finished are not missed
+            job = await loop.run_in_executor(None, job_store.get, job_id)
+            for event_seq, data in await loop.run_in_executor(None, job_store.events_since, job_id, seq):
+                seq = event_seq
+                yield {"id": str(seq), "data": data}
+            if job is None or job["status"] in (DONE, FAILED):
+                state = job["status"] if job is not None else "expired"
+                yield {"data": json.dumps({"status": "job", "state": state})}
+                return
+            await wait_for_job(update, JOB_POLL_INTERVAL)
     
     return EventSourceResponse(event_generator())
 
+@app.post("/batch")
+async def handle_batch(request: Request):
+    """
+    Answer a list of questions, streaming one JSON line per answer as each finishes.
+    
+    Body:
+        questions: List of strings, or of {"id": ..., "user_input": ...}
+        skip_intro / skip_followup: Leave out the intro and follow-up (default true)
+        route: Optional agent to send every question to, skipping routing
+        concurrency: Optional {agent: n} to lower BATCH_AGENT_CONCURRENCY
+        
+    Returns:
+        NDJSON stream of {"index", "id", "request_id", "route", "answer", "error",
+        "latency"} records in completion order, ending with a {"summary": ...} line
+        that reports throughput per agent; 429 or 503 when the client is over its
+        rate limit or the cluster is overloaded
+    """
+    data = await request.json()
+    questions = data.get("questions")
+    if not isinstance(questions, list) or not questions:
+        raise HTTPException(status_code=400, detail="Missing or empty questions list")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    
+    items = []
+    for question in questions:
+        if isinstance(question, str):
+            item = {"user_input": question}
+        elif isinstance(question, dict):
+            item = dict(question)
+        else:
+            raise HTTPException(status_code=400, detail="Each question must be a string or an object")
+        item["user_input"] = str(item.get("user_input", "")).strip()
+        if not item["user_input"]:
+            raise HTTPException(status_code=400, detail="Every question needs a non-empty user_input")
+        items.append(item)
+    
+    try:
+        route = AgentType(data["route"]) if data.get("route") else None
+        requested = {AgentType(agent): int(n) for agent, n in (data.get("concurrency") or {}).items()}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    concurrency = batch_concurrency(requested)
+    
+    # A batch counts as one request against the client's rate limit; its calls queue
+    # fairly against other clients' in the bulkheads
+    client = identify_client(request)
+    limited = check_rate_limit(client)
+    if limited is not None:
+        return limited
+    
+    if overload_level() >= REJECT:
+        metrics.incr("overload.rejected")
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "The cluster is overloaded. Please try again later."},
+            headers={"Retry-After": str(OVERLOAD_RETRY_AFTER)},
+        )
+    
+    async def ndjson_lines():
+        current_client.set(client)
+        current_lane.set(BACKGROUND)
+        async for record in run_batch(
+            items, route, concurrency,
+            with_intro=not data.get("skip_intro", True),
+            with_followup=not data.get("skip_followup", True),
+        ):
+            yield json.dumps(record) + "\n"
+    
+    metrics.incr("batch.requests")
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+@app.post("/feedback")
+async def submit_feedback(request: Request):
+    """
+    Record a user's thumbs-up or thumbs-down on an answer.
+    
+    Args:
+        request: JSON body with request_id and rating ("up" or "down")
+        
+    Returns:
+        Confirmation that the feedback was recorded
+    """
+    data = await request.json()
+    request_id = str(data.get("request_id", "")).strip()
+    rating = data.get("rating")
+    
+    if not request_id or rating not in ("up", "down"):
+        raise HTTPException(status_code=400, detail="Expected request_id and rating of 'up' or 'down'")
+    
+    await log_feedback("user_feedback", request_id, rating=rating)
+    metrics.incr("feedback.user", rating=rating)
+    metrics.incr("router.outcomes", result="good" if rating == "up" else "bad")
+    update_router_gauges()
+    return {"status": "recorded"}
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Report orchestrator metrics.
+    
+    Returns:
+        Counters, gauges and summaries, plus semantic cache and bulkhead statistics
+    """
+    snapshot = metrics.snapshot()
+    snapshot["semantic_cache"] = semantic_cache.stats()
+    snapshot["timeouts"] = {agent.value: timeouts.snapshot() for agent, timeouts in agent_timeouts.items()}
+    snapshot["timeouts"][llama_client.model_name] = llama_timeouts.snapshot()
+    snapshot["bulkheads"] = {
+        bulkhead.name: bulkhead.snapshot()
+        for bulkhead in list(agent_bulkheads.values()) + list(model_bulkheads.values())
+    }
+    snapshot["timestamp"] = time.time()
+    return snapshot
+
+def log_replay_result(future: asyncio.Future) -> None:
+    """
+    Report a failed latency predictor replay; the predictor then starts cold.
+    """
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Latency predictor replay failed: {future.exception()!r}")
+
+@app.on_event("startup")
+async def start_background_tasks():
+    """
+    Start warm-up, the routing learner, latency predictor training, model residency
+    maintenance, the job workers and the request log writer.
+    """
+    app.state.background_tasks = [
+        asyncio.create_task(warm_up()),
+        asyncio.create_task(routing_learner.run()),
+    ]
+    # Relearn call latencies for SJF scheduling from the log, off the event loop
+    app.state.latency_replay = asyncio.get_event_loop().run_in_executor(
+        None, latency_predictor.replay, latency_store, LATENCY_REPLAY_WINDOW
+    )
+    app.state.latency_replay.add_done_callback(log_replay_result)
+    
+    # Resume the jobs left unfinished by the last run
+    app.state.job_queue = asyncio.Queue()
+    loop = asyncio.get_event_loop()
+    for job in await loop.run_in_executor(None, job_store.requeue_unfinished):
+        # The job starts over; mark where in its events that happened
+        await loop.run_in_executor(None, job_store.add_event, job["id"], json.dumps({"status": "requeued"}))
+        app.state.job_queue.put_nowait(job["id"])
+    if app.state.job_queue.qsize():
+        logger.info(f"Requeued {app.state.job_queue.qsize()} unfinished jobs")
+    app.state.background_tasks += [asyncio.create_task(job_worker(app.state.job_queue)) for _ in range(JOB_WORKERS)]
+    app.state.background_tasks.append(asyncio.create_task(purge_jobs()))
+    if REQUEST_LOG_ENABLED:
+        app.state.background_tasks.append(asyncio.create_task(request_log.run()))
+    if RESIDENCY_ENABLED:
+        app.state.background_tasks.append(asyncio.create_task(residency_manager.run(RESIDENCY_INTERVAL)))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    """
+    Stop the background tasks, close the Ollama and agent connection pools and write
+    out the request log and semantic cache.
+    """
+    for task in app.state.background_tasks:
+        task.cancel()
+    await llama_client.close()
+    if agent_session is not None:
+        await agent_session.close()
+    request_log.flush()
+    semantic_cache.close()
+
+@app.get("/ready")
+async def readiness():
+    """
+    Readiness probe for load balancers.
+    
+    Returns:
+        200 once the orchestrator model is warmed up, 503 before that
+    """
+    status_code = 200 if warmup_state["ready"] else 503
+    return JSONResponse(status_code=status_code, content=warmup_state)
+
 @app.get("/health")
 async def health_check():
     """
@@ -474,7 +2161,12 @@ async def index():
         "endpoints": {
             "/": "This help information",
             "/query": "Main query endpoint (requires user_input parameter)",
-            "/health": "System health and status information"
+            "/batch": "Answer a list of questions, streamed back as NDJSON (POST, JSON body)",
+            "/jobs": "Queue a query to run in the background (POST, JSON body); poll /jobs/{id} or stream /jobs/{id}/events",
+            "/health": "System health and status information",
+            "/ready": "Readiness probe; 503 until startup warm-up finishes",
+            "/feedback": "Record thumbs-up/down on an answer (POST, JSON body)",
+            "/metrics": "Router, cache and latency metrics"
         }
     }
 
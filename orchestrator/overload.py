@@ -0,0 +1,89 @@
+# overload.py
+
+import logging
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+from metrics import metrics
+
+logger = logging.getLogger("overload")
+
+# Degradation levels, each including the ones before it
+NORMAL = 0
+SKIP_FOLLOWUP = 1
+SKIP_INTRO = 2
+FAST_ROUTING = 3
+REJECT = 4
+
+LEVEL_NAMES = ["normal", "skip_followup", "skip_intro", "fast_routing", "reject"]
+
+
+class OverloadController:
+    """
+    Turn queue depth and queueing delay into a degradation level.
+
+    Load is the larger of queued calls / `queue_capacity` and queueing delay /
+    `delay_target`, so 1.0 means "at capacity". Queueing delay is the mean time calls
+    admitted over the last `delay_window` seconds spent waiting for a slot, or the wait
+    of the oldest call still queued if that is longer. It measures how far demand
+    exceeds the slots, not how long answers take, so a single long generation on an
+    idle cluster does not count as load. Each threshold in `thresholds` switches on one
+    more level, in the order of LEVEL_NAMES. Wait samples expire, so the controller
+    recovers on its own once the queues drain.
+    """
+
+    def __init__(
+        self,
+        queue_depth: Callable[[], int],
+        thresholds: List[float],
+        queue_capacity: int,
+        delay_target: float,
+        oldest_wait: Optional[Callable[[], float]] = None,
+        delay_window: float = 30.0,
+    ):
+        if len(thresholds) != REJECT:
+            raise ValueError(f"Expected {REJECT} thresholds, got {len(thresholds)}")
+        self.queue_depth = queue_depth
+        self.thresholds = thresholds
+        self.queue_capacity = queue_capacity
+        self.delay_target = delay_target
+        self.oldest_wait = oldest_wait
+        self.delay_window = delay_window
+        # (admitted_at, seconds waited)
+        self._waits: deque = deque()
+        self._last_level = NORMAL
+
+    def observe_wait(self, seconds: float) -> None:
+        """
+        Record how long one call waited for a slot before it was admitted.
+        """
+        self._waits.append((time.monotonic(), seconds))
+
+    def queue_delay(self) -> float:
+        cutoff = time.monotonic() - self.delay_window
+        while self._waits and self._waits[0][0] < cutoff:
+            self._waits.popleft()
+        recent = sum(seconds for _, seconds in self._waits) / len(self._waits) if self._waits else 0.0
+        # Calls stuck in the queue count before anything is admitted
+        return max(recent, self.oldest_wait() if self.oldest_wait is not None else 0.0)
+
+    def load(self) -> float:
+        return max(
+            self.queue_depth() / max(self.queue_capacity, 1),
+            self.queue_delay() / self.delay_target,
+        )
+
+    def level(self) -> int:
+        """
+        Return the current degradation level.
+        """
+        load = self.load()
+        level = sum(1 for threshold in self.thresholds if load >= threshold)
+
+        metrics.set_gauge("overload.load", round(load, 3))
+        metrics.set_gauge("overload.level", level)
+        if level != self._last_level:
+            logger.warning(f"Overload level {LEVEL_NAMES[self._last_level]} -> {LEVEL_NAMES[level]} (load {load:.2f})")
+            self._last_level = level
+        return level
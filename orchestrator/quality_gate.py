@@ -0,0 +1,120 @@
+# quality_gate.py
+
+import ast
+import re
+from typing import List, Tuple
+
+from utils import is_error_response
+
+PASS = "pass"
+FAIL = "fail"
+UNSURE = "unsure"
+
+# Matched at the start of the answer only; hedges inside an answer ("I can't be certain,
+# but ...") are not refusals
+REFUSAL_PATTERNS = [
+    r"(I'm|I am) (sorry,? but )?(unable|not able) to (help|assist|answer|provide|do)",
+    r"I can(not|'t) (help|assist|answer|provide|comply)",
+    r"(I'm|I am) sorry,? but I can(not|'t)",
+    r"I won't be able to (help|assist|answer|provide)",
+]
+# A refusal is the whole reply, not an aside before a real answer
+REFUSAL_MAX_CHARS = 300
+# "... but here is ...": the sentence goes on to answer after all
+REFUSAL_CONTINUES_PATTERN = r"[^.!?\n]*\b(but|however|although|though)\b"
+
+# Code fence with an optional language tag
+CODE_BLOCK_PATTERN = r"```[ \t]*([\w+#-]*)[^\n]*\n(.*?)```"
+
+MATH_TASK_PATTERN = (
+    r"\d\s*[-+*/^x×÷]\s*\d|\b(calculate|compute|solve|evaluate|simplify|how (many|much)|find|"
+    r"derivative|integral|sum|product|probability|value of)\b"
+)
+MATH_PROOF_PATTERN = r"\b(prove|proof|show that|explain|why)\b"
+# A number stated as a result: "= 42", "is 3.5", "answer: -1/2", "\boxed{7}"
+FINAL_NUMBER_PATTERN = r"(=|≈|\bis\b|\banswer\b:?|\bequals\b|\\boxed\{)\s*\$?\s*-?\d+([.,/]\d+)?"
+
+
+def _is_truncated(answer: str) -> bool:
+    if answer.count("```") % 2 == 1:
+        return True
+    if "<think>" in answer and "</think>" not in answer:
+        return True
+    # A long answer that stops mid-sentence was most likely cut off by a timeout or token limit
+    return len(answer) > 200 and answer.rstrip()[-1:] in (",", ":", "(", "[", "{", "=", "+", "-")
+
+
+def _is_refusal(answer: str) -> bool:
+    answer = answer.strip()
+    if len(answer) > REFUSAL_MAX_CHARS:
+        return False
+    for pattern in REFUSAL_PATTERNS:
+        match = re.match(pattern, answer, flags=re.IGNORECASE)
+        if match and not re.match(REFUSAL_CONTINUES_PATTERN, answer[match.end():], flags=re.IGNORECASE):
+            return True
+    return False
+
+
+def _python_blocks(answer: str) -> List[str]:
+    # Untagged blocks are as likely to be shell, JavaScript or output as Python, so
+    # only blocks tagged as Python are syntax-checked
+    return [
+        code for language, code in re.findall(CODE_BLOCK_PATTERN, answer, flags=re.DOTALL)
+        if language.lower() in ("python", "py", "python3")
+    ]
+
+
+def _check_coding(answer: str) -> Tuple[str, str]:
+    blocks = _python_blocks(answer)
+    if not blocks:
+        return UNSURE, ""
+
+    for code in blocks:
+        try:
+            ast.parse(code)
+        except SyntaxError as e:
+            return FAIL, f"The Python code has a syntax error ({e.msg} on line {e.lineno}). Fix the code."
+    return PASS, ""
+
+
+def _check_math(question: str, answer: str) -> Tuple[str, str]:
+    if re.search(MATH_PROOF_PATTERN, question, flags=re.IGNORECASE) or not re.search(
+        MATH_TASK_PATTERN, question, flags=re.IGNORECASE
+    ):
+        # Proofs and conceptual questions have no single number to look for
+        return UNSURE, ""
+
+    if re.search(FINAL_NUMBER_PATTERN, answer[-400:], flags=re.IGNORECASE):
+        return PASS, ""
+    if re.search(r"\d", question) and not re.search(r"\d", answer):
+        # Numbers in, no numbers out; symbolic questions ("derivative of sin x") stay unsure
+        return FAIL, "State the final numeric result explicitly."
+    return UNSURE, ""
+
+
+def check_answer(agent: str, question: str, answer: str) -> Tuple[str, str]:
+    """
+    Run cheap deterministic checks on an agent's answer.
+
+    Args:
+        agent: The agent's AgentType value
+        question: The user's question
+        answer: The answer to check
+
+    Returns:
+        Tuple of (PASS, FAIL or UNSURE, guidance for the agent when it fails)
+    """
+    if is_error_response(answer):
+        return FAIL, "The previous attempt failed. Please answer the question."
+
+    if _is_refusal(answer):
+        return FAIL, "Answer the question directly instead of declining."
+
+    if _is_truncated(answer):
+        return FAIL, "The answer was cut off. Please give the complete answer."
+
+    if agent == "agent_coding":
+        return _check_coding(answer)
+    if agent == "agent_math":
+        return _check_math(question, answer)
+    return UNSURE, ""
@@ -0,0 +1,66 @@
+# rate_limit.py
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Allow `rate` events per second on average, with bursts of up to `burst`.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """
+        Take a token. Returns 0.0 if one was available, otherwise the seconds until one is.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class ClientRateLimiter:
+    """
+    One token bucket per client, created on first use.
+
+    A client's rate and burst are scaled by its weight. Only the `max_clients` most
+    recently seen clients are tracked; an evicted client starts again with a full
+    bucket, which is no more than a new client would get.
+    """
+
+    def __init__(self, per_minute: float, burst: int, max_clients: int = 10000):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, client: str, weight: float = 1.0) -> Optional[float]:
+        """
+        Count a request from this client.
+
+        Returns:
+            None if the request is allowed, otherwise the seconds to wait before retrying
+        """
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = TokenBucket(self.rate * weight, max(self.burst * weight, 1))
+                self._buckets[client] = bucket
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+            wait = bucket.take()
+        return wait if wait > 0 else None
@@ -0,0 +1,143 @@
+# refinement.py
+
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Tuple
+
+from utils import is_error_response
+
+logger = logging.getLogger("refinement")
+
+# (user_input, agent_type, answer) -> (is_satisfactory, guidance)
+Evaluator = Callable[[str, object, str], Awaitable[Tuple[bool, str]]]
+# (agent_type, prompt) -> answer
+Refiner = Callable[[object, str], Awaitable[str]]
+
+
+def build_refinement_prompt(user_input: str, previous_answer: str, guidance: str) -> str:
+    """
+    Ask the agent to revise its own answer instead of starting over.
+    """
+    return f"""The user asked: "{user_input}"
+
+Your previous answer:
+{previous_answer}
+
+Reviewer feedback: {guidance}
+
+Revise your previous answer to address the feedback. Keep what was already correct and reply with the complete improved answer only."""
+
+
+class RefinementController:
+    """
+    Evaluate an agent's answer and refine it while the request's latency budget allows.
+
+    Each round costs one evaluation plus one agent call. A round is only started if
+    the predicted cost (the slowest agent call seen so far, plus the last evaluation)
+    fits in the time left before the deadline. Predictions can be wrong (an agent call
+    may spend minutes in retries), so every evaluation and agent call is also cut off
+    at the deadline, keeping the answer it had.
+    """
+
+    def __init__(self, evaluate: Evaluator, refine: Refiner, max_rounds: int):
+        self.evaluate = evaluate
+        self.refine = refine
+        self.max_rounds = max_rounds
+
+    async def run(
+        self,
+        user_input: str,
+        agent_type: object,
+        answer: str,
+        answer_latency: float,
+        deadline: float,
+    ) -> AsyncIterator[Dict]:
+        """
+        Refine an answer, yielding one event per step.
+
+        Args:
+            user_input: The user's query
+            agent_type: The agent that produced the answer
+            answer: The agent's first answer
+            answer_latency: Seconds the first answer took, used to predict a round's cost
+            deadline: time.monotonic() value by which the request must finish
+
+        Yields:
+            {"event": "evaluation", "round", "satisfactory", "guidance", "latency"} after each evaluation,
+            {"event": "refining", "round", "guidance"} before an agent call,
+            {"event": "refined", "round", "answer", "latency"} with each new answer,
+            {"event": "stopped", "round", "reason"} when the loop ends without a satisfactory answer
+            ("max_rounds", "budget" or "agent_error")
+        """
+        agent_cost = answer_latency
+        round_number = 0
+
+        while True:
+            started = time.monotonic()
+            try:
+                satisfactory, guidance = await asyncio.wait_for(
+                    self.evaluate(user_input, agent_type, answer), deadline - started
+                )
+            except asyncio.TimeoutError:
+                logger.info(f"Evaluation in round {round_number} ran out of budget")
+                yield {"event": "stopped", "round": round_number, "reason": "budget"}
+                return
+            eval_cost = time.monotonic() - started
+            yield {
+                "event": "evaluation",
+                "round": round_number,
+                "satisfactory": satisfactory,
+                "guidance": guidance,
+                "latency": eval_cost,
+            }
+
+            if satisfactory:
+                return
+            if round_number >= self.max_rounds:
+                yield {"event": "stopped", "round": round_number, "reason": "max_rounds"}
+                return
+
+            remaining = deadline - time.monotonic()
+            if agent_cost + eval_cost > remaining:
+                logger.info(
+                    f"Skipping refinement round {round_number + 1}: predicted "
+                    f"{agent_cost + eval_cost:.1f}s, {remaining:.1f}s left in budget"
+                )
+                yield {"event": "stopped", "round": round_number, "reason": "budget"}
+                return
+
+            round_number += 1
+            yield {"event": "refining", "round": round_number, "guidance": guidance}
+
+            started = time.monotonic()
+            try:
+                refined = await asyncio.wait_for(
+                    self.refine(agent_type, build_refinement_prompt(user_input, answer, guidance)),
+                    deadline - started,
+                )
+            except asyncio.TimeoutError:
+                logger.info(f"Refinement round {round_number} ran out of budget")
+                yield {"event": "stopped", "round": round_number, "reason": "budget"}
+                return
+            refine_cost = time.monotonic() - started
+            agent_cost = max(agent_cost, refine_cost)
+
+            if is_error_response(refined):
+                # Keep the previous answer rather than replacing it with an error string
+                yield {"event": "stopped", "round": round_number, "reason": "agent_error"}
+                return
+            answer = refined
+
+            yield {
+                "event": "refined",
+                "round": round_number,
+                "answer": answer,
+                # Latency this round added to the request: the evaluation that asked for it plus the agent call
+                "latency": eval_cost + refine_cost,
+            }
+
+            if round_number >= self.max_rounds:
+                # Don't pay for an evaluation that could not lead to another round
+                yield {"event": "stopped", "round": round_number, "reason": "max_rounds"}
+                return
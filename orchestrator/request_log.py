@@ -0,0 +1,86 @@
+# request_log.py
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from metrics import metrics
+from utils import rotate_file
+
+logger = logging.getLogger("request_log")
+
+# Record of the request the current task serves; pipeline stages add to it
+# (e.g. query_agent notes whether the semantic cache answered)
+current_trace: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("current_trace", default=None)
+
+
+class RequestLog:
+    """
+    JSONL log of every request, for replay with tools/replay_requests.py.
+
+    `record` only appends to an in-memory buffer, so it never blocks the event loop;
+    `run` writes the buffer out every `flush_interval` seconds from an executor.
+    When the file passes `max_bytes` it is rotated to path.1, path.2, ... keeping
+    `backups` old files. If the writer falls behind by `max_buffer` records, new ones
+    are dropped and counted rather than growing memory without bound.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 50 * 1024 * 1024,
+        backups: int = 5,
+        flush_interval: float = 1.0,
+        max_buffer: int = 10000,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: deque = deque()
+        self._write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def record(self, entry: Dict) -> None:
+        if len(self._buffer) >= self.max_buffer:
+            metrics.incr("request_log.dropped")
+            return
+        entry.setdefault("ts", time.time())
+        self._buffer.append(entry)
+
+    def flush(self) -> int:
+        """
+        Write out the buffered records. Blocking; returns the number written.
+        """
+        with self._write_lock:
+            lines = []
+            while self._buffer:
+                lines.append(json.dumps(self._buffer.popleft()) + "\n")
+            if not lines:
+                return 0
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+            if os.path.getsize(self.path) >= self.max_bytes:
+                rotate_file(self.path, self.backups)
+                logger.info(f"Rotated request log {self.path}")
+        metrics.incr("request_log.written", len(lines))
+        return len(lines)
+
+    async def run(self) -> None:
+        """
+        Flush the buffer every `flush_interval` seconds until cancelled.
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await loop.run_in_executor(None, self.flush)
+            except OSError as e:
+                logger.error(f"Error writing request log: {e}")
@@ -0,0 +1,210 @@
+# residency.py
+
+import asyncio
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+import requests
+
+from metrics import metrics
+
+logger = logging.getLogger("residency")
+
+
+def normalize_model_name(name: str) -> str:
+    """
+    Map Ollama's "llama3.2:latest" style names onto the names used in AGENT_CONFIG.
+    """
+    return name[:-len(":latest")] if name.endswith(":latest") else name
+
+
+def read_meminfo(path: str = "/proc/meminfo") -> Dict[str, int]:
+    """
+    Read /proc/meminfo into a dict of byte counts.
+    """
+    info = {}
+    with open(path) as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            parts = value.split()
+            if parts:
+                info[key] = int(parts[0]) * (1024 if len(parts) > 1 and parts[1] == "kB" else 1)
+    return info
+
+
+class ModelResidencyManager:
+    """
+    Decide which Ollama models stay loaded on a shared host.
+
+    Pinned models (the orchestrator's own) are kept loaded indefinitely. Other models
+    are preloaded as soon as a query is routed to them, and when free memory drops
+    below the reserve, the unpinned model with the lowest predicted demand is unloaded.
+    Demand is an exponentially decayed request count, so a model used in bursts a few
+    minutes ago still outranks one used once an hour ago, unlike plain LRU.
+
+    Loading a model can block for minutes, so the blocking work runs one call at a time
+    on a thread of its own rather than on the default executor, which the semantic
+    cache, request log and job store need meanwhile. A preload for a model that is
+    already being preloaded only counts towards its demand.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        pinned: List[str],
+        keep_alive: str = "30m",
+        min_free_fraction: float = 0.15,
+        demand_half_life: float = 300.0,
+        request_timeout: float = 120.0,
+    ):
+        self.base_url = base_url
+        self.pinned = set(pinned)
+        self.keep_alive = keep_alive
+        self.min_free_fraction = min_free_fraction
+        self.decay_rate = math.log(2) / demand_half_life
+        self.request_timeout = request_timeout
+
+        self.demand: Dict[str, float] = {}
+        self.demand_updated: Dict[str, float] = {}
+        # Last known resident size of each model, used to plan room before a load
+        self.model_sizes: Dict[str, int] = {}
+        self.loaded: Dict[str, int] = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="residency")
+        # Models with a preload queued or running
+        self._preloading: Set[str] = set()
+
+    # -------------------- Demand prediction --------------------
+
+    def predicted_demand(self, model: str, now: Optional[float] = None) -> float:
+        now = now if now is not None else time.monotonic()
+        elapsed = now - self.demand_updated.get(model, now)
+        return self.demand.get(model, 0.0) * math.exp(-self.decay_rate * elapsed)
+
+    def record_demand(self, model: str) -> None:
+        now = time.monotonic()
+        self.demand[model] = self.predicted_demand(model, now) + 1.0
+        self.demand_updated[model] = now
+
+    # -------------------- Host state --------------------
+
+    def memory_free_fraction(self) -> float:
+        info = read_meminfo()
+        return info.get("MemAvailable", 0) / max(info.get("MemTotal", 1), 1)
+
+    def refresh_loaded(self) -> Dict[str, int]:
+        """
+        Ask Ollama which models are loaded. Blocking.
+        """
+        response = requests.get(f"{self.base_url}/api/ps", timeout=5)
+        response.raise_for_status()
+        self.loaded = {
+            normalize_model_name(m["name"]): m.get("size", 0)
+            for m in response.json().get("models", [])
+        }
+        self.model_sizes.update(self.loaded)
+        return self.loaded
+
+    def set_keep_alive(self, model: str, keep_alive) -> None:
+        """
+        Load a model for keep_alive (-1 pins it, 0 unloads it). Blocking.
+        """
+        # An empty prompt loads (or, with keep_alive 0, unloads) a model without generating
+        response = requests.post(
+            f"{self.base_url}/api/generate",
+            json={"model": model, "keep_alive": keep_alive},
+            timeout=self.request_timeout,
+        )
+        response.raise_for_status()
+
+    # -------------------- Actions (blocking) --------------------
+
+    def pin_models(self) -> None:
+        """
+        Load pinned models with no expiry.
+
+        Requests that don't set keep_alive (e.g. the ollama CLI) reset a model to the
+        server default, so this is repeated on every maintenance pass.
+        """
+        for model in self.pinned:
+            self.set_keep_alive(model, -1)
+
+    def ensure_capacity(self, needed_bytes: int, protect: str) -> None:
+        """
+        Unload low-demand models until needed_bytes fit above the free-memory reserve.
+        """
+        info = read_meminfo()
+        total = max(info.get("MemTotal", 1), 1)
+        available = info.get("MemAvailable", 0)
+
+        candidates = sorted(
+            (m for m in self.loaded if m not in self.pinned and m != protect),
+            key=self.predicted_demand,
+        )
+        for model in candidates:
+            if (available - needed_bytes) / total >= self.min_free_fraction:
+                break
+            logger.info(f"Evicting {model} (predicted demand {self.predicted_demand(model):.2f}) to make room")
+            self.set_keep_alive(model, 0)
+            available += self.loaded.pop(model, 0)
+            metrics.incr("residency.evictions", model=model)
+
+    def preload(self, model: str) -> None:
+        """
+        Make sure a model is loaded before its agent needs it.
+        """
+        self.record_demand(model)
+        self.refresh_loaded()
+        if model in self.loaded:
+            # Already resident; extend its lease
+            self.set_keep_alive(model, -1 if model in self.pinned else self.keep_alive)
+            metrics.incr("residency.preloads", model=model, result="resident")
+            return
+
+        self.ensure_capacity(self.model_sizes.get(model, 0), protect=model)
+        started = time.monotonic()
+        self.set_keep_alive(model, self.keep_alive)
+        metrics.incr("residency.preloads", model=model, result="loaded")
+        metrics.observe("residency.load_seconds", time.monotonic() - started, model=model)
+
+    def maintain(self) -> None:
+        """
+        Re-pin, refresh gauges and relieve memory pressure.
+        """
+        self.pin_models()
+        self.refresh_loaded()
+        self.ensure_capacity(0, protect="")
+
+        metrics.set_gauge("residency.loaded_models", len(self.loaded))
+        metrics.set_gauge("memory.free_fraction", self.memory_free_fraction())
+        for model in self.demand:
+            metrics.set_gauge("residency.predicted_demand", self.predicted_demand(model), model=model)
+
+    # -------------------- Async wrappers --------------------
+
+    async def preload_async(self, model: str) -> None:
+        if model in self._preloading:
+            self.record_demand(model)
+            metrics.incr("residency.preloads", model=model, result="coalesced")
+            return
+        self._preloading.add(model)
+        try:
+            await asyncio.get_event_loop().run_in_executor(self.executor, self.preload, model)
+        except Exception as e:
+            logger.warning(f"Could not preload {model}: {e}")
+        finally:
+            self._preloading.discard(model)
+
+    async def run(self, interval: float = 30.0) -> None:
+        """
+        Maintain residency forever.
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                await loop.run_in_executor(self.executor, self.maintain)
+            except Exception as e:
+                logger.warning(f"Model residency maintenance failed: {e}")
+            await asyncio.sleep(interval)
@@ -0,0 +1,234 @@
+# sdk.py
+"""
+In-process async API for the orchestrator pipeline.
+
+Importing this module loads orchestrator.py, so callers share its Ollama client,
+semantic cache, routers, bulkheads and metrics with the HTTP endpoints in the same
+process; nothing goes over HTTP or SSE. Example:
+
+    import sdk
+
+    result = await sdk.ask("What is the derivative of x^2?")
+    async for message in sdk.stream("Write a haiku about queues"):
+        print(message)
+    answers = await sdk.ask_all(["2+2?", "Reverse a list in Python"])
+
+Like the HTTP endpoints, calls shed work while the cluster is overloaded and are refused
+with Overloaded once it reaches the REJECT level.
+"""
+
+import asyncio
+import time
+import uuid
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+
+import orchestrator
+from bulkhead import BACKGROUND, CRITICAL, current_client, current_lane
+from jobs import decode_event, event_payload
+from metrics import metrics
+from orchestrator import AgentType
+from overload import FAST_ROUTING, REJECT
+from request_log import current_trace
+from utils import is_error_response
+
+DEFAULT_CLIENT = "in-process"
+
+
+class Overloaded(Exception):
+    """
+    Raised instead of starting a call while the cluster is overloaded; the in-process
+    counterpart of the endpoints' 503.
+    """
+
+    def __init__(self, retry_after: float):
+        super().__init__("The cluster is overloaded. Please try again later.")
+        self.retry_after = retry_after
+
+
+def _client(name: str) -> Tuple[str, float]:
+    return name, orchestrator.CLIENT_WEIGHTS.get(name, 1.0)
+
+
+def _admit() -> int:
+    """
+    Return the current overload level, or raise Overloaded if new work is refused.
+    """
+    level = orchestrator.overload_level()
+    if level >= REJECT:
+        metrics.incr("overload.rejected")
+        raise Overloaded(orchestrator.OVERLOAD_RETRY_AFTER)
+    return level
+
+
+async def _isolated(
+    client: Tuple[str, float],
+    make_iterator: Callable[[], AsyncIterator],
+    lane: int = CRITICAL,
+) -> AsyncIterator:
+    """
+    Iterate an async generator in a task of its own.
+
+    The pipeline sets the fair-queuing client and priority lane in its context; running
+    it in a separate task keeps them out of the caller's context. Stopping early
+    cancels the task.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+    async def pump():
+        current_client.set(client)
+        current_lane.set(lane)
+        try:
+            async for item in make_iterator():
+                await queue.put(("item", item))
+        except Exception as e:
+            await queue.put(("error", e))
+        else:
+            await queue.put(("end", None))
+
+    task = asyncio.ensure_future(pump())
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == "end":
+                return
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def ask(question: str, route: Optional[str] = None, client: str = DEFAULT_CLIENT) -> Dict:
+    """
+    Answer one question: route it, query the chosen agent and sanitize the answer.
+
+    Args:
+        question: The user's question
+        route: Agent to use instead of routing, e.g. "agent_math"
+        client: Name the calls are queued and weighted under (see CLIENT_WEIGHTS)
+
+    Returns:
+        {"request_id", "route", "answer", "error", "latency"}; the request_id can be
+        used with /feedback
+
+    Raises:
+        Overloaded: the cluster is refusing new queries
+        ValueError: `route` is not an agent
+    """
+    started = time.monotonic()
+    level = _admit()
+    request_id = str(uuid.uuid4())
+    identity = _client(client)
+    trace = orchestrator.start_trace("sdk", request_id, identity, question)
+    token = current_client.set(identity)
+    trace_token = current_trace.set(trace)
+    try:
+        if route:
+            agent_type = AgentType(route)
+        else:
+            agent_type = await orchestrator.decide_agent(question, request_id, fast_only=level >= FAST_ROUTING)
+        trace["route"] = agent_type.value
+        trace["stages"]["routing"] = round(time.monotonic() - started, 3)
+        agent_started = time.monotonic()
+        answer = orchestrator.sanitize_text(await orchestrator.query_agent(agent_type, question))
+        trace["stages"]["answer"] = round(time.monotonic() - agent_started, 3)
+        if not orchestrator.REFINEMENT_ENABLED or agent_type == AgentType.SELF:
+            # With refinement on, /query only caches answers the evaluator accepted
+            await orchestrator.remember_answer(agent_type, question, answer)
+        trace.update(answer_chars=len(answer), error=is_error_response(answer))
+    except Exception:
+        trace["error"] = True
+        raise
+    finally:
+        current_client.reset(token)
+        current_trace.reset(trace_token)
+        if "error" not in trace:
+            # The caller was cancelled before the answer
+            trace["aborted"] = True
+        orchestrator.finish_trace(trace, started)
+
+    latency = time.monotonic() - started
+    error = trace["error"]
+    metrics.incr("sdk.requests", route=agent_type.value)
+    await orchestrator.log_feedback(
+        "outcome", request_id,
+        route=agent_type.value,
+        latency=latency,
+        answer_chars=len(answer),
+        error=error,
+    )
+    return {
+        "request_id": request_id,
+        "route": agent_type.value,
+        "answer": answer,
+        "error": error,
+        "latency": round(latency, 3),
+    }
+
+
+async def stream(question: str, client: str = DEFAULT_CLIENT) -> AsyncIterator[Union[str, Dict]]:
+    """
+    Run the full /query pipeline and yield its messages as they are produced.
+
+    Yields the same messages /query sends, without the SSE framing: status events
+    ("request", "queued", "degraded", ...) and self answers as dicts, the intro,
+    specialist answer and follow-up as strings.
+
+    Raises:
+        Overloaded: the cluster is refusing new queries
+    """
+    _admit()
+    request_id = str(uuid.uuid4())
+    identity = _client(client)
+    metrics.incr("sdk.streams")
+    async for data in _isolated(identity, lambda: orchestrator.query_events(question, request_id, identity, source="sdk")):
+        yield decode_event(event_payload(data))
+
+
+async def ask_many(
+    questions: List[str],
+    route: Optional[str] = None,
+    concurrency: Optional[Dict[str, int]] = None,
+    with_intro: bool = False,
+    with_followup: bool = False,
+    client: str = DEFAULT_CLIENT,
+) -> AsyncIterator[Dict]:
+    """
+    Answer many questions under the batch limits, yielding records as each finishes.
+
+    Records are those of POST /batch, and the last item is its {"summary": ...}. As
+    with POST /batch, the calls queue in the background lane behind live queries.
+
+    Args:
+        questions: The questions to answer
+        route: Agent to send every question to instead of routing
+        concurrency: {agent: n} to lower BATCH_AGENT_CONCURRENCY
+        with_intro: Add an intro to each specialist answer
+        with_followup: Add a follow-up to each specialist answer
+        client: Name the calls are queued and weighted under
+
+    Raises:
+        Overloaded: the cluster is refusing new queries
+    """
+    _admit()
+    items = [{"user_input": question} for question in questions]
+    agent_type = AgentType(route) if route else None
+    limits = orchestrator.batch_concurrency({AgentType(a): n for a, n in (concurrency or {}).items()})
+    metrics.incr("sdk.batches")
+    async for record in _isolated(
+        _client(client),
+        lambda: orchestrator.run_batch(items, agent_type, limits, with_intro, with_followup),
+        lane=BACKGROUND,
+    ):
+        yield record
+
+
+async def ask_all(questions: List[str], **options) -> List[Dict]:
+    """
+    Answer many questions and return their records in the order of `questions`.
+
+    Takes the same options as ask_many.
+    """
+    records = [record async for record in ask_many(questions, **options) if "summary" not in record]
+    return sorted(records, key=lambda record: record["index"])
@@ -0,0 +1,283 @@
+# semantic_cache.py
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("semantic_cache")
+
+EMBEDDING_DIM = 256
+
+# Rewrites applied before tokenizing so common spellings of the same thing collide
+NORMALIZATIONS = [
+    (r"\^\s*2\b", " squared"),
+    (r"\^\s*3\b", " cubed"),
+    (r"\bsqrt\b", "square root"),
+    (r"\bwhat's\b", "what is"),
+    (r"\bhow's\b", "how is"),
+]
+
+# Filler words that carry no meaning for cache matching
+STOPWORDS = {
+    "a", "an", "the", "of", "is", "are", "was", "what", "whats", "how", "please",
+    "can", "could", "would", "you", "me", "i", "to", "for", "do", "does", "tell",
+    "give", "find", "and", "in", "on", "with",
+}
+
+
+def _tokenize(text: str) -> List[str]:
+    text = text.lower()
+    for pattern, replacement in NORMALIZATIONS:
+        text = re.sub(pattern, replacement, text)
+    tokens = re.findall(r"[a-z0-9]+|[+\-*/=<>]", text)
+    return [t for t in tokens if t not in STOPWORDS]
+
+
+def match_key(text: str) -> str:
+    """
+    The part of a question a cached answer must match exactly.
+
+    Hashed embeddings measure word overlap, so "... over 10 years" and "... over 20
+    years" score as near-duplicates. A hit also needs the same numbers and operators in
+    the same order, and the same set of content words; only stopwords, word order and
+    the spellings in NORMALIZATIONS may differ.
+    """
+    tokens = _tokenize(text)
+    exact = [t for t in tokens if t.isdigit() or not t.isalnum()]
+    words = sorted({t for t in tokens if t.isalnum() and not t.isdigit()})
+    return " ".join(exact) + "|" + " ".join(words)
+
+
+def _bucket(feature: str, dim: int) -> Tuple[int, float]:
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % dim, (1.0 if value >> 63 else -1.0)
+
+
+def embed_text(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """
+    Embed text as a unit vector of hashed word, bigram and character-trigram features.
+
+    This is deterministic and costs no model call, which keeps the cache cheaper than
+    the generation it is meant to skip.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    tokens = _tokenize(text)
+
+    features = [(token, 1.0) for token in tokens]
+    features += [(f"{a} {b}", 0.7) for a, b in zip(tokens, tokens[1:])]
+    for token in tokens:
+        padded = f"#{token}#"
+        features += [(padded[i:i + 3], 0.3) for i in range(len(padded) - 2)]
+
+    for feature, weight in features:
+        index, sign = _bucket(feature, dim)
+        vector[index] += sign * weight
+
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    slot INTEGER PRIMARY KEY,
+    match_key TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    hits INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_by_key ON entries (match_key);
+CREATE INDEX IF NOT EXISTS entries_by_last_used ON entries (last_used);
+CREATE INDEX IF NOT EXISTS entries_by_hits ON entries (hits, last_used);
+"""
+
+
+class SemanticIndex:
+    """
+    Fixed-capacity vector index that persists across restarts.
+
+    Question embeddings live in a memory-mapped float32 array, one slot per entry;
+    answers, match keys and usage counts live in a SQLite file next to it, so neither
+    is held in Python memory. A hit needs an exact match key, so a lookup first fetches
+    the slots with that key through the SQLite index and scores only their vectors:
+    its cost depends on how many entries share the key, not on the size of the index.
+    The vectors take capacity x dim x 4 bytes of disk (1 GB for a million entries at
+    256 dimensions), of which only the slots looked up are paged in.
+
+    When the index is full, a slot is reclaimed by LRU (oldest access) or LFU (fewest
+    hits, oldest access as tie-break), found through SQLite indexes as well. Methods
+    are blocking and thread-safe.
+    """
+
+    def __init__(self, path: str, capacity: int, dim: int = EMBEDDING_DIM, eviction: str = "lru"):
+        if eviction not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy: {eviction}")
+
+        self.path = path
+        self.capacity = capacity
+        self.dim = dim
+        self.eviction = eviction
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # A store of a different shape (capacity or dim changed) is started afresh
+        fresh = not os.path.exists(path) or os.path.getsize(path) != capacity * dim * 4
+        self.vectors = np.memmap(path, dtype=np.float32, mode="w+" if fresh else "r+", shape=(capacity, dim))
+        self._db = sqlite3.connect(os.path.splitext(path)[0] + ".sqlite3", check_same_thread=False)
+        with self._db:
+            self._db.executescript(SCHEMA)
+            if fresh:
+                self._db.execute("DELETE FROM entries")
+
+        # Slots with an answer. A vector written just before a crash, without its
+        # answer, is never scored, since lookups only score slots found in SQLite.
+        self.occupied = np.zeros(capacity, dtype=bool)
+        for (slot,) in self._db.execute("SELECT slot FROM entries WHERE slot < ?", (capacity,)):
+            self.occupied[slot] = True
+        self.size = int(self.occupied.sum())
+        self.evictions = 0
+        self._lock = threading.Lock()
+        if self.size:
+            logger.info(f"Loaded {self.size} cached answers from {path}")
+
+    def _find(self, query: np.ndarray, key: str, threshold: float) -> Optional[int]:
+        slots = [slot for (slot,) in self._db.execute("SELECT slot FROM entries WHERE match_key = ?", (key,))]
+        if not slots:
+            return None
+        # Vectors are unit length, so a dot product is cosine similarity
+        scores = self.vectors[slots] @ query
+        best = int(np.argmax(scores))
+        return slots[best] if scores[best] >= threshold else None
+
+    def search(self, query: np.ndarray, key: str, threshold: float) -> Optional[str]:
+        """
+        Return the answer of the most similar entry with the same match key, if its
+        similarity clears the threshold.
+        """
+        with self._lock:
+            slot = self._find(query, key, threshold)
+            if slot is None:
+                return None
+
+            with self._db:
+                self._db.execute(
+                    "UPDATE entries SET hits = hits + 1, last_used = ? WHERE slot = ?", (time.time(), slot)
+                )
+            (answer,) = self._db.execute("SELECT answer FROM entries WHERE slot = ?", (slot,)).fetchone()
+            return answer
+
+    def add(self, vector: np.ndarray, key: str, answer: str, threshold: float) -> None:
+        """
+        Store an embedding and its answer. An entry the question would already hit is
+        replaced; otherwise a free slot is used, evicting an entry if the index is full.
+        """
+        with self._lock:
+            slot = self._find(vector, key, threshold)
+            if slot is not None:
+                self.vectors[slot] = vector
+                with self._db:
+                    self._db.execute(
+                        "UPDATE entries SET answer = ?, last_used = ? WHERE slot = ?", (answer, time.time(), slot)
+                    )
+                return
+
+            if self.size < self.capacity:
+                slot = int(np.argmin(self.occupied))
+                self.size += 1
+            else:
+                slot = self._victim()
+                self.evictions += 1
+            self.vectors[slot] = vector
+            self.occupied[slot] = True
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (slot, match_key, answer, hits, last_used) VALUES (?, ?, ?, 0, ?)",
+                    (slot, key, answer, time.time()),
+                )
+
+    def close(self) -> None:
+        with self._lock:
+            self.vectors.flush()
+            self._db.close()
+
+    def _victim(self) -> int:
+        order = "last_used" if self.eviction == "lru" else "hits, last_used"
+        (slot,) = self._db.execute(f"SELECT slot FROM entries ORDER BY {order} LIMIT 1").fetchone()
+        return slot
+
+
+class SemanticCache:
+    """
+    Per-agent semantic response cache.
+
+    Questions are embedded and matched against the agent's own index, so a math answer
+    is never returned for a creative prompt that happens to use similar words. A hit
+    needs both the similarity threshold and an exact match_key match. Methods are
+    blocking; call them from an executor inside async code.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        capacity: int,
+        threshold: float,
+        eviction: str = "lru",
+        embed_fn: Callable[[str], np.ndarray] = embed_text,
+    ):
+        self.directory = directory
+        self.capacity = capacity
+        self.threshold = threshold
+        self.eviction = eviction
+        self.embed_fn = embed_fn
+        self.indexes: Dict[str, SemanticIndex] = {}
+        self.hit_count = 0
+        self.miss_count = 0
+        self._lock = threading.Lock()
+
+    def _index(self, agent: str) -> SemanticIndex:
+        with self._lock:
+            if agent not in self.indexes:
+                path = os.path.join(self.directory, f"{agent}.vectors")
+                self.indexes[agent] = SemanticIndex(path, self.capacity, eviction=self.eviction)
+            return self.indexes[agent]
+
+    def get(self, agent: str, question: str) -> Optional[str]:
+        """
+        Look up a cached answer for a semantically equivalent question.
+        """
+        answer = self._index(agent).search(self.embed_fn(question), match_key(question), self.threshold)
+        with self._lock:
+            if answer is None:
+                self.miss_count += 1
+            else:
+                self.hit_count += 1
+        return answer
+
+    def put(self, agent: str, question: str, answer: str) -> None:
+        """
+        Cache an answer under the question's embedding.
+        """
+        self._index(agent).add(self.embed_fn(question), match_key(question), answer, self.threshold)
+
+    def close(self) -> None:
+        with self._lock:
+            for index in self.indexes.values():
+                index.close()
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hit_count + self.miss_count
+        return {
+            "hits": self.hit_count,
+            "misses": self.miss_count,
+            "hit_rate": self.hit_count / lookups if lookups else 0.0,
+            "entries": {agent: index.size for agent, index in self.indexes.items()},
+            "evictions": {agent: index.evictions for agent, index in self.indexes.items()},
+        }
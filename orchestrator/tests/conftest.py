@@ -0,0 +1,7 @@
+# conftest.py
+
+import os
+import sys
+
+# The orchestrator's modules import each other by bare name, as when run from orchestrator/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,100 @@
+# test_ai_clients.py
+
+import asyncio
+import json
+
+from aiohttp import web
+
+from ai_clients import OllamaClient
+
+TIMEOUT_MESSAGE = "Processing took too long. Please try a simpler query."
+
+
+async def start_server(first_chunk_delay: float, resident: bool):
+    """
+    A fake Ollama whose first chunk arrives after `first_chunk_delay` seconds.
+    """
+
+    async def generate(request):
+        await request.read()
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await asyncio.sleep(first_chunk_delay)
+        try:
+            for token, done in (("Hello", False), (" there", True)):
+                await response.write((json.dumps({"response": token, "done": done}) + "\n").encode())
+        except ConnectionResetError:
+            # The client gave up first
+            pass
+        return response
+
+    async def ps(request):
+        return web.json_response({"models": [{"name": "llama3.2:latest"}] if resident else []})
+
+    app = web.Application()
+    app.router.add_post("/api/generate", generate)
+    app.router.add_get("/api/ps", ps)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+
+def generate(first_chunk_delay: float, resident: bool) -> str:
+    async def scenario():
+        runner, url = await start_server(first_chunk_delay, resident)
+        client = OllamaClient(
+            "llama3.2", url, timeout=0.5, first_token_timeout=0.2, stall_timeout=0.2, load_timeout=2.0,
+        )
+        try:
+            return await client.generate("Hi")
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    return asyncio.run(scenario())
+
+
+def test_a_cold_load_may_take_longer_than_the_call_timeout():
+    # The first chunk comes after the 0.5 s call timeout, but within the load timeout
+    assert generate(first_chunk_delay=1.0, resident=False) == "Hello there"
+
+
+def test_a_resident_model_gets_no_extra_time():
+    assert generate(first_chunk_delay=1.0, resident=True) == "Error in LLM processing. Please try again."
+
+
+def test_a_load_longer_than_the_load_timeout_is_abandoned():
+    assert generate(first_chunk_delay=2.5, resident=False) == "Error in LLM processing. Please try again."
+
+
+def test_the_call_timeout_applies_once_tokens_flow():
+    async def scenario():
+        async def generate_slowly(request):
+            await request.read()
+            response = web.StreamResponse()
+            await response.prepare(request)
+            try:
+                for _ in range(20):
+                    await response.write((json.dumps({"response": "x", "done": False}) + "\n").encode())
+                    await asyncio.sleep(0.1)
+            except ConnectionResetError:
+                pass
+            return response
+
+        app = web.Application()
+        app.router.add_post("/api/generate", generate_slowly)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        client = OllamaClient("llama3.2", url, timeout=0.5, first_token_timeout=0.2, stall_timeout=0.2, load_timeout=2.0)
+        try:
+            return await client.generate("Hi")
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    assert asyncio.run(scenario()) == TIMEOUT_MESSAGE
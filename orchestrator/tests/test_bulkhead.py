@@ -0,0 +1,384 @@
+# test_bulkhead.py
+
+import asyncio
+
+import pytest
+
+from bulkhead import BACKGROUND, COSMETIC, CRITICAL, Bulkhead, BulkheadFull, client_label, current_client, current_lane
+
+
+def make_pool(**overrides) -> Bulkhead:
+    config = {"limit": 2, "max_queue": 4, "max_wait": 60, "service_time": 10}
+    config.update(overrides)
+    return Bulkhead("test", **config)
+
+
+async def hold(pool: Bulkhead, release: asyncio.Event, admitted: list, name: str, **ticket_args) -> None:
+    async with pool.ticket(**ticket_args):
+        admitted.append(name)
+        await release.wait()
+
+
+async def settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_admits_up_to_the_limit_and_queues_the_rest():
+    async def scenario():
+        pool = make_pool()
+        release, admitted = asyncio.Event(), []
+        tasks = [asyncio.ensure_future(hold(pool, release, admitted, str(i))) for i in range(3)]
+        await settle()
+        state = (list(admitted), pool.active, len(pool.queue))
+        release.set()
+        await asyncio.gather(*tasks)
+        return state, admitted, pool.active
+
+    (during, active, queued), admitted, active_after = asyncio.run(scenario())
+
+    assert during == ["0", "1"]
+    assert (active, queued) == (2, 1)
+    assert admitted == ["0", "1", "2"]
+    assert active_after == 0
+
+
+def test_rejects_when_the_queue_is_full():
+    async def scenario():
+        pool = make_pool(limit=1, max_queue=1, max_wait=1000)
+        release, admitted = asyncio.Event(), []
+        tasks = [asyncio.ensure_future(hold(pool, release, admitted, str(i))) for i in range(2)]
+        await settle()
+        with pytest.raises(BulkheadFull) as rejected:
+            pool.ticket()
+        release.set()
+        await asyncio.gather(*tasks)
+        return rejected.value
+
+    rejected = asyncio.run(scenario())
+
+    assert rejected.reason == "queue_full"
+    assert rejected.retry_after > 0
+
+
+def test_rejects_up_front_when_the_estimated_wait_is_too_long():
+    async def scenario():
+        # Two calls ahead on a one-slot pool: the next caller is second in the queue,
+        # an estimated 2 * 10 s away, and will only wait 15 s
+        pool = make_pool(limit=1, max_wait=15)
+        release, admitted = asyncio.Event(), []
+        tasks = [asyncio.ensure_future(hold(pool, release, admitted, str(i))) for i in range(2)]
+        await settle()
+        with pytest.raises(BulkheadFull) as rejected:
+            pool.ticket()
+        # A caller willing to wait longer is admitted to the queue
+        pool.ticket(max_wait=30)
+        release.set()
+        await asyncio.gather(*tasks)
+        return rejected.value
+
+    assert asyncio.run(scenario()).reason == "wait_too_long"
+
+
+def test_a_call_still_waiting_at_its_deadline_leaves_the_queue():
+    async def scenario():
+        pool = make_pool(limit=1, service_time=0.01)
+        release, admitted = asyncio.Event(), []
+        holder = asyncio.ensure_future(hold(pool, release, admitted, "holder"))
+        await settle()
+        with pytest.raises(BulkheadFull) as rejected:
+            async with pool.ticket(max_wait=0.05):
+                pass
+        queued = len(pool.queue)
+        release.set()
+        await holder
+        return rejected.value, queued
+
+    rejected, queued = asyncio.run(scenario())
+
+    assert rejected.reason == "deadline"
+    assert queued == 0
+
+
+def test_a_cancelled_waiter_gives_its_place_up():
+    async def scenario():
+        pool = make_pool(limit=1)
+        release, admitted = asyncio.Event(), []
+        holder = asyncio.ensure_future(hold(pool, release, admitted, "holder"))
+        waiter = asyncio.ensure_future(hold(pool, release, admitted, "waiter"))
+        await settle()
+        waiter.cancel()
+        await settle()
+        queued = len(pool.queue)
+        release.set()
+        await holder
+        return queued, admitted, pool.active
+
+    queued, admitted, active = asyncio.run(scenario())
+
+    assert queued == 0
+    assert admitted == ["holder"]
+    assert active == 0
+
+
+def test_cosmetic_calls_do_not_take_the_reserved_slots():
+    async def scenario():
+        pool = make_pool(limit=2, reserved_slots=1)
+        release, admitted = asyncio.Event(), []
+        first = asyncio.ensure_future(hold(pool, release, admitted, "cosmetic 1", priority=COSMETIC))
+        second = asyncio.ensure_future(hold(pool, release, admitted, "cosmetic 2", priority=COSMETIC))
+        await settle()
+        critical = asyncio.ensure_future(hold(pool, release, admitted, "critical"))
+        await settle()
+        during = list(admitted)
+        release.set()
+        await asyncio.gather(first, second, critical)
+        return during
+
+    assert asyncio.run(scenario()) == ["cosmetic 1", "critical"]
+
+
+def test_critical_calls_are_admitted_before_cosmetic_and_background_ones():
+    async def background(pool, release, admitted):
+        current_lane.set(BACKGROUND)
+        await hold(pool, release, admitted, "background")
+
+    async def scenario():
+        pool = make_pool(limit=1)
+        gate, release, admitted = asyncio.Event(), asyncio.Event(), []
+        holder = asyncio.ensure_future(hold(pool, gate, admitted, "holder"))
+        await settle()
+        waiters = [
+            asyncio.ensure_future(background(pool, release, admitted)),
+            asyncio.ensure_future(hold(pool, release, admitted, "cosmetic", priority=COSMETIC)),
+            asyncio.ensure_future(hold(pool, release, admitted, "critical", priority=CRITICAL)),
+        ]
+        await settle()
+        order = [ticket.priority for ticket in pool.ordered_queue()]
+        gate.set()
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        return order, admitted
+
+    order, admitted = asyncio.run(scenario())
+
+    assert order == [CRITICAL, COSMETIC, BACKGROUND]
+    assert admitted == ["holder", "critical", "cosmetic", "background"]
+
+
+def test_background_calls_do_not_count_towards_the_live_queue():
+    async def background(pool, release, admitted, name):
+        current_lane.set(BACKGROUND)
+        await hold(pool, release, admitted, name)
+
+    async def scenario():
+        pool = make_pool(limit=1, max_queue=1, max_wait=1000, background_max_wait=1000)
+        release, admitted = asyncio.Event(), []
+        holder = asyncio.ensure_future(hold(pool, release, admitted, "holder"))
+        await settle()
+        job = asyncio.ensure_future(background(pool, release, admitted, "job"))
+        await settle()
+        # The queue holds one background call, yet a live call still finds room
+        pool.ticket()
+        release.set()
+        await asyncio.gather(holder, job)
+
+    asyncio.run(scenario())
+
+
+def queue_calls(pool: Bulkhead, costs, release: asyncio.Event, admitted: list):
+    return [asyncio.ensure_future(hold(pool, release, admitted, f"{cost:g}s", cost=cost)) for cost in costs]
+
+
+def test_sjf_admits_the_shortest_predicted_call_first():
+    async def scenario():
+        pool = make_pool(limit=1, max_wait=1000, policy="sjf")
+        gate, release, admitted = asyncio.Event(), asyncio.Event(), []
+        holder = asyncio.ensure_future(hold(pool, gate, admitted, "holder"))
+        await settle()
+        waiters = queue_calls(pool, [30, 5, 12], release, admitted)
+        await settle()
+        gate.set()
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        return admitted
+
+    assert asyncio.run(scenario()) == ["holder", "5s", "12s", "30s"]
+
+
+def test_fifo_admits_in_arrival_order():
+    async def scenario():
+        pool = make_pool(limit=1, max_wait=1000, policy="fifo")
+        gate, release, admitted = asyncio.Event(), asyncio.Event(), []
+        holder = asyncio.ensure_future(hold(pool, gate, admitted, "holder"))
+        await settle()
+        waiters = queue_calls(pool, [30, 5, 12], release, admitted)
+        await settle()
+        gate.set()
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        return admitted
+
+    assert asyncio.run(scenario()) == ["holder", "30s", "5s", "12s"]
+
+
+def test_sjf_aging_lets_a_long_waiting_call_overtake_shorter_ones():
+    async def scenario():
+        # At 200 s of cost forgiven per second, a 30 s call that has waited 0.2 s
+        # ranks as -10 s, ahead of a 5 s call that just arrived
+        pool = make_pool(limit=1, max_wait=1000, policy="sjf", aging_rate=200)
+        gate, release, admitted = asyncio.Event(), asyncio.Event(), []
+        holder = asyncio.ensure_future(hold(pool, gate, admitted, "holder"))
+        await settle()
+        waiters = queue_calls(pool, [30], release, admitted)
+        await asyncio.sleep(0.2)
+        waiters += queue_calls(pool, [5], release, admitted)
+        await settle()
+        gate.set()
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        return admitted
+
+    assert asyncio.run(scenario()) == ["holder", "30s", "5s"]
+
+
+def test_sjf_queue_position_feeds_the_up_front_wait_estimate():
+    async def scenario():
+        # A short call slots in ahead of a long queue, so it is not rejected even
+        # though the queue as a whole would take longer than it will wait
+        pool = make_pool(limit=1, max_wait=1000, service_time=10, policy="sjf")
+        release, admitted = asyncio.Event(), []
+        holder = asyncio.ensure_future(hold(pool, release, admitted, "holder"))
+        await settle()
+        waiters = queue_calls(pool, [60, 60, 60], release, admitted)
+        await settle()
+        pool.ticket(max_wait=15, cost=1)
+        with pytest.raises(BulkheadFull):
+            pool.ticket(max_wait=15, cost=90)
+        release.set()
+        await asyncio.gather(holder, *waiters)
+
+    asyncio.run(scenario())
+
+
+async def hold_as(client: str, weight: float, pool: Bulkhead, release: asyncio.Event, admitted: list) -> None:
+    current_client.set((client, weight))
+    await hold(pool, release, admitted, client, cost=10)
+
+
+def admission_order(waiting, policy: str = "fifo"):
+    """
+    Queue calls for (client, weight) pairs in this order behind one busy slot, and
+    return the clients in the order they were admitted.
+    """
+
+    async def scenario():
+        pool = make_pool(limit=1, max_queue=100, max_wait=10000, policy=policy)
+        gate, release, admitted = asyncio.Event(), asyncio.Event(), []
+        holder = asyncio.ensure_future(hold(pool, gate, admitted, "holder"))
+        await settle()
+        waiters = []
+        for client, weight in waiting:
+            waiters.append(asyncio.ensure_future(hold_as(client, weight, pool, release, admitted)))
+            await settle()
+        gate.set()
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        return admitted[1:]
+
+    return asyncio.run(scenario())
+
+
+def test_fair_queuing_alternates_between_clients():
+    order = admission_order([("busy", 1.0)] * 4 + [("other", 1.0)] * 2)
+
+    assert order == ["busy", "other", "busy", "other", "busy", "busy"]
+
+
+def test_fair_queuing_follows_client_weights():
+    order = admission_order([("heavy", 2.0)] * 4 + [("light", 1.0)] * 2)
+
+    # Twice the weight, twice the calls while both are waiting
+    assert order[:3].count("heavy") == 2
+    assert order[:6].count("light") == 2
+
+
+def test_an_idle_client_does_not_bank_credit():
+    async def scenario():
+        pool = make_pool(limit=1, max_queue=100, max_wait=10000)
+        release, admitted = asyncio.Event(), []
+        release.set()
+        # "early" is served alone for a while, then "late" arrives with "early" still busy
+        for _ in range(5):
+            await hold_as("early", 1.0, pool, release, admitted)
+        gate, later = asyncio.Event(), asyncio.Event()
+        holder = asyncio.ensure_future(hold(pool, gate, admitted, "holder"))
+        await settle()
+        waiters = [asyncio.ensure_future(hold_as("early", 1.0, pool, later, admitted)) for _ in range(2)]
+        await settle()
+        waiters += [asyncio.ensure_future(hold_as("late", 1.0, pool, later, admitted)) for _ in range(2)]
+        await settle()
+        gate.set()
+        later.set()
+        await asyncio.gather(holder, *waiters)
+        return admitted[6:]
+
+    # "late" joins at the current virtual time rather than at zero, so it does not catch
+    # up on the calls "early" had alone; the two alternate
+    assert asyncio.run(scenario()) == ["late", "early", "late", "early"]
+
+
+def test_ip_addresses_share_one_metric_label():
+    assert client_label("203.0.113.7") == "anonymous"
+    assert client_label("2001:db8::1") == "anonymous"
+    assert client_label("unknown") == "anonymous"
+    assert client_label("key-0123456789ab") == "key-0123456789ab"
+    assert client_label("in-process") == "in-process"
+
+
+def preemption_check(running_lane: int, running_cost: float, waiting) -> bool:
+    """
+    Admit a call in `running_lane` predicted to take `running_cost` seconds, queue
+    (lane, cost) calls behind it, and ask whether it should be paused for them.
+    """
+
+    async def wait_in_lane(lane, cost, pool, release):
+        # Cosmetic is asked for per call; critical calls go in the task's lane
+        current_lane.set(BACKGROUND if lane == BACKGROUND else CRITICAL)
+        await hold(pool, release, [], "waiter", cost=cost, priority=COSMETIC if lane == COSMETIC else CRITICAL)
+
+    async def scenario():
+        pool = make_pool(limit=1, max_queue=100, max_wait=10000, background_max_wait=10000)
+        release = asyncio.Event()
+        current_lane.set(running_lane)
+        running = pool.ticket(cost=running_cost)
+        await pool.acquire(running)
+        waiters = [asyncio.ensure_future(wait_in_lane(lane, cost, pool, release)) for lane, cost in waiting]
+        await settle()
+        answer = pool.should_preempt(running)
+        pool.release(running)
+        release.set()
+        await asyncio.gather(*waiters)
+        return answer
+
+    return asyncio.run(scenario())
+
+
+def test_preempts_for_a_shorter_call_in_the_same_lane():
+    assert preemption_check(CRITICAL, 60, [(CRITICAL, 5)])
+
+
+def test_does_not_preempt_for_a_longer_call():
+    assert not preemption_check(CRITICAL, 60, [(CRITICAL, 90)])
+
+
+def test_does_not_preempt_a_critical_call_for_a_less_urgent_one():
+    assert not preemption_check(CRITICAL, 60, [(COSMETIC, 1), (BACKGROUND, 1)])
+
+
+def test_preempts_a_background_call_for_a_short_critical_one():
+    assert preemption_check(BACKGROUND, 60, [(CRITICAL, 5)])
+
+
+def test_does_not_preempt_a_call_past_its_predicted_cost():
+    assert not preemption_check(CRITICAL, 0, [(CRITICAL, 5)])
@@ -0,0 +1,86 @@
+# test_concurrency_limit.py
+
+from concurrency_limit import AimdLimit
+
+
+def test_grows_by_one_per_limit_of_busy_calls():
+    limiter = AimdLimit(2, max_limit=8)
+
+    for _ in range(2):
+        limiter.update(1.0, inflight=2, expected=1.0)
+
+    assert limiter.limit == 3
+
+
+def test_does_not_grow_while_the_pool_idles():
+    limiter = AimdLimit(4, max_limit=8)
+
+    for _ in range(20):
+        limiter.update(1.0, inflight=1, expected=1.0)
+
+    assert limiter.limit == 4
+
+
+def test_never_grows_past_the_maximum():
+    limiter = AimdLimit(2, max_limit=3)
+
+    for _ in range(50):
+        limiter.update(1.0, inflight=3, expected=1.0)
+
+    assert limiter.limit == 3
+
+
+def test_backs_off_on_a_dropped_call():
+    limiter = AimdLimit(6, backoff=0.5)
+
+    assert limiter.update(1.0, inflight=6, dropped=True) == 3
+
+
+def test_backs_off_on_a_call_slower_than_its_expected_latency():
+    limiter = AimdLimit(6, backoff=0.5, tolerance=2.0)
+    limiter.update(1.0, inflight=1, expected=1.0)
+
+    assert limiter.update(3.0, inflight=6, expected=1.0) == 3
+
+
+def test_long_answers_at_normal_speed_are_not_slow():
+    limiter = AimdLimit(4, max_limit=8)
+    limiter.update(1.0, inflight=4, expected=1.0)
+
+    # Ten times longer, but so was the answer
+    limiter.update(10.0, inflight=4, expected=10.0)
+
+    assert limiter.limit >= 4
+
+
+def test_calls_without_an_expected_latency_only_grow_the_limit():
+    limiter = AimdLimit(4, max_limit=8)
+
+    for _ in range(4):
+        limiter.update(100.0, inflight=4)
+
+    assert limiter.limit == 5
+    assert limiter.baseline is None
+
+
+def test_never_backs_off_below_the_minimum():
+    limiter = AimdLimit(2, min_limit=1, backoff=0.5)
+
+    for _ in range(10):
+        limiter.update(1.0, inflight=2, dropped=True)
+
+    assert limiter.limit == 1
+
+
+def test_a_sustained_slowdown_becomes_the_new_baseline():
+    limiter = AimdLimit(8, min_limit=1, max_limit=8, backoff=0.5, baseline_smoothing=0.2)
+    limiter.update(1.0, inflight=8, expected=1.0)
+
+    limiter.update(3.0, inflight=8, expected=1.0)
+    assert limiter.limit == 4
+
+    # Once 3x is normal, it no longer triggers backoff and the limit recovers
+    for _ in range(40):
+        limiter.update(3.0, inflight=8, expected=1.0)
+    assert limiter.limit == 8
+    assert 2.5 < limiter.baseline <= 3.0
@@ -0,0 +1,72 @@
+# test_quality_gate.py
+
+from quality_gate import FAIL, PASS, UNSURE, check_answer
+
+
+def verdict(agent, question, answer):
+    return check_answer(agent, question, answer)[0]
+
+
+def test_error_fallbacks_fail():
+    assert verdict("agent_math", "2+2?", "") == FAIL
+    assert verdict("agent_coding", "sort a list", "Error processing the coding query. Please try again.") == FAIL
+
+
+def test_short_refusal_fails():
+    result, guidance = check_answer("agent_creative", "Write a poem", "I'm sorry, but I can't help with that.")
+    assert result == FAIL
+    assert "directly" in guidance
+
+
+def test_refusal_that_goes_on_to_answer_is_not_a_refusal():
+    answer = "I can't be certain, but here is a poem about the sea: waves fold into waves."
+    assert verdict("agent_creative", "Write a poem", answer) == UNSURE
+
+
+def test_refusal_wording_inside_an_answer_is_not_a_refusal():
+    answer = "The function returns None when I can't find the key, so check for that first."
+    assert verdict("agent_creative", "What does it return?", answer) == UNSURE
+
+
+def test_long_answer_cut_off_mid_sentence_fails():
+    answer = "Here is the explanation. " * 10 + "The next step is to compute x = ("
+    assert verdict("agent_creative", "Explain", answer) == FAIL
+
+
+def test_unclosed_code_fence_and_think_block_fail():
+    assert verdict("agent_coding", "sort a list", "```python\nitems.sort()\n") == FAIL
+    assert verdict("agent_math", "2+2?", "<think>Adding the numbers") == FAIL
+
+
+def test_valid_python_passes():
+    assert verdict("agent_coding", "sort a list", "Use:\n```python\nitems.sort()\n```") == PASS
+
+
+def test_python_syntax_error_fails_with_guidance():
+    result, guidance = check_answer("agent_coding", "sort a list", "```python\ndef f(:\n    pass\n```")
+    assert result == FAIL
+    assert "syntax error" in guidance
+
+
+def test_untagged_and_other_language_blocks_are_not_syntax_checked():
+    assert verdict("agent_coding", "list files", "```\nls -la | grep foo\n```") == UNSURE
+    assert verdict("agent_coding", "log it", "```javascript\nconsole.log('hi');\n```") == UNSURE
+
+
+def test_math_answer_with_a_final_number_passes():
+    assert verdict("agent_math", "Calculate 12 * 7", "Multiplying gives 12 * 7 = 84") == PASS
+
+
+def test_numbers_in_no_numbers_out_fails():
+    result, guidance = check_answer("agent_math", "Calculate 12 * 7", "Multiply the two numbers together.")
+    assert result == FAIL
+    assert "numeric" in guidance
+
+
+def test_proofs_and_symbolic_answers_stay_unsure():
+    assert verdict("agent_math", "Prove that there are infinitely many primes", "Assume finitely many...") == UNSURE
+    assert verdict("agent_math", "Find the derivative of sin x", "The derivative is cos x.") == UNSURE
+
+
+def test_other_agents_are_unsure_by_default():
+    assert verdict("agent_creative", "Write a haiku", "Quiet pond, a frog") == UNSURE
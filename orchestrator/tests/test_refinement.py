@@ -0,0 +1,115 @@
+# test_refinement.py
+
+import asyncio
+import time
+
+from refinement import RefinementController, build_refinement_prompt
+
+
+def run(controller, answer="first", answer_latency=0.0, budget=10.0):
+    async def collect():
+        deadline = time.monotonic() + budget
+        return [event async for event in controller.run("question", "agent_math", answer, answer_latency, deadline)]
+
+    return asyncio.run(collect())
+
+
+def evaluator(verdicts, delay=0.0):
+    """
+    An evaluator returning the given satisfactory flags in turn.
+    """
+    calls = []
+
+    async def evaluate(user_input, agent_type, answer):
+        calls.append(answer)
+        await asyncio.sleep(delay)
+        return verdicts[len(calls) - 1], f"guidance {len(calls)}"
+
+    evaluate.calls = calls
+    return evaluate
+
+
+def refiner(answers, delay=0.0):
+    prompts = []
+
+    async def refine(agent_type, prompt):
+        prompts.append(prompt)
+        await asyncio.sleep(delay)
+        return answers[len(prompts) - 1]
+
+    refine.prompts = prompts
+    return refine
+
+
+def kinds(events):
+    return [event["event"] for event in events]
+
+
+def test_satisfactory_first_answer_is_kept():
+    refine = refiner([])
+    events = run(RefinementController(evaluator([True]), refine, max_rounds=2))
+
+    assert kinds(events) == ["evaluation"]
+    assert events[0]["satisfactory"]
+    assert refine.prompts == []
+
+
+def test_refines_until_satisfactory():
+    evaluate = evaluator([False, True])
+    refine = refiner(["second"])
+    events = run(RefinementController(evaluate, refine, max_rounds=2))
+
+    assert kinds(events) == ["evaluation", "refining", "refined", "evaluation"]
+    assert events[2]["answer"] == "second"
+    assert evaluate.calls == ["first", "second"]
+    assert refine.prompts == [build_refinement_prompt("question", "first", "guidance 1")]
+
+
+def test_stops_at_max_rounds_without_a_final_evaluation():
+    evaluate = evaluator([False, False, False])
+    events = run(RefinementController(evaluate, refiner(["second", "third"]), max_rounds=2))
+
+    assert kinds(events) == ["evaluation", "refining", "refined", "evaluation", "refining", "refined", "stopped"]
+    assert events[-1]["reason"] == "max_rounds"
+    assert len(evaluate.calls) == 2
+
+
+def test_zero_rounds_only_evaluates():
+    events = run(RefinementController(evaluator([False]), refiner([]), max_rounds=0))
+
+    assert kinds(events) == ["evaluation", "stopped"]
+    assert events[-1]["reason"] == "max_rounds"
+
+
+def test_round_predicted_past_the_deadline_is_skipped():
+    refine = refiner(["second"])
+    events = run(RefinementController(evaluator([False]), refine, max_rounds=2), answer_latency=5.0, budget=1.0)
+
+    assert kinds(events) == ["evaluation", "stopped"]
+    assert events[-1]["reason"] == "budget"
+    assert refine.prompts == []
+
+
+def test_slow_evaluation_is_cut_off_at_the_deadline():
+    started = time.monotonic()
+    events = run(RefinementController(evaluator([True], delay=5.0), refiner([]), max_rounds=2), budget=0.2)
+
+    assert kinds(events) == ["stopped"]
+    assert events[0]["reason"] == "budget"
+    assert time.monotonic() - started < 2.0
+
+
+def test_slow_agent_call_is_cut_off_at_the_deadline():
+    started = time.monotonic()
+    events = run(RefinementController(evaluator([False]), refiner(["second"], delay=5.0), max_rounds=2), budget=0.3)
+
+    assert kinds(events) == ["evaluation", "refining", "stopped"]
+    assert events[-1]["reason"] == "budget"
+    assert time.monotonic() - started < 2.0
+
+
+def test_error_answer_keeps_the_previous_answer():
+    events = run(RefinementController(evaluator([False]), refiner(["Error processing the request."]), max_rounds=2))
+
+    assert kinds(events) == ["evaluation", "refining", "stopped"]
+    assert events[-1]["reason"] == "agent_error"
@@ -0,0 +1,38 @@
+# test_request_log.py
+
+import json
+
+from feedback import FeedbackStore
+from request_log import RequestLog
+
+
+def read_inputs(path) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["input"] for line in f]
+
+
+def test_request_log_rotates_and_keeps_its_backups(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    log = RequestLog(str(path), max_bytes=1, backups=2)
+
+    for name in ("first", "second", "third"):
+        log.record({"input": name})
+        log.flush()
+
+    # Every flush passes max_bytes; the oldest file beyond the backups is dropped
+    assert not path.exists()
+    assert read_inputs(f"{path}.1") == ["third"]
+    assert read_inputs(f"{path}.2") == ["second"]
+    assert not (tmp_path / "requests.jsonl.3").exists()
+
+
+def test_feedback_store_rotation_keeps_recent_records_readable(tmp_path):
+    path = tmp_path / "latency.jsonl"
+    store = FeedbackStore(str(path), max_bytes=200, backups=1)
+
+    for index in range(5):
+        store.append("latency", None, index=index)
+
+    # Three records pass 200 bytes and go to .1; the last two are in the current file
+    assert (tmp_path / "latency.jsonl.1").exists()
+    assert [record["index"] for record in store.read_recent(0.0)] == [0, 1, 2, 3, 4]
@@ -0,0 +1,63 @@
+# test_residency.py
+
+import asyncio
+import threading
+import time
+
+from residency import ModelResidencyManager
+
+
+class RecordingManager(ModelResidencyManager):
+    """
+    A manager whose preloads only record the thread they ran on and take `delay` seconds.
+    """
+
+    def __init__(self, delay: float):
+        super().__init__("http://localhost:11434", pinned=["llama3.2"])
+        self.delay = delay
+        self.preloaded = []
+
+    def preload(self, model: str) -> None:
+        self.record_demand(model)
+        self.preloaded.append((model, threading.current_thread().name))
+        time.sleep(self.delay)
+
+
+def test_concurrent_preloads_of_one_model_are_combined():
+    manager = RecordingManager(delay=0.2)
+
+    async def preload_many():
+        await asyncio.gather(*(manager.preload_async("deepseek-r1") for _ in range(5)))
+
+    asyncio.run(preload_many())
+
+    assert [model for model, _ in manager.preloaded] == ["deepseek-r1"]
+    # The skipped preloads still count as demand
+    assert manager.predicted_demand("deepseek-r1") > 4.9
+
+
+def test_preloads_run_on_the_residency_thread_one_at_a_time():
+    manager = RecordingManager(delay=0.1)
+
+    async def preload_two():
+        started = time.monotonic()
+        await asyncio.gather(manager.preload_async("deepseek-r1"), manager.preload_async("codellama"))
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(preload_two())
+
+    assert sorted(model for model, _ in manager.preloaded) == ["codellama", "deepseek-r1"]
+    assert all(thread.startswith("residency") for _, thread in manager.preloaded)
+    assert elapsed >= 0.2
+
+
+def test_a_model_can_be_preloaded_again_once_done():
+    manager = RecordingManager(delay=0.0)
+
+    async def preload_twice():
+        await manager.preload_async("vicuna")
+        await manager.preload_async("vicuna")
+
+    asyncio.run(preload_twice())
+
+    assert len(manager.preloaded) == 2
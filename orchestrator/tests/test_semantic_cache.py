@@ -0,0 +1,105 @@
+# test_semantic_cache.py
+
+import numpy as np
+
+from semantic_cache import SemanticCache, SemanticIndex, embed_text, match_key
+
+
+def make_cache(tmp_path, capacity=10, eviction="lru", threshold=0.9):
+    return SemanticCache(str(tmp_path), capacity=capacity, threshold=threshold, eviction=eviction)
+
+
+def test_match_key_ignores_stopwords_order_and_spelling():
+    assert match_key("What's the derivative of x^2?") == match_key("derivative of x squared please")
+    assert match_key("sort a list in python") == match_key("in python, sort a list")
+
+
+def test_match_key_keeps_numbers_and_their_order():
+    assert match_key("compound interest over 10 years") != match_key("compound interest over 20 years")
+    assert match_key("10 - 3") != match_key("3 - 10")
+
+
+def test_embeddings_are_unit_vectors():
+    vector = embed_text("Reverse a linked list in Python")
+    assert np.isclose(np.linalg.norm(vector), 1.0)
+    assert np.allclose(vector, embed_text("Reverse a linked list in Python"))
+
+
+def test_paraphrase_hits_and_other_numbers_miss(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("agent_math", "What is the derivative of x^2?", "2x")
+
+    assert cache.get("agent_math", "what's the derivative of x squared") == "2x"
+    assert cache.get("agent_math", "What is the derivative of x^3?") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    cache.close()
+
+
+def test_agents_have_separate_indexes(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("agent_math", "Write a poem about primes", "math answer")
+
+    assert cache.get("agent_creative", "Write a poem about primes") is None
+    cache.close()
+
+
+def test_same_question_replaces_its_entry(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("agent_coding", "Reverse a list in Python", "old")
+    cache.put("agent_coding", "reverse a list in python", "new")
+
+    assert cache.get("agent_coding", "Reverse a list in Python") == "new"
+    assert cache.stats()["entries"]["agent_coding"] == 1
+    cache.close()
+
+
+def test_lru_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, capacity=2, eviction="lru")
+    cache.put("agent_math", "integral of sin x", "-cos x")
+    cache.put("agent_math", "integral of cos x", "sin x")
+    # Touch the first entry, so the second is the least recently used
+    assert cache.get("agent_math", "integral of sin x") == "-cos x"
+    cache.put("agent_math", "integral of exp x", "exp x")
+
+    assert cache.get("agent_math", "integral of sin x") == "-cos x"
+    assert cache.get("agent_math", "integral of cos x") is None
+    assert cache.get("agent_math", "integral of exp x") == "exp x"
+    assert cache.stats()["evictions"]["agent_math"] == 1
+    cache.close()
+
+
+def test_lfu_evicts_least_frequently_used(tmp_path):
+    cache = make_cache(tmp_path, capacity=2, eviction="lfu")
+    cache.put("agent_math", "integral of sin x", "-cos x")
+    cache.put("agent_math", "integral of cos x", "sin x")
+    for _ in range(3):
+        cache.get("agent_math", "integral of sin x")
+    cache.get("agent_math", "integral of cos x")
+    cache.put("agent_math", "integral of exp x", "exp x")
+
+    assert cache.get("agent_math", "integral of sin x") == "-cos x"
+    assert cache.get("agent_math", "integral of cos x") is None
+    cache.close()
+
+
+def test_entries_survive_a_restart(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("agent_coding", "Reverse a list in Python", "items[::-1]")
+    cache.close()
+
+    reopened = make_cache(tmp_path)
+    assert reopened.get("agent_coding", "reverse a list in python") == "items[::-1]"
+    reopened.close()
+
+
+def test_index_of_another_shape_starts_empty(tmp_path):
+    path = str(tmp_path / "agent_math.vectors")
+    index = SemanticIndex(path, capacity=4)
+    index.add(embed_text("integral of sin x"), match_key("integral of sin x"), "-cos x", 0.9)
+    index.close()
+
+    resized = SemanticIndex(path, capacity=8)
+    assert resized.size == 0
+    assert resized.search(embed_text("integral of sin x"), match_key("integral of sin x"), 0.9) is None
+    resized.close()
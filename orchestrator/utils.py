@@ -1,4 +1,5 @@
 # utils.py
+import os
 import re
 
 def sanitize_text(text: str) -> str:
@@ -19,6 +20,51 @@ def sanitize_text(text: str) -> str:
     for disclaimer in disclaimers:
         text = re.sub(disclaimer + r".*?\.", "", text, flags=re.IGNORECASE)
 
-    # Normalize whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
+    # Normalize whitespace, keeping line breaks and indentation so code blocks survive
+    text = re.sub(r'(?<=\S)[ \t]+', ' ', text)
+    text = re.sub(r'[ \t]+\n', '\n', text)
+    text = re.sub(r'\n{3,}', '\n\n', text).strip()
     return text
+
+
+# Fallback strings returned in place of an answer by the orchestrator's LLM helper,
+# query_agent and the agents themselves. They must never be cached or scored as answers.
+ERROR_RESPONSE_PATTERNS = [
+    r"^Error in LLM processing",
+    r"^Processing took too long",
+    r"^Unexpected error in LLM processing",
+    r"^Sorry, I couldn't get a response from",
+    r"^Error querying agent",
+    r"^Error: agent responded with status",
+    r"^Could not connect to",
+    r"^An (unexpected )?error occurred",
+    r"^Error processing the",
+    r"^The (mathematical computation|coding analysis|creative process) took too long",
+    r"^Sorry, the .+ is busy right now",
+]
+
+
+def is_error_response(text: str) -> bool:
+    """
+    Return True if the text is empty or one of the known error fallbacks.
+    """
+    text = text.strip()
+    if not text:
+        return True
+    return any(re.match(pattern, text) for pattern in ERROR_RESPONSE_PATTERNS)
+
+
+def rotate_file(path: str, backups: int) -> None:
+    """
+    Rotate a log file: path.1 becomes path.2 and so on, path becomes path.1, and the
+    oldest beyond `backups` is dropped. With no backups the file is simply removed.
+    Callers serialize this with their own writes.
+    """
+    for index in range(backups - 1, 0, -1):
+        older = f"{path}.{index}"
+        if os.path.exists(older):
+            os.replace(older, f"{path}.{index + 1}")
+    if backups > 0:
+        os.replace(path, f"{path}.1")
+    else:
+        os.remove(path)
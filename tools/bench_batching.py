@@ -0,0 +1,222 @@
+# bench_batching.py
+#
+# Measure what holding orchestrator prompts back to send them in groups would buy.
+#
+# Usage:
+#   python tools/bench_batching.py --model llama3.2 --rate 4 --windows 0 10 20 50
+#   python tools/bench_batching.py --simulate 4 --rate 8 --requests 400
+#
+# Prompts arrive as a Poisson process at --rate per second. Each window is run
+# against the same arrival schedule: window 0 sends every prompt as soon as it
+# arrives, as the orchestrator does; a window of N ms holds each prompt for up to N
+# ms, or until --max-batch-size are waiting, and sends the group at once, as the
+# removed MicroBatcher did. Set OLLAMA_NUM_PARALLEL on the server to
+# --max-batch-size for a fair comparison.
+#
+# With --simulate SLOTS, no Ollama is needed: the prompts go to a stand-in server in
+# this process that decodes the requests in flight together, one token for each of
+# up to SLOTS requests per step, like Ollama's parallel slots. A step takes --step-ms,
+# plus --step-growth of that for each request beyond the first in the step.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "orchestrator"))
+
+from ai_clients import OllamaClient  # noqa: E402
+
+PREFIX = (
+    "You are the AI-Chat Manager.\n\n"
+    "Write a short, friendly message explaining that you're forwarding the user's request to the specialist.\n\n"
+)
+
+QUESTIONS = [
+    "The user said: \"What is 17 * 23?\"",
+    "The user said: \"Write a haiku about autumn\"",
+    "The user said: \"Reverse a linked list in Python\"",
+    "The user said: \"Who wrote Hamlet?\"",
+    "The user said: \"Solve 2x + 5 = 17\"",
+]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class WindowedSender:
+    """
+    Hold prompts for up to `window` seconds, or until `max_batch_size` are waiting,
+    then send them all at once.
+    """
+
+    def __init__(self, client: OllamaClient, window: float, max_batch_size: int):
+        self.client = client
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def generate(self, prompt: str, prefix: str) -> str:
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending.append((prompt, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush(prefix)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush, prefix)
+        return await future
+
+    def _flush(self, prefix: str) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        for prompt, future in batch:
+            asyncio.ensure_future(self._send(prompt, prefix, future))
+
+    async def _send(self, prompt: str, prefix: str, future: asyncio.Future) -> None:
+        future.set_result(await self.client.generate(prompt, prefix))
+
+
+class SimulatedOllama:
+    """
+    Decode the requests in flight together, `slots` at a time, one token per step.
+    """
+
+    def __init__(self, model: str, slots: int, step: float, step_growth: float, tokens: int):
+        self.model = model
+        self.slots = slots
+        self.step = step
+        self.step_growth = step_growth
+        self.tokens = tokens
+        self._waiting: List[asyncio.Queue] = []
+        self._active: List[asyncio.Queue] = []
+        self._decoder: Optional[asyncio.Task] = None
+
+    async def decode(self) -> None:
+        while self._waiting or self._active:
+            # Waiting requests join at the next step, whenever they arrived
+            while self._waiting and len(self._active) < self.slots:
+                self._active.append(self._waiting.pop(0))
+            await asyncio.sleep(self.step * (1 + self.step_growth * (len(self._active) - 1)))
+            for queue in list(self._active):
+                queue.put_nowait("tok ")
+                queue.emitted = getattr(queue, "emitted", 0) + 1
+                if queue.emitted >= self.tokens:
+                    queue.put_nowait(None)
+                    self._active.remove(queue)
+        self._decoder = None
+
+    async def generate(self, request: web.Request) -> web.StreamResponse:
+        await request.read()
+        queue: asyncio.Queue = asyncio.Queue()
+        self._waiting.append(queue)
+        if self._decoder is None:
+            self._decoder = asyncio.ensure_future(self.decode())
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        while True:
+            token = await queue.get()
+            if token is None:
+                break
+            await response.write((json.dumps({"model": self.model, "response": token, "done": False}) + "\n").encode())
+        await response.write((json.dumps({"model": self.model, "response": "", "done": True}) + "\n").encode())
+        return response
+
+    async def ps(self, request: web.Request) -> web.Response:
+        return web.json_response({"models": [{"name": self.model}]})
+
+    async def start(self) -> Tuple[web.AppRunner, str]:
+        app = web.Application()
+        app.router.add_post("/api/generate", self.generate)
+        app.router.add_get("/api/ps", self.ps)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return runner, f"http://127.0.0.1:{port}"
+
+
+async def run(client: OllamaClient, window_ms: float, max_batch_size: int, arrivals) -> dict:
+    if window_ms > 0:
+        generate = WindowedSender(client, window_ms / 1000, max_batch_size).generate
+    else:
+        generate = client.generate
+
+    latencies = []
+
+    async def one(delay: float, prompt: str):
+        await asyncio.sleep(delay)
+        started = time.monotonic()
+        await generate(prompt, PREFIX)
+        latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*(one(delay, random.choice(QUESTIONS)) for delay in arrivals))
+    elapsed = time.monotonic() - started
+    return {
+        "throughput": len(latencies) / elapsed,
+        "p50": statistics.median(latencies),
+        "p99": percentile(latencies, 0.99),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark batching windows for orchestrator prompts")
+    parser.add_argument("--url", default="http://localhost:11434")
+    parser.add_argument("--model", default="llama3.2")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--rate", type=float, default=4.0, help="Mean arrivals per second")
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 10, 20, 50], help="Batch windows in ms")
+    parser.add_argument("--max-batch-size", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--simulate", type=int, metavar="SLOTS", help="Use a stand-in server with SLOTS parallel slots")
+    parser.add_argument("--step-ms", type=float, default=20.0, help="Simulated time per decode step")
+    parser.add_argument("--step-growth", type=float, default=0.15, help="Simulated step slowdown per extra request")
+    parser.add_argument("--tokens", type=int, default=30, help="Simulated tokens per answer")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    arrivals, now = [], 0.0
+    for _ in range(args.requests):
+        now += random.expovariate(args.rate)
+        arrivals.append(now)
+
+    runner = None
+    url = args.url
+    if args.simulate:
+        runner, url = await SimulatedOllama(
+            args.model, args.simulate, args.step_ms / 1000, args.step_growth, args.tokens
+        ).start()
+        print(f"Simulated server: {args.simulate} slots, {args.step_ms:g} ms/step (+{args.step_growth:.0%} per extra request), {args.tokens} tokens")
+
+    client = OllamaClient(args.model, url, timeout=args.timeout, keep_alive="30m")
+    # Load the model first so the first run doesn't pay for the cold start
+    await client.generate("OK", PREFIX)
+
+    print(f"{'window ms':>10}{'req/s':>10}{'p50 s':>10}{'p99 s':>10}")
+    try:
+        for window in args.windows:
+            random.seed(args.seed)
+            r = await run(client, window, args.max_batch_size, arrivals)
+            print(f"{window:>10.0f}{r['throughput']:>10.2f}{r['p50']:>10.3f}{r['p99']:>10.3f}")
+    finally:
+        await client.close()
+        if runner is not None:
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+# bench_prefix_cache.py
+#
+# Measure how much prompt evaluation Ollama saves when prompts share a fixed prefix.
+#
+# Usage:
+#   python tools/bench_prefix_cache.py --model deepseek-r1 --prefix-file system_prompt.txt
+#
+# Every request sends the same prefix followed by a different question. In the
+# "shared" run the prefix is sent verbatim, so a warm model only evaluates the
+# question tokens. In the "busted" run a random nonce is placed in front of the
+# prefix, which defeats prefix reuse and forces the whole prompt to be evaluated.
+
+import argparse
+import statistics
+import time
+import uuid
+
+import requests
+
+DEFAULT_PREFIX = (
+    "You are a mathematics expert. Provide clear, step-by-step solutions to mathematical problems. "
+    "Show your work and explain each step of your reasoning. If there are multiple approaches, "
+    "mention the most efficient one. Make sure your final answer is clearly stated.\n\n"
+)
+
+DEFAULT_QUESTIONS = [
+    "What is 17 * 23?",
+    "Solve 2x + 5 = 17.",
+    "What is the derivative of x^3?",
+    "How many primes are below 30?",
+    "What is 15% of 240?",
+]
+
+
+def generate(url: str, model: str, prompt: str, keep_alive: str, timeout: float) -> dict:
+    response = requests.post(
+        f"{url}/api/generate",
+        json={
+            "model": model,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": keep_alive,
+            # Only prompt evaluation is being measured, so keep generation short
+            "options": {"num_predict": 1},
+        },
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def run(args, prefix: str, questions, bust_cache: bool) -> dict:
+    tokens, seconds, wall = [], [], []
+    for _ in range(args.rounds):
+        for question in questions:
+            nonce = f"[{uuid.uuid4().hex}]\n" if bust_cache else ""
+            started = time.monotonic()
+            result = generate(args.url, args.model, nonce + prefix + question, args.keep_alive, args.timeout)
+            wall.append(time.monotonic() - started)
+            tokens.append(result.get("prompt_eval_count", 0))
+            seconds.append(result.get("prompt_eval_duration", 0) / 1e9)
+    return {
+        "requests": len(wall),
+        "prompt_eval_tokens": statistics.mean(tokens),
+        "prompt_eval_seconds": statistics.mean(seconds),
+        "wall_seconds": statistics.mean(wall),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Ollama prompt-prefix KV reuse")
+    parser.add_argument("--url", default="http://localhost:11434")
+    parser.add_argument("--model", default="llama3.2")
+    parser.add_argument("--prefix-file", help="File holding the fixed prefix (default: the math system prompt)")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--keep-alive", default="30m")
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    prefix = DEFAULT_PREFIX
+    if args.prefix_file:
+        with open(args.prefix_file) as f:
+            prefix = f.read()
+
+    # Load the model first so neither run pays for the cold start
+    generate(args.url, args.model, prefix, args.keep_alive, args.timeout)
+
+    results = {
+        "shared": run(args, prefix, DEFAULT_QUESTIONS, bust_cache=False),
+        "busted": run(args, prefix, DEFAULT_QUESTIONS, bust_cache=True),
+    }
+
+    print(f"{'run':<8}{'requests':>10}{'eval tokens':>14}{'eval s':>10}{'wall s':>10}")
+    for name, r in results.items():
+        print(
+            f"{name:<8}{r['requests']:>10}{r['prompt_eval_tokens']:>14.1f}"
+            f"{r['prompt_eval_seconds']:>10.3f}{r['wall_seconds']:>10.3f}"
+        )
+
+    shared, busted = results["shared"], results["busted"]
+    print(
+        f"\nPrefix reuse saved {busted['prompt_eval_tokens'] - shared['prompt_eval_tokens']:.1f} tokens and "
+        f"{(busted['prompt_eval_seconds'] - shared['prompt_eval_seconds']) * 1000:.1f} ms of prompt evaluation per request"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# bench_scheduling.py
+#
+# Compare FIFO and shortest-job-first admission in an orchestrator bulkhead.
+#
+# Usage:
+#   python tools/bench_scheduling.py --jobs 400 --time-scale 0.002
+#
+# Simulates one pool (e.g. deepseek-r1 with a mix of quick arithmetic and long
+# proofs) with Poisson arrivals. Each job's real duration grows with its prompt and
+# output length plus noise; SJF orders the queue by the LatencyPredictor's estimate,
+# which is trained on a separate warm-up sample and so is imperfect, as in production.
+# Times are simulated seconds; --time-scale compresses them so a run takes seconds.
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "orchestrator"))
+
+from bulkhead import Bulkhead  # noqa: E402
+from latency_predictor import LatencyPredictor  # noqa: E402
+
+
+def make_job(rng: random.Random, long_fraction: float):
+    """
+    Return (prompt_chars, output_chars, seconds) for one job.
+    """
+    if rng.random() < long_fraction:
+        prompt_chars, output_chars = rng.randint(200, 800), rng.randint(4000, 9000)
+    else:
+        prompt_chars, output_chars = rng.randint(20, 200), rng.randint(100, 600)
+    seconds = 0.5 + prompt_chars * 0.002 + output_chars * 0.008
+    return prompt_chars, output_chars, seconds * rng.uniform(0.7, 1.3)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(policy: str, aging_rate: float, jobs, arrivals, predictor, args) -> dict:
+    scale = args.time_scale
+    pool = Bulkhead(
+        f"bench-{policy}", limit=args.limit, max_queue=len(jobs), max_wait=float("inf"),
+        # Costs are in simulated seconds but the pool ages tickets in real seconds
+        service_time=10.0, policy=policy, aging_rate=aging_rate / scale,
+    )
+    latencies, long_latencies = [], []
+
+    async def one(arrival, job):
+        prompt_chars, output_chars, seconds = job
+        await asyncio.sleep(arrival * scale)
+        started = time.monotonic()
+        cost = predictor.predict("bench", prompt_chars)
+        async with pool.ticket(cost=cost):
+            await asyncio.sleep(seconds * scale)
+        latency = (time.monotonic() - started) / scale
+        latencies.append(latency)
+        if seconds > 20:
+            long_latencies.append(latency)
+
+    await asyncio.gather(*(one(arrival, job) for arrival, job in zip(arrivals, jobs)))
+    return {
+        "p50": statistics.median(latencies),
+        "p99": percentile(latencies, 0.99),
+        "long_max": max(long_latencies) if long_latencies else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark FIFO vs SJF admission in a bulkhead")
+    parser.add_argument("--jobs", type=int, default=400)
+    parser.add_argument("--limit", type=int, default=2, help="Concurrent slots in the pool")
+    parser.add_argument("--utilization", type=float, default=0.85)
+    parser.add_argument("--long-fraction", type=float, default=0.2)
+    parser.add_argument("--aging-rate", type=float, default=1.0)
+    parser.add_argument("--time-scale", type=float, default=0.002, help="Real seconds per simulated second")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    predictor = LatencyPredictor()
+    for _ in range(200):
+        prompt_chars, output_chars, seconds = make_job(rng, args.long_fraction)
+        predictor.observe("bench", prompt_chars, output_chars, seconds)
+
+    jobs = [make_job(rng, args.long_fraction) for _ in range(args.jobs)]
+    mean_service = statistics.mean(seconds for _, _, seconds in jobs)
+    rate = args.utilization * args.limit / mean_service
+    arrivals, now = [], 0.0
+    for _ in jobs:
+        now += rng.expovariate(rate)
+        arrivals.append(now)
+
+    print(f"{len(jobs)} jobs, mean service {mean_service:.1f}s, {rate:.3f} arrivals/s, {args.limit} slots")
+    print(f"{'policy':<22}{'p50 s':>10}{'p99 s':>10}{'worst long s':>14}")
+    for name, policy, aging in (
+        ("fifo", "fifo", 0.0),
+        ("sjf (no aging)", "sjf", 0.0),
+        (f"sjf (aging {args.aging_rate:g})", "sjf", args.aging_rate),
+    ):
+        r = await run(policy, aging, jobs, arrivals, predictor, args)
+        print(f"{name:<22}{r['p50']:>10.1f}{r['p99']:>10.1f}{r['long_max']:>14.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
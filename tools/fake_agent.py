@@ -0,0 +1,265 @@
+# fake_agent.py
+#
+# Stand-in for a specialist agent that injects latency and faults, to test the
+# orchestrator's retries, timeouts and fallbacks without models.
+#
+# Usage:
+#   python tools/fake_agent.py tools/scenarios/brownout.json --port 8001
+#
+# It speaks the agents' protocol: POST /process with {"question", "preempt_id"}
+# returns {"answer", "done", "first_token_seconds"}, POST /pause with {"id"} pauses a
+# running answer, GET /ready and GET / as usual, plus GET /stats with the count of each
+# outcome. Start one on an agent's port in place of the real agent.
+#
+# A scenario is a JSON file:
+#
+#   {
+#     "seed": 1,
+#     "answers": ["The answer is 42."],
+#     "latency": {"distribution": "lognormal", "median": 2.0, "sigma": 0.6},
+#     "faults": [
+#       {"kind": "error", "rate": 0.05, "status": 500},
+#       {"kind": "reset", "rate": 0.02},
+#       {"kind": "stall", "rate": 0.01},
+#       {"kind": "partial", "rate": 0.02},
+#       {"kind": "error_answer", "rate": 0.03}
+#     ],
+#     "phases": [
+#       {"from": 60, "latency": {"distribution": "constant", "seconds": 20}},
+#       {"from": 90}
+#     ]
+#   }
+#
+# Latency distributions (seconds): constant {seconds}, uniform {low, high}, normal
+# {mean, stddev}, exponential {mean}, lognormal {median, sigma}, and samples {values}
+# to draw from measured latencies. Faults, each drawn with its rate per request:
+#   error         respond with `status` (default 500) after `after` seconds (default 0)
+#   reset         close the connection after `after` seconds without responding
+#   stall         accept the request and never answer (or only after `seconds`)
+#   partial       send part of the response body, then close the connection
+#   error_answer  a normal 200 carrying the agents' error fallback text
+#   truncated     a normal 200 whose answer is cut to `fraction` of its length
+# Phases start `from` seconds after the server starts and replace the scenario's
+# "latency" and/or "faults" while they last; a phase with neither restores both.
+#
+# With a "preempt_id" in the request (preemptible agents), a /pause for that id makes
+# the answer come back as paused (done=False); the rest of its time is spent on the
+# request that resumes it with the same id.
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger("fake_agent")
+
+DEFAULT_ANSWERS = ["This is a canned answer from the fake agent."]
+ERROR_ANSWER = "Error processing the request. Please try again."
+FAULT_KINDS = ["error", "reset", "stall", "partial", "error_answer", "truncated"]
+# Paused answers waiting to be resumed, at most
+MAX_PAUSED = 10000
+# Seconds between checks for a pause request while answering
+PAUSE_POLL_INTERVAL = 0.1
+
+
+def sample_latency(spec: Dict, rng: random.Random) -> float:
+    kind = spec.get("distribution", "constant")
+    if kind == "constant":
+        seconds = spec.get("seconds", 0.0)
+    elif kind == "uniform":
+        seconds = rng.uniform(spec["low"], spec["high"])
+    elif kind == "normal":
+        seconds = rng.gauss(spec["mean"], spec["stddev"])
+    elif kind == "exponential":
+        seconds = rng.expovariate(1 / spec["mean"])
+    elif kind == "lognormal":
+        seconds = rng.lognormvariate(math.log(spec["median"]), spec["sigma"])
+    elif kind == "samples":
+        seconds = rng.choice(spec["values"])
+    else:
+        raise ValueError(f"Unknown latency distribution: {kind}")
+    return max(seconds, 0.0)
+
+
+def validate(scenario: Dict) -> None:
+    """
+    Fail at startup rather than on the first request.
+    """
+    rng = random.Random(0)
+    for part in [scenario] + scenario.get("phases", []):
+        if "latency" in part:
+            sample_latency(part["latency"], rng)
+        for fault in part.get("faults", []):
+            if fault.get("kind") not in FAULT_KINDS:
+                raise ValueError(f"Unknown fault kind: {fault.get('kind')}")
+        if sum(fault.get("rate", 0.0) for fault in part.get("faults", [])) > 1:
+            raise ValueError("Fault rates add up to more than 1")
+
+
+class FakeAgent:
+    def __init__(self, scenario: Dict, name: str):
+        validate(scenario)
+        self.scenario = scenario
+        self.name = name
+        self.rng = random.Random(scenario.get("seed"))
+        self.answers: List[str] = scenario.get("answers") or DEFAULT_ANSWERS
+        self.started = time.monotonic()
+        self.stats: Counter = Counter()
+        # preempt_id -> (seconds still owed, answer) of a paused answer
+        self._paused: Dict[str, Tuple[float, str]] = {}
+        # preempt_id -> whether a pause was requested, for answers in progress
+        self._running: Dict[str, bool] = {}
+
+    def current(self) -> Dict:
+        """
+        The latency and faults in force now, after applying the latest phase.
+        """
+        elapsed = time.monotonic() - self.started
+        settings = {"latency": self.scenario.get("latency", {}), "faults": self.scenario.get("faults", [])}
+        for phase in sorted(self.scenario.get("phases", []), key=lambda p: p["from"]):
+            if phase["from"] > elapsed:
+                break
+            settings = {
+                "latency": phase.get("latency", self.scenario.get("latency", {})),
+                "faults": phase.get("faults", self.scenario.get("faults", [])),
+            }
+        return settings
+
+    def pick_fault(self, faults: List[Dict]) -> Optional[Dict]:
+        roll = self.rng.random()
+        for fault in faults:
+            roll -= fault.get("rate", 0.0)
+            if roll < 0:
+                return fault
+        return None
+
+    async def process(self, request: web.Request) -> web.StreamResponse:
+        started = time.monotonic()
+        try:
+            data = await request.json()
+        except json.JSONDecodeError:
+            return web.json_response({"detail": "Invalid JSON"}, status=400)
+        question = str(data.get("question", "")).strip()
+        if not question:
+            return web.json_response({"detail": "Missing 'question' in request body"}, status=400)
+
+        settings = self.current()
+        fault = self.pick_fault(settings["faults"])
+        kind = fault["kind"] if fault else "ok"
+        self.stats[kind] += 1
+
+        if kind == "error":
+            await asyncio.sleep(fault.get("after", 0.0))
+            return web.json_response({"detail": "Injected failure"}, status=fault.get("status", 500))
+        if kind == "reset":
+            await asyncio.sleep(fault.get("after", 0.0))
+            request.transport.close()
+            raise asyncio.CancelledError()
+        if kind == "stall":
+            # Hold the socket open until the caller gives up (or `seconds` pass)
+            deadline = time.monotonic() + fault.get("seconds", 24 * 3600)
+            while time.monotonic() < deadline and request.transport is not None and not request.transport.is_closing():
+                await asyncio.sleep(0.5)
+            if request.transport is not None:
+                request.transport.close()
+            raise asyncio.CancelledError()
+
+        # Carry on with a paused answer, or draw a new one
+        preempt_id = data.get("preempt_id")
+        paused = self._paused.pop(preempt_id, None) if preempt_id else None
+        if paused is not None:
+            seconds, answer = paused
+        else:
+            seconds, answer = sample_latency(settings["latency"], self.rng), self.rng.choice(self.answers)
+        if preempt_id:
+            remaining = await self._answer_until_paused(preempt_id, seconds)
+            if remaining > 0:
+                self._paused[preempt_id] = (remaining, answer)
+                self.stats["paused"] += 1
+                generated = int(len(answer) * (1 - remaining / seconds))
+                return web.json_response({"done": False, "generated_chars": generated, "first_token_seconds": 0.0})
+        else:
+            await asyncio.sleep(seconds)
+
+        if kind == "error_answer":
+            answer = ERROR_ANSWER
+        elif kind == "truncated":
+            answer = answer[:int(len(answer) * fault.get("fraction", 0.5))]
+        body = json.dumps({"answer": answer, "done": True, "first_token_seconds": 0.0}).encode("utf-8")
+
+        if kind == "partial":
+            response = web.StreamResponse(headers={"Content-Type": "application/json"})
+            response.content_length = len(body)
+            await response.prepare(request)
+            await response.write(body[:len(body) // 2])
+            request.transport.close()
+            raise asyncio.CancelledError()
+
+        logger.info(f"[{self.name}] Answered in {time.monotonic() - started:.2f}s ({kind})")
+        return web.Response(body=body, content_type="application/json")
+
+    async def _answer_until_paused(self, preempt_id: str, seconds: float) -> float:
+        """
+        Spend `seconds` answering unless paused first. Returns the seconds left over.
+        """
+        self._running[preempt_id] = False
+        deadline = time.monotonic() + seconds
+        try:
+            while time.monotonic() < deadline:
+                if self._running[preempt_id] and len(self._paused) < MAX_PAUSED:
+                    return deadline - time.monotonic()
+                await asyncio.sleep(min(PAUSE_POLL_INTERVAL, deadline - time.monotonic()))
+            return 0.0
+        finally:
+            del self._running[preempt_id]
+
+    async def pause(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        found = data.get("id") in self._running
+        if found:
+            self._running[data["id"]] = True
+        return web.json_response({"pausing": found})
+
+    async def ready(self, request: web.Request) -> web.Response:
+        return web.json_response({"ready": True, "model": self.name})
+
+    async def index(self, request: web.Request) -> web.Response:
+        return web.json_response({"service": f"Fake agent ({self.name})", "status": "running"})
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "uptime": round(time.monotonic() - self.started, 1),
+            "outcomes": dict(self.stats),
+            "paused": len(self._paused),
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake agent that injects latency and faults")
+    parser.add_argument("scenario", help="Scenario JSON file")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--name", default="fake", help="Reported as the agent's model")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    with open(args.scenario, encoding="utf-8") as f:
+        agent = FakeAgent(json.load(f), args.name)
+
+    app = web.Application()
+    app.router.add_post("/process", agent.process)
+    app.router.add_post("/pause", agent.pause)
+    app.router.add_get("/ready", agent.ready)
+    app.router.add_get("/stats", agent.get_stats)
+    app.router.add_get("/", agent.index)
+    web.run_app(app, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
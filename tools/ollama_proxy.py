@@ -0,0 +1,367 @@
+# ollama_proxy.py
+#
+# Record Ollama traffic once, then serve it back without any models installed.
+#
+# Usage:
+#   OLLAMA_HOST=127.0.0.1:11435 ollama serve
+#   python tools/ollama_proxy.py record --upstream http://localhost:11435 --recording recordings/run.jsonl
+#   ... drive the orchestrator and agents, e.g. with tools/replay_requests.py ...
+#
+#   python tools/ollama_proxy.py replay --recording recordings/run.jsonl --speed 1
+#
+# The proxy listens where the services expect Ollama (port 11434), so neither the
+# orchestrator nor the agents need changing; while recording, Ollama itself is moved
+# to another port. Each exchange is one JSON line: the request, the response status
+# and every streamed chunk with its offset from the request in milliseconds. Token
+# chunks are stored as their text only, so a recording is little larger than the
+# generated text; the final chunk with Ollama's statistics is kept whole.
+#
+# Replay answers a request with the recording of the same request (model, prompt or
+# messages, options; keep_alive is ignored), sending its chunks at the recorded
+# offsets divided by --speed, or at once with --instant. Repeats of one request are
+# served their recordings in order, wrapping around.
+#
+# Resuming a paused generation (raw /api/generate with the partial output appended to
+# the prompt) cannot match exactly: where the pause lands depends on timing, so the
+# partial differs between runs. Such a request is matched to the recorded raw
+# generation whose prompt it extends and whose output starts with the partial, and is
+# served the rest of that output, following on into the recordings of its own resumes
+# when the recorded generation was paused too.
+#
+# A request that matches nothing gets an Ollama-style error (--on-miss error, the
+# default) or, with --on-miss similar, the next recording for the same endpoint and
+# model. Misses are counted either way, and the proxy exits with status 1 if there
+# were any, so a replay that drifted from its recording does not pass silently.
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger("ollama_proxy")
+
+# Endpoints whose streamed chunks carry generated text, and where they keep it
+TEXT_FIELD = {
+    "/api/generate": lambda chunk: chunk.get("response"),
+    "/api/chat": lambda chunk: (chunk.get("message") or {}).get("content"),
+}
+
+
+def request_key(method: str, path: str, body) -> str:
+    """
+    Identify a request by what determines its output.
+    """
+    if isinstance(body, dict):
+        body = {k: v for k, v in body.items() if k != "keep_alive"}
+    canonical = json.dumps([method, path, body], sort_keys=True)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def pack_chunk(path: str, offset_ms: int, line: bytes) -> list:
+    """
+    Compact form of one response line: [ms, text] for a token chunk, [ms, {...}]
+    for any other JSON object, [ms, None, raw] for anything else.
+    """
+    text = line.decode("utf-8", "replace").rstrip("\n")
+    try:
+        chunk = json.loads(text)
+    except json.JSONDecodeError:
+        return [offset_ms, None, text]
+    field = TEXT_FIELD.get(path)
+    if field is not None and isinstance(chunk, dict) and not chunk.get("done") and isinstance(field(chunk), str):
+        return [offset_ms, field(chunk)]
+    return [offset_ms, chunk]
+
+
+def generated_text(exchange: dict) -> str:
+    """
+    The text of a recorded exchange's token chunks.
+    """
+    return "".join(packed[1] for packed in exchange["chunks"] if len(packed) == 2 and isinstance(packed[1], str))
+
+
+def finished(exchange: dict) -> bool:
+    """
+    True if the recorded stream reached Ollama's final chunk rather than being closed early.
+    """
+    return any(len(packed) == 2 and isinstance(packed[1], dict) and packed[1].get("done") for packed in exchange["chunks"])
+
+
+def resume_key(body: dict) -> str:
+    """
+    Identify a raw generation by everything but its prompt.
+    """
+    return request_key("POST", "/api/generate", {k: v for k, v in body.items() if k != "prompt"})
+
+
+def is_raw_generation(path: str, body) -> bool:
+    return path == "/api/generate" and isinstance(body, dict) and bool(body.get("raw")) and isinstance(body.get("prompt"), str)
+
+
+def unpack_chunk(path: str, model: str, packed: list) -> bytes:
+    if len(packed) == 3:
+        return (packed[2] + "\n").encode("utf-8")
+    data = packed[1]
+    if isinstance(data, str):
+        created_at = datetime.now(timezone.utc).isoformat()
+        if path == "/api/chat":
+            data = {"model": model, "created_at": created_at, "message": {"role": "assistant", "content": data}, "done": False}
+        else:
+            data = {"model": model, "created_at": created_at, "response": data, "done": False}
+    return (json.dumps(data) + "\n").encode("utf-8")
+
+
+async def read_body(request: web.Request):
+    raw = await request.read()
+    if not raw:
+        return raw, None
+    try:
+        return raw, json.loads(raw)
+    except json.JSONDecodeError:
+        return raw, raw.decode("utf-8", "replace")
+
+
+class Recorder:
+    """
+    Forward every request to Ollama, streaming the response through, and append the
+    exchange to the recording.
+    """
+
+    def __init__(self, upstream: str, path: str):
+        self.upstream = upstream.rstrip("/")
+        self.file = open(path, "a", encoding="utf-8")
+        self.session = None
+        self.recorded = 0
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None))
+        raw, body = await read_body(request)
+        started = time.monotonic()
+        chunks = []
+        async with self.session.request(
+            request.method,
+            f"{self.upstream}{request.path_qs}",
+            data=raw,
+            headers={"Content-Type": request.headers.get("Content-Type", "application/json")},
+        ) as upstream:
+            response = web.StreamResponse(status=upstream.status)
+            content_type = upstream.headers.get("Content-Type", "application/json")
+            response.headers["Content-Type"] = content_type
+            await response.prepare(request)
+            try:
+                async for line in upstream.content:
+                    offset_ms = int((time.monotonic() - started) * 1000)
+                    await response.write(line)
+                    if line.strip():
+                        chunks.append(pack_chunk(request.path, offset_ms, line))
+                await response.write_eof()
+            except ConnectionResetError:
+                # The service closed the stream early (e.g. a preempted slice); leaving
+                # the block stops the generation, as it would have without the proxy
+                logger.info(f"Client closed {request.path} after {len(chunks)} chunks")
+
+        self.file.write(json.dumps({
+            "key": request_key(request.method, request.path, body),
+            "method": request.method,
+            "path": request.path,
+            "model": body.get("model") if isinstance(body, dict) else None,
+            "request": body,
+            "status": upstream.status,
+            "content_type": content_type,
+            "chunks": chunks,
+        }) + "\n")
+        self.file.flush()
+        self.recorded += 1
+        logger.info(f"Recorded {request.method} {request.path} ({len(chunks)} chunks, {time.monotonic() - started:.2f}s)")
+        return response
+
+    async def close(self, app) -> None:
+        if self.session is not None:
+            await self.session.close()
+        self.file.close()
+        logger.info(f"Recorded {self.recorded} exchanges")
+
+
+class Replayer:
+    """
+    Answer requests from a recording, reproducing its chunk timing.
+    """
+
+    def __init__(self, path: str, speed: float, instant: bool, on_miss: str):
+        self.speed = speed
+        self.instant = instant
+        self.on_miss = on_miss
+        self.by_key = defaultdict(list)
+        self.by_endpoint = defaultdict(list)
+        # resume_key -> {prompt: [exchange, ...]} of raw generations, to resume from
+        self.raw_generations = defaultdict(lambda: defaultdict(list))
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    exchange = json.loads(line)
+                    self.by_key[exchange["key"]].append(exchange)
+                    self.by_endpoint[(exchange["method"], exchange["path"], exchange["model"])].append(exchange)
+                    if exchange["status"] == 200 and is_raw_generation(exchange["path"], exchange["request"]):
+                        request = exchange["request"]
+                        self.raw_generations[resume_key(request)][request["prompt"]].append(exchange)
+        self._next = defaultdict(int)
+        self.served = 0
+        self.resumed = 0
+        self.misses = 0
+        logger.info(f"Loaded {sum(len(v) for v in self.by_key.values())} exchanges from {path}")
+
+    def _take(self, pool_id, pool):
+        exchange = pool[self._next[pool_id] % len(pool)]
+        self._next[pool_id] += 1
+        return exchange
+
+    def find(self, method: str, path: str, body):
+        """
+        The recorded exchange to answer a request with and the chunks to send, or None.
+        """
+        key = request_key(method, path, body)
+        if key in self.by_key:
+            exchange = self._take(key, self.by_key[key])
+            return exchange, exchange["chunks"]
+        if is_raw_generation(path, body):
+            resumed = self.find_resumed(body)
+            if resumed is not None:
+                self.resumed += 1
+                return resumed
+        self.misses += 1
+        model = body.get("model") if isinstance(body, dict) else None
+        logger.warning(f"No recording for {method} {path} ({model}); {self.misses} misses so far")
+        endpoint = (method, path, model)
+        if self.on_miss == "similar" and endpoint in self.by_endpoint:
+            exchange = self._take(endpoint, self.by_endpoint[endpoint])
+            return exchange, exchange["chunks"]
+        return None
+
+    def find_resumed(self, body: dict):
+        """
+        Match a resumed generation to the recording it continues.
+
+        The request's prompt is a recorded raw prompt followed by partial output; the
+        recording with the longest such prompt whose output starts with that partial
+        is served from the end of the partial, then the recordings of its own resumes
+        in turn until one finishes.
+        """
+        generations = self.raw_generations.get(resume_key(body))
+        if not generations:
+            return None
+        prompt = body["prompt"]
+        for recorded_prompt in sorted(generations, key=len, reverse=True):
+            if not prompt.startswith(recorded_prompt):
+                continue
+            partial = prompt[len(recorded_prompt):]
+            for exchange in generations[recorded_prompt]:
+                text = generated_text(exchange)
+                if text.startswith(partial) and (len(text) > len(partial) or finished(exchange)):
+                    return exchange, self.continuation(generations, recorded_prompt, exchange, len(partial))
+        return None
+
+    def continuation(self, generations, prompt: str, exchange: dict, skip: int) -> list:
+        """
+        The chunks of `exchange` after its first `skip` characters of output, followed
+        by those of the recordings that resumed it, with offsets from the resume.
+        """
+        chunks = []
+        shift = 0
+        while True:
+            base = None
+            for packed in exchange["chunks"]:
+                if len(packed) == 2 and isinstance(packed[1], str) and skip > 0:
+                    base = packed[0]
+                    if len(packed[1]) > skip:
+                        # The pause fell inside this chunk: send the rest of it
+                        chunks.append([shift, packed[1][skip:]])
+                    skip = max(skip - len(packed[1]), 0)
+                    continue
+                chunks.append([packed[0] - (base or 0) + shift] + packed[1:])
+            if finished(exchange):
+                return chunks
+            prompt += generated_text(exchange)
+            following = generations.get(prompt)
+            if not following:
+                return chunks
+            shift = chunks[-1][0] if chunks else shift
+            exchange = following[0]
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        _, body = await read_body(request)
+        found = self.find(request.method, request.path, body)
+        if found is None:
+            return web.json_response({"error": f"no recording for {request.method} {request.path}"}, status=404)
+        exchange, chunks = found
+
+        started = time.monotonic()
+        response = web.StreamResponse(status=exchange["status"])
+        response.headers["Content-Type"] = exchange["content_type"]
+        await response.prepare(request)
+        model = (body.get("model") if isinstance(body, dict) else None) or exchange["model"]
+        try:
+            for packed in chunks:
+                if not self.instant:
+                    delay = packed[0] / 1000 / self.speed - (time.monotonic() - started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                await response.write(unpack_chunk(exchange["path"], model, packed))
+            await response.write_eof()
+        except ConnectionResetError:
+            # Paused by the service, as when recording
+            logger.info(f"Client closed {request.path} during replay")
+        self.served += 1
+        return response
+
+    async def close(self, app) -> None:
+        logger.info(
+            f"Served {self.served} exchanges ({self.resumed} resumed generations), "
+            f"{self.misses} requests had no recording"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record Ollama traffic, or replay it without Ollama")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--recording", default="recordings/ollama.jsonl", help="Recording file to append to or serve")
+    parser.add_argument("--port", type=int, default=11434, help="Where the services expect Ollama")
+    parser.add_argument("--upstream", default="http://localhost:11435", help="Real Ollama server, when recording")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay N times faster than recorded")
+    parser.add_argument("--instant", action="store_true", help="Replay without any delays")
+    parser.add_argument(
+        "--on-miss", choices=["error", "similar"], default="error",
+        help="Answer unrecorded requests with an error, or with another recording for the same model",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+
+    if args.mode == "record":
+        os.makedirs(os.path.dirname(args.recording) or ".", exist_ok=True)
+        handler = Recorder(args.upstream, args.recording)
+    else:
+        handler = Replayer(args.recording, args.speed, args.instant, args.on_miss)
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_route("*", "/{path:.*}", handler.handle)
+    app.on_cleanup.append(handler.close)
+    web.run_app(app, port=args.port, print=None)
+
+    if args.mode == "replay" and handler.misses:
+        sys.exit(f"{handler.misses} requests had no recording")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# replay_requests.py
+#
+# Re-drive a recorded request log against a running orchestrator and compare builds.
+#
+# Usage:
+#   python tools/replay_requests.py logs/requests.jsonl --speed 1 --output before.json
+#   python tools/replay_requests.py logs/requests.jsonl --speed 1 --baseline before.json
+#   python tools/replay_requests.py logs/requests.jsonl.1 logs/requests.jsonl --max-speed --concurrency 16
+#
+# Every logged request is sent to GET /query with its original input. With --speed N
+# requests keep their recorded inter-arrival times divided by N (1 = as recorded);
+# with --max-speed they are sent back to back, --concurrency at a time, to measure
+# peak throughput. Latency is the time until the response stream ends, as in the log.
+# --output saves the summary; --baseline prints the change against a saved one, so a
+# run on each build gives a like-for-like comparison.
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+import aiohttp
+
+# Sent by the orchestrator when the pipeline itself failed
+PIPELINE_ERROR = "I'm sorry, there was an error processing your request."
+
+REPORTED = ["requests", "errors", "duration", "throughput", "p50", "p90", "p99"]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def load_log(paths, sources, limit):
+    entries = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if entry.get("input") and (not sources or entry.get("source") in sources):
+                    entries.append(entry)
+    entries.sort(key=lambda entry: entry["ts"])
+    return entries[:limit] if limit else entries
+
+
+async def send(session, url, headers, entry, timeout) -> dict:
+    started = time.monotonic()
+    result = {"route": entry.get("route"), "error": False}
+    try:
+        async with session.get(
+            f"{url}/query",
+            params={"user_input": entry["input"]},
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as response:
+            result["status"] = response.status
+            result["error"] = response.status != 200
+            async for line in response.content:
+                if PIPELINE_ERROR in line.decode("utf-8", "replace"):
+                    result["error"] = True
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        result.update(status=None, error=True, detail=str(e))
+    result["latency"] = time.monotonic() - started
+    return result
+
+
+async def replay(entries, args) -> list:
+    headers = {"X-API-Key": args.api_key} if args.api_key else {}
+    # Unlimited in timed replay, so a slow build shows up as latency, not as a slower arrival rate
+    limit = asyncio.Semaphore(args.concurrency if args.max_speed else len(entries) or 1)
+    first_ts = entries[0]["ts"] if entries else 0.0
+    started = time.monotonic()
+
+    async with aiohttp.ClientSession() as session:
+
+        async def one(entry):
+            if not args.max_speed:
+                delay = (entry["ts"] - first_ts) / args.speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            async with limit:
+                return await send(session, args.url, headers, entry, args.timeout)
+
+        return await asyncio.gather(*(one(entry) for entry in entries))
+
+
+def summarize(entries, results, duration) -> dict:
+    latencies = [r["latency"] for r in results if not r["error"]] or [0.0]
+    summary = {
+        "requests": len(results),
+        "errors": sum(r["error"] for r in results),
+        "duration": duration,
+        "throughput": len(results) / duration if duration > 0 else 0.0,
+        "p50": statistics.median(latencies),
+        "p90": percentile(latencies, 0.90),
+        "p99": percentile(latencies, 0.99),
+        "routes": {},
+    }
+    for route in sorted({r["route"] for r in results if r["route"]}):
+        route_latencies = [r["latency"] for r in results if r["route"] == route and not r["error"]]
+        if route_latencies:
+            summary["routes"][route] = {
+                "requests": len(route_latencies),
+                "p50": statistics.median(route_latencies),
+                "p99": percentile(route_latencies, 0.99),
+            }
+    recorded = [entry["latency"] for entry in entries if "latency" in entry and not entry.get("error")]
+    if recorded:
+        summary["recorded"] = {"p50": statistics.median(recorded), "p99": percentile(recorded, 0.99)}
+    return summary
+
+
+def report(summary, baseline=None):
+    if baseline is None:
+        for key in REPORTED:
+            print(f"{key:>12}{summary[key]:>12.3f}")
+    else:
+        print(f"{'':>12}{'baseline':>12}{'this run':>12}{'change':>10}")
+        for key in REPORTED:
+            old, new = baseline[key], summary[key]
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "-"
+            print(f"{key:>12}{old:>12.3f}{new:>12.3f}{change:>10}")
+
+    print(f"\n{'route':>16}{'requests':>10}{'p50 s':>10}{'p99 s':>10}")
+    for route, r in summary["routes"].items():
+        print(f"{route:>16}{r['requests']:>10}{r['p50']:>10.3f}{r['p99']:>10.3f}")
+    if "recorded" in summary:
+        recorded = summary["recorded"]
+        print(f"\nAs recorded: p50 {recorded['p50']:.3f} s, p99 {recorded['p99']:.3f} s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Replay a request log against the orchestrator")
+    parser.add_argument("logs", nargs="+", help="Request log files, e.g. logs/requests.jsonl and its rotations")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay N times faster than recorded")
+    parser.add_argument("--max-speed", action="store_true", help="Ignore recorded timing and send back to back")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight with --max-speed")
+    parser.add_argument("--sources", nargs="+", help="Only replay these sources (query, job, batch, sdk)")
+    parser.add_argument("--limit", type=int, default=0, help="Replay only the first N requests")
+    parser.add_argument("--api-key", help="Sent as X-API-Key; listed in API_KEYS, it gives the replay its own rate limit and share")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", help="Write the summary to this JSON file")
+    parser.add_argument("--baseline", help="Summary JSON from another build to compare against")
+    args = parser.parse_args()
+
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+    entries = load_log(args.logs, args.sources, args.limit)
+    if not entries:
+        sys.exit("No requests to replay")
+
+    mode = "max speed" if args.max_speed else f"{args.speed:g}x"
+    print(f"Replaying {len(entries)} requests at {mode} against {args.url}")
+    started = time.monotonic()
+    results = await replay(entries, args)
+    summary = summarize(entries, results, time.monotonic() - started)
+    summary["mode"] = mode
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("mode") != mode:
+            print(f"Warning: baseline was replayed at {baseline.get('mode')}")
+    report(summary, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())